@@ -1,18 +1,19 @@
 import json
+import asyncio
 import base64
 import hashlib
 import re
 import uuid
-import httpx
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from app.schemas.requests import VideoAnalysisRequest, TTSRequest
-from app.services import file_service, llm_service, interview_service
+from app.services import eval_scheduler, frame_dedup, llm_service, interview_service, plan_composer, plan_events, resume_store, session_context, tts_service, usage_tracker
+from app.services.plan_model import InterviewPlan
+from app.core import metrics
 from app.core.config import settings
 from app.core.logger import logger
 from app.interview_templates import INTERVIEW_TEMPLATES
-from app.question_bank import get_question_pack
-from app.question_bank.service import render_pack_for_prompt
+from app.question_bank import load_question_pack
 
 router = APIRouter()
 
@@ -21,135 +22,132 @@ async def analyze_resume(
     file: UploadFile = File(None),
     manual_text: str = Form(None),
     scenario: str = Form("tech_backend"),
-    language: str = Form("zh-CN")
+    language: str = Form("zh-CN"),
+    resume_id: str = Form(None)  # Returned by an earlier call; replaces file/manual_text
 ):
     if not settings.API_KEY: raise HTTPException(status_code=500, detail="API Key not configured")
 
     session_id = uuid.uuid4().hex
-
-    resume_text = ""
-    if file:
-        resume_text = file_service.parse_resume(file)
-    elif manual_text:
-        resume_text = manual_text.strip()
+    usage_tracker.bind(session_id=session_id, scenario=scenario)
+
+    # Parsed resumes are cached by content hash; the returned resume_id stands in for the file later
+    requested_id = resume_id
+    resume_id, resume_text = await resume_store.resolve(file, manual_text, resume_id)
+    if requested_id and not resume_id and not resume_text:
+        # Unknown or expired resume_id: the client re-sends the file or text, as for upload-resume and chat
+        raise HTTPException(status_code=409, detail={"code": "resume_missing", "turn": None})
     
     if not resume_text:
         resume_text = "No specific background context provided. Please proceed with a standard interview based on the Role and Scenario."
     
     template = INTERVIEW_TEMPLATES.get(scenario, INTERVIEW_TEMPLATES["tech_backend"])
     pack_id = template.get("question_pack_id") or scenario
-    question_bank_json = None
-    question_bank_version = None
-    try:
-        pack = get_question_pack(pack_id)
-        question_bank_json = render_pack_for_prompt(pack, max_questions=200)
-        question_bank_version = pack.version
-    except Exception as e:
-        logger.warning(f"Question pack unavailable for {pack_id}: {str(e)}")
-
-    system_prompt = f"""{template['system_prompt']}
-
-    Current Task: Analyze the candidate's resume/context and generate a structured INTERVIEW PLAN.
-    
-    **MANDATORY CONSTRAINTS**:
-    1. **Language**: The entire plan (titles, questions, summary) MUST be in {language}.
-    2. **Role & Scenario**: You are acting strictly as {template['role']} in a {template['name']} setting.
-       - Use the provided QUESTION BANK as the source of truth for interview questions.
-       - You MUST vary the selection/order across sessions using the RANDOM_SEED below.
-    3. **Structure**: 
-       - Break down the interview into 3-5 logical phases (e.g., Intro, Specific Tech 1, Specific Tech 2, System Design, Soft Skills).
-       - Ensure questions are deep, specific, and challenging (not generic).
-    4. **Question Sourcing**:
-       - Each plan item MUST be sourced from the QUESTION BANK below.
-       - You MAY lightly tailor the wording for the candidate, but MUST keep the original meaning.
-       - Every item MUST include `bank_id` referencing the original question id from the bank.
-    
-    RANDOM_SEED: {session_id}
-    
-    QUESTION BANK (JSON):
-    {question_bank_json if question_bank_json else '{"pack_id": null, "version": null, "questions": []}'}
-    
-    Return ONLY a valid JSON object (no markdown, no extra text) with the following structure:
-    {{
-        "summary": "Brief professional summary of the candidate (in {language})",
-        "meta": {{
-            "scenario": "{scenario}",
-            "session_id": "{session_id}",
-            "question_pack_id": "{pack_id}",
-            "question_pack_version": "{question_bank_version if question_bank_version else ''}"
-        }},
-        "sections": [
-            {{
-                "title": "Section Title (e.g. Work Experience, Java Core, etc.)",
-                "items": [
-                    {{ "id": "1", "bank_id": "be.001", "content": "Specific topic or question to cover", "status": "pending" }},
-                    {{ "id": "2", "bank_id": "be.002", "content": "Another topic or question", "status": "pending" }}
-                ]
-            }}
-        ],
-        "initial_greeting": "Opening greeting and first question"
-    }}
-    
-    Assign unique incrementing IDs to items (1, 2, 3...). Ensure the plan is substantial and specific.
-    """
-
-    user_prompt = f"""
-    [Candidate Resume START]
-    {resume_text}
-    [Candidate Resume END]
-
-    Interview Language: {language}
-    Scenario: {template['name']}
-    Random Seed: {session_id}
-
-    Generate the Interview Plan JSON now in the specified language.
-    """
 
     try:
-        reply_text = await llm_service.generate_thought_response([
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ])
-
-        code_block = re.search(r'```json\s*(.*?)\s*```', reply_text, re.DOTALL)
-        if code_block:
-            json_str = code_block.group(1)
-        else:
-            json_match = re.search(r'\{.*\}', reply_text, re.DOTALL)
-            json_str = json_match.group(0) if json_match else ""
-
-        if json_str:
-            try:
-                plan_data = json.loads(json_str)
-            except json.JSONDecodeError as je:
-                logger.error(f"JSON Parse Error: {je} | Content: {json_str}")
-                json_str_clean = json_str.replace('\n', '')
-                try:
-                    plan_data = json.loads(json_str_clean)
-                except:
-                     plan_data = {"raw": reply_text, "summary": "Error parsing plan JSON", "sections": []}
-        else:
-             plan_data = {"raw": reply_text, "summary": "No JSON found in response", "sections": []}
-
-        if isinstance(plan_data, dict):
-            meta = plan_data.get("meta") if isinstance(plan_data.get("meta"), dict) else {}
-            meta.setdefault("scenario", scenario)
-            meta.setdefault("session_id", session_id)
-            meta.setdefault("question_pack_id", pack_id)
-            if question_bank_version:
-                meta.setdefault("question_pack_version", question_bank_version)
-            plan_data["meta"] = meta
+        # The plan is composed locally (seeded by session_id, a few ms); the LLM then adds summary +
+        # greeting, and translates the picked questions if the pack is not in the session's language.
+        # The two steps run one after the other: the translation needs the composed plan, and
+        # composing is too quick for overlapping it with the LLM call to gain anything
+        try:
+            pack = await load_question_pack(pack_id)
+            plan_data = await asyncio.to_thread(plan_composer.compose_plan, pack, resume_text, scenario, session_id)
+        except Exception as e:
+            logger.warning(f"Question pack unavailable for {pack_id}: {str(e)}")
+            plan_data = {"summary": "", "meta": {"scenario": scenario, "session_id": session_id, "question_pack_id": pack_id}, "sections": []}
+        personal = await plan_composer.personalize(resume_text, template, language, plan_data)
+        plan_data = plan_composer.finalize_plan(plan_data, personal, template, language)
+
+        # Keep plan and context server-side so later turns only need session_id + turn
+        if isinstance(plan_data, dict) and plan_data.get("sections"):
+            await interview_service.save_plan(_session_key(session_id, scenario), plan_data)
+        await session_context.create_context(session_id, scenario, language, resume_text)
+        # The opening line was written alongside the plan, so starting the interview needs no extra LLM call
+        opening = plan_data.get("initial_greeting")
+        if opening:
+            await session_context.append_messages(session_id, [{"role": "assistant", "content": opening}], advance_turn=False)
 
         return {
             "resume_text": resume_text,
+            "resume_id": resume_id,
             "interview_plan": plan_data,
+            "opening": opening,
             "scenario": scenario,
-            "session_id": session_id
+            "session_id": session_id,
+            "turn": 0
         }
     except Exception as e:
         logger.error(f"Error analyzing resume: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+_CODE_FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+def extract_json_object(text: str):
+    """First JSON object in a model reply, skipping code fences and any text around it."""
+    if not text:
+        return None
+    cleaned = _CODE_FENCE_RE.sub("", text).replace("```", "").strip()
+    start = None
+    depth = 0
+    in_string = False
+    escape = False
+    quote_char = ""
+    for i, ch in enumerate(cleaned):
+        if escape:
+            escape = False
+            continue
+        if ch == "\\":
+            if in_string:
+                escape = True
+            continue
+        if ch in ('"', "'"):
+            if in_string:
+                if ch == quote_char:
+                    in_string = False
+                    quote_char = ""
+            else:
+                in_string = True
+                quote_char = ch
+            continue
+        if in_string:
+            continue
+        if ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}":
+            if depth > 0:
+                depth -= 1
+                if depth == 0 and start is not None:
+                    candidate = cleaned[start : i + 1]
+                    try:
+                        return json.loads(candidate)
+                    except Exception:
+                        start = None
+                        continue
+    return None
+
+def to_int_0_100(value, default=0):
+    if value is None:
+        return default
+    try:
+        if isinstance(value, str):
+            v = value.replace("%", "").strip()
+            num = float(v)
+        else:
+            num = float(value)
+        if 0 < num <= 1:
+            num *= 100
+        elif 1 < num <= 10:
+            num *= 10
+        num = round(num)
+        if num < 0:
+            return 0
+        if num > 100:
+            return 100
+        return int(num)
+    except Exception:
+        return default
+
 @router.post("/api/analyze-video")
 async def analyze_video(req: VideoAnalysisRequest):
     if not settings.API_KEY: raise HTTPException(status_code=500, detail="API Key not configured")
@@ -192,106 +190,47 @@ Example (format must match, values are examples):
 {lang_instruction}
 """.strip()
 
-    def extract_json_object(text: str):
-        if not text:
-            return None
-        cleaned = re.sub(r"```(?:json)?", "", text, flags=re.IGNORECASE).replace("```", "").strip()
-        start = None
-        depth = 0
-        in_string = False
-        escape = False
-        quote_char = ""
-        for i, ch in enumerate(cleaned):
-            if escape:
-                escape = False
-                continue
-            if ch == "\\":
-                if in_string:
-                    escape = True
-                continue
-            if ch in ('"', "'"):
-                if in_string:
-                    if ch == quote_char:
-                        in_string = False
-                        quote_char = ""
-                else:
-                    in_string = True
-                    quote_char = ch
-                continue
-            if in_string:
-                continue
-            if ch == "{":
-                if depth == 0:
-                    start = i
-                depth += 1
-            elif ch == "}":
-                if depth > 0:
-                    depth -= 1
-                    if depth == 0 and start is not None:
-                        candidate = cleaned[start : i + 1]
-                        try:
-                            return json.loads(candidate)
-                        except Exception:
-                            start = None
-                            continue
-        return None
-
-    def to_int_0_100(value, default=0):
-        if value is None:
-            return default
-        try:
-            if isinstance(value, str):
-                v = value.replace("%", "").strip()
-                num = float(v)
-            else:
-                num = float(value)
-            if 0 < num <= 1:
-                num *= 100
-            elif 1 < num <= 10:
-                num *= 10
-            num = round(num)
-            if num < 0:
-                return 0
-            if num > 100:
-                return 100
-            return int(num)
-        except Exception:
-            return default
-
     content_list = [
         {"type": "text", "text": system_instruction}
     ]
 
-    for img_b64 in images:
-        if not img_b64 or len(img_b64) < 100:
-            continue
+    frames = [img_b64 for img_b64 in images if img_b64 and len(img_b64) >= 100]
+    if not frames:
+        raise HTTPException(status_code=422, detail="No valid images after filtering")
+
+    # Skip the vision call while the candidate's frames have not visibly changed
+    hashes = await asyncio.to_thread(lambda: [frame_dedup.fingerprint(f) for f in frames])
+    reused = await frame_dedup.reusable_result(req.session_id, hashes)
+    if reused is not None:
+        return reused
+
+    for img_b64 in frames:
         img_url = img_b64 if img_b64.startswith("data:") else f"data:image/jpeg;base64,{img_b64}"
         content_list.append({
             "type": "image_url",
             "image_url": {"url": img_url}
         })
 
-    if len(content_list) <= 1:
-        raise HTTPException(status_code=422, detail="No valid images after filtering")
-
     messages = [{"role": "user", "content": content_list}]
 
     try:
         content = await llm_service.call_vision_model(messages)
         analysis = extract_json_object(content)
-        if not isinstance(analysis, dict):
+        parsed = isinstance(analysis, dict)
+        if not parsed:
+            metrics.json_parse_failures.inc(site="vision")
             logger.warning(f"Vision model output not JSON. Raw: {content}")
             analysis = {}
 
-        metrics = analysis.get("metrics") if isinstance(analysis.get("metrics"), dict) else {}
+        scores = analysis.get("metrics") if isinstance(analysis.get("metrics"), dict) else {}
         alert = analysis.get("alert") if isinstance(analysis.get("alert"), dict) else {}
 
         normalized = {
             "metrics": {
-                "confidence": to_int_0_100(metrics.get("confidence"), 0),
-                "eye_contact": to_int_0_100(metrics.get("eye_contact"), 0),
-                "attire": to_int_0_100(metrics.get("attire"), 0),
-                "clarity": to_int_0_100(metrics.get("clarity"), 0),
+                "confidence": to_int_0_100(scores.get("confidence"), 0),
+                "eye_contact": to_int_0_100(scores.get("eye_contact"), 0),
+                "attire": to_int_0_100(scores.get("attire"), 0),
+                "clarity": to_int_0_100(scores.get("clarity"), 0),
             },
             "alert": {
                 "level": alert.get("level") if alert.get("level") in ("none", "warning", "critical") else "none",
@@ -299,6 +238,8 @@ Example (format must match, values are examples):
                 "message_en": alert.get("message_en") if alert.get("message_en") not in ("", None) else None,
             },
         }
+        # All-zero scores from an unreadable reply must not be reused for the next frames
+        await frame_dedup.remember(req.session_id, hashes, normalized, reusable=parsed)
         return normalized
     except BaseException as e:
         logger.error(f"Vision Analysis Error: {str(e)}")
@@ -318,15 +259,23 @@ async def upload_resume(
     manual_text: str = Form(None),
     scenario: str = Form("tech_backend"),
     language: str = Form("zh-CN"),
-    interview_plan: str = Form("{}")  # Receive plan from frontend
+    interview_plan: str = Form("{}"),  # Receive plan from frontend
+    session_id: str = Form(None),
+    resume_id: str = Form(None)  # From /api/analyze-resume; replaces file/manual_text
 ):
     if not settings.API_KEY: raise HTTPException(status_code=500, detail="API Key not configured")
 
-    resume_text = ""
-    if file:
-        resume_text = file_service.parse_resume(file)
-    elif manual_text:
-        resume_text = manual_text.strip()
+    usage_tracker.bind(session_id=session_id, scenario=scenario)
+    context = await session_context.get_context(session_id)
+
+    requested_id = resume_id
+    resume_id, resume_text = await resume_store.resolve(file, manual_text, resume_id)
+    if not resume_text and context:
+        resume_text = context["resume_text"]
+    elif requested_id and not resume_id and not resume_text:
+        # Only an expired resume_id with nothing else sent is a 409; an upload that failed to
+        # parse carries on like one sent without resume_id
+        raise HTTPException(status_code=409, detail={"code": "resume_missing", "turn": None})
 
     if not resume_text:
         resume_text = "No resume provided."
@@ -336,6 +285,8 @@ async def upload_resume(
         plan_data = json.loads(interview_plan) if interview_plan else {}
     except:
         plan_data = {}
+    if not plan_data.get("sections") and session_id:
+        plan_data = await interview_service.plan_store.aget(_session_key(session_id, scenario)) or plan_data
 
     # Extract first question from plan
     first_question = None
@@ -347,6 +298,20 @@ async def upload_resume(
         if first_question:
             break
 
+    # Plans from analyze-resume already carry the opening line; reuse it while its question is still first
+    opening = plan_data.get("initial_greeting")
+    if isinstance(opening, str) and opening.strip() and first_question and opening.strip().endswith(first_question.strip()):
+        if context and not context["history"]:
+            await session_context.append_messages(session_id, [{"role": "assistant", "content": opening}], advance_turn=False)
+        return {
+            "reply": opening,
+            "resume_text": resume_text,
+            "resume_id": resume_id,
+            "scenario": scenario,
+            "language": language,
+            "turn": 0 if context else None
+        }
+
     template = INTERVIEW_TEMPLATES.get(scenario, INTERVIEW_TEMPLATES["tech_backend"])
 
     system_prompt = f"""{template['system_prompt']}
@@ -377,20 +342,213 @@ Response format: "介绍语... [exact question from plan]"
         reply_text = await llm_service.generate_thought_response([
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Generate the opening with the first question. Candidate context: {resume_text[:300] if resume_text else 'None'}"}
-        ])
+        ], stage="opening")
 
         reply_text = re.sub(r'<think>.*?</think>', '', reply_text, flags=re.DOTALL).strip()
 
+        # The opening line starts the server-side history; the turn counter stays at 0
+        if context and not context["history"]:
+            await session_context.append_messages(session_id, [{"role": "assistant", "content": reply_text}], advance_turn=False)
+
         return {
             "reply": reply_text,
             "resume_text": resume_text,
+            "resume_id": resume_id,
             "scenario": scenario,
-            "language": language
+            "language": language,
+            "turn": 0 if context else None
         }
     except Exception as e:
         logger.error(f"Error generating opening: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Difficulty presets mapping
+DIFFICULTY_PRESETS = {
+    1: {"name": "极温柔", "style": "gentle, encouraging, patient, use simple words", "tone": "warm, supportive, comforting"},
+    2: {"name": "温柔", "style": "friendly, approachable, easygoing", "tone": "kind, soft, positive"},
+    3: {"name": "温和", "style": "polite, respectful, moderate pace", "tone": "balanced, courteous"},
+    4: {"name": "友好", "style": "professional but warm, clear instructions", "tone": "constructive, helpful"},
+    5: {"name": "中等", "style": "neutral, professional, standard interview style", "tone": "objective, balanced"},
+    6: {"name": "严格", "style": "formal, demanding, precise expectations", "tone": "serious, expectant"},
+    7: {"name": "较严厉", "style": "challenging, probing, critical thinking", "tone": "sharp, analytical"},
+    8: {"name": "严厉", "style": "tough, skeptical, deep-digging into answers", "tone": "stern, pressing"},
+    9: {"name": "极严厉", "style": "harsh, grueling, relentless questioning", "tone": "severe, uncompromising"},
+    10: {"name": "地狱", "style": "brutal, impossible standards, crushing pressure", "tone": "merciless, devastating"}
+}
+
+def _session_key(session_id, scenario, resume_text=""):
+    if session_id:
+        return hashlib.md5(f"{session_id}_{scenario}".encode()).hexdigest()
+    return hashlib.md5(f"{resume_text[:100]}_{scenario}".encode()).hexdigest()
+
+async def _prepare_chat_turn(file, transcript, history, resume_text, interview_plan, scenario, difficulty, session_id, turn=None, resume_id=None):
+    """Transcribe the answer, sync the cached plan and build the reply prompt for one chat turn.
+
+    With `turn` set (session-context mode) history and resume come from the server-side
+    context instead of the form, and a stale `turn` is rejected before any upstream work.
+    """
+    diff_preset = DIFFICULTY_PRESETS.get(max(1, min(10, difficulty)), DIFFICULTY_PRESETS[5])
+
+    context = await session_context.require_context(session_id, turn) if turn is not None else None
+    if context:
+        resume_text = context["resume_text"]
+    elif resume_id and not resume_text:
+        resume_text = await resume_store.get_text(resume_id)
+        if resume_text is None:
+            # The client recovers by re-sending the resume text itself
+            raise HTTPException(status_code=409, detail={"code": "resume_missing", "turn": None})
+
+    user_transcript = ""
+    
+    if transcript:
+         user_transcript = transcript
+         logger.info(f"🎤 User input (manual): {user_transcript}")
+    elif file:
+        audio_content = await file.read()
+        audio_b64 = base64.b64encode(audio_content).decode('utf-8')
+        mime_type = file.content_type or "audio/wav"
+        user_transcript = await llm_service.transcribe_audio(audio_b64, mime_type)
+        logger.info(f"🎤 用户说: {user_transcript}")
+    else:
+        raise HTTPException(status_code=400, detail="No audio file or transcript provided")
+
+    if context:
+        history_list = list(context["history"])
+    else:
+        try: history_list = json.loads(history)
+        except: history_list = []
+
+    try: plan_data = json.loads(interview_plan)
+    except: plan_data = {}
+
+    session_key = _session_key(session_id, scenario, resume_text)
+
+    cached_plan = await interview_service.plan_store.aget(session_key)
+    if cached_plan is not None:
+        logger.info(f"📥 使用缓存计划 ({session_key[:8]})...")
+        plan_data = cached_plan
+    elif plan_data and "sections" in plan_data:
+        logger.info(f"💧 从前端数据恢复计划缓存 ({session_key[:8]})...")
+
+    if plan_data and "sections" in plan_data:
+        def mark_asked(stored):
+            marked = InterviewPlan.from_dict(stored)
+            # Re-asking the same item must not bump plan_version (and wake every watcher)
+            if not marked.mark_asked() and cached_plan is not None:
+                return None
+            return marked.to_dict()
+        plan_data = await interview_service.update_plan(session_key, mark_asked, plan_data) or plan_data
+    plan = InterviewPlan.from_dict(plan_data)
+
+    plan_desc = plan.render_chat_status()
+
+    plan_context = f"\n{plan_desc}\n\nCandidate Summary: {plan_data.get('summary', '')}"
+
+    template = INTERVIEW_TEMPLATES.get(scenario, INTERVIEW_TEMPLATES["tech_backend"])
+
+    system_instruction = f"""{template['system_prompt']}
+
+    [CRITICAL INSTRUCTION - MANDATORY COMPLIANCE]
+
+    You are executing a PRE-DEFINED interview plan with DIFFICULTY LEVEL {difficulty}/10 ({diff_preset['name']}).
+
+    CURRENT DIFFICULTY SETTINGS:
+    - Interview Style: {diff_preset['style']}
+    - Tone: {diff_preset['tone']}
+
+    IMPORTANT: Adjust your questioning and follow-up style according to this difficulty level!
+    - Lower levels (1-3): Be gentle, give hints, encourage the candidate
+    - Higher levels (8-10): Be relentless, challenge every answer, expose weaknesses, demand perfection
+
+    CURRENT INTERVIEW PLAN STATUS:
+    {plan_context}
+
+    CANDIDATE SUMMARY: {plan_data.get('summary', '')}
+
+    ---
+
+    YOUR RESPONSE FORMAT (Strictly follow):
+    1. Brief evaluation of user's answer (1-2 sentences) - Match the difficulty tone
+    2. Then ask the NEXT unchecked question from the plan above
+
+    ---
+
+    MANDATORY RULES:
+    1. **ONLY ask questions that appear in the "CURRENT INTERVIEW PLAN STATUS" above**
+    2. Find the FIRST item with [ ] (unchecked) status
+    3. Copy that item's content EXACTLY as your next question
+    4. Do NOT add your own questions
+    5. Do NOT skip questions
+    6. Do NOT explore topics outside the plan
+    7. If user's answer is incomplete/vague, still move to next planned question (don't digress)
+
+    WORKFLOW:
+    - Review the plan status above
+    - Identify the FIRST [ ] unchecked item
+    - Use that EXACT item content as your question
+    - Do not ask anything else
+
+    If ALL items are [x] checked, say "面试已结束，感谢你的参与。" and stop.
+    """
+
+    user_message = {
+        "role": "user",
+        "content": f"[User's Spoken Answer Transcribed]:\n{user_transcript}"
+    }
+    messages = [{"role": "system", "content": system_instruction}]
+    messages.extend(history_list)
+    messages.append(user_message)
+
+    return {
+        "transcript": user_transcript,
+        "messages": messages,
+        "user_message": user_message,
+        "plan_data": plan_data,
+        "session_key": session_key,
+        "session_id": session_id if context else None,
+        "turn": turn if context else None,
+        "resume_text": resume_text,
+    }
+
+async def _commit_context_turn(turn_data, reply_text):
+    """Record the answer and reply in the server-side history; returns the client's next turn number."""
+    if not turn_data["session_id"]:
+        return None
+    return await session_context.append_messages(
+        turn_data["session_id"], [turn_data["user_message"], {"role": "assistant", "content": reply_text}],
+        expected_turn=turn_data["turn"],
+    )
+
+def _schedule_plan_evaluation(turn_data, reply_text, scenario, language, difficulty):
+    # Create a copy of messages and append the AI's reply so the evaluator sees the full context
+    # This ensures the evaluator knows if the AI decided to follow up or move on
+    eval_messages = list(turn_data["messages"])
+    eval_messages.append({"role": "assistant", "content": reply_text})
+
+    # Serialized per session; turns arriving during a run are coalesced into one follow-up run
+    eval_scheduler.submit(
+        turn_data["session_key"], eval_messages, turn_data["resume_text"], turn_data["plan_data"], scenario, language, settings.API_KEY, difficulty
+    )
+
+async def _turn_result(turn_data, reply_text, next_turn=None):
+    # Ensure current_plan is defined (using cache or fallback to request data)
+    current_plan = await interview_service.plan_store.aget(turn_data["session_key"], turn_data["plan_data"])
+
+    # Return session key for polling
+    return {
+        "reply": reply_text,
+        "transcript": turn_data["transcript"],
+        "plan_update": current_plan, # Return old plan, client will poll for new one
+        "session_key": turn_data["session_key"],
+        "plan_updated": False,
+        "interview_complete": current_plan.get("interview_complete", False),
+        "final_result": current_plan.get("final_result"),
+        "turn": next_turn
+    }
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.post("/api/chat")
 async def chat_audio(
     file: UploadFile = File(None),
@@ -401,225 +559,149 @@ async def chat_audio(
     scenario: str = Form("tech_backend"),
     language: str = Form("zh-CN"),
     difficulty: int = Form(5),
-    session_id: str = Form(None)
+    session_id: str = Form(None),
+    turn: int = Form(None),  # Session-context mode: history/resume/plan are kept server-side
+    resume_id: str = Form(None)  # Legacy mode: stands in for resume_text
 ):
     if not settings.API_KEY: raise HTTPException(status_code=500, detail="API Key not configured")
-
-    # Difficulty presets mapping
-    DIFFICULTY_PRESETS = {
-        1: {"name": "极温柔", "style": "gentle, encouraging, patient, use simple words", "tone": "warm, supportive, comforting"},
-        2: {"name": "温柔", "style": "friendly, approachable, easygoing", "tone": "kind, soft, positive"},
-        3: {"name": "温和", "style": "polite, respectful, moderate pace", "tone": "balanced, courteous"},
-        4: {"name": "友好", "style": "professional but warm, clear instructions", "tone": "constructive, helpful"},
-        5: {"name": "中等", "style": "neutral, professional, standard interview style", "tone": "objective, balanced"},
-        6: {"name": "严格", "style": "formal, demanding, precise expectations", "tone": "serious, expectant"},
-        7: {"name": "较严厉", "style": "challenging, probing, critical thinking", "tone": "sharp, analytical"},
-        8: {"name": "严厉", "style": "tough, skeptical, deep-digging into answers", "tone": "stern, pressing"},
-        9: {"name": "极严厉", "style": "harsh, grueling, relentless questioning", "tone": "severe, uncompromising"},
-        10: {"name": "地狱", "style": "brutal, impossible standards, crushing pressure", "tone": "merciless, devastating"}
-    }
-
-    diff_preset = DIFFICULTY_PRESETS.get(max(1, min(10, difficulty)), DIFFICULTY_PRESETS[5])
+    usage_tracker.bind(session_id=session_id, scenario=scenario)
 
     try:
-        user_transcript = ""
-        
-        if transcript:
-             user_transcript = transcript
-             logger.info(f"🎤 User input (manual): {user_transcript}")
-        elif file:
-            audio_content = await file.read()
-            audio_b64 = base64.b64encode(audio_content).decode('utf-8')
-            mime_type = file.content_type or "audio/wav"
-            user_transcript = await llm_service.transcribe_audio(audio_b64, mime_type)
-            logger.info(f"🎤 用户说: {user_transcript}")
-        else:
-            raise HTTPException(status_code=400, detail="No audio file or transcript provided")
+        turn_data = await _prepare_chat_turn(file, transcript, history, resume_text, interview_plan, scenario, difficulty, session_id, turn, resume_id)
 
-        try: history_list = json.loads(history)
-        except: history_list = []
-
-        try: plan_data = json.loads(interview_plan)
-        except: plan_data = {}
-        
-        if session_id:
-            session_key = hashlib.md5(f"{session_id}_{scenario}".encode()).hexdigest()
-        else:
-            session_key = hashlib.md5(f"{resume_text[:100]}_{scenario}".encode()).hexdigest()
-        
-        if session_key in interview_service.plan_cache:
-            logger.info(f"📥 使用缓存计划 ({session_key[:8]})...")
-            plan_data = interview_service.plan_cache[session_key]
-        elif plan_data and "sections" in plan_data:
-            logger.info(f"💧 从前端数据恢复计划缓存 ({session_key[:8]})...")
-            interview_service.plan_cache[session_key] = plan_data
-
-        asked_set = False
-        for sec in plan_data.get("sections", []):
-            for item in sec.get("items", []):
-                if item.get("status") != "done" and "asked" in item:
-                    item.pop("asked", None)
-        for sec in plan_data.get("sections", []):
-            if asked_set:
-                break
-            for item in sec.get("items", []):
-                if item.get("status") != "done":
-                    item["asked"] = True
-                    asked_set = True
-                    break
-        
-        plan_desc = "CURRENT INTERVIEW PLAN STATUS:\n"
-        for sec in plan_data.get("sections", []):
-            plan_desc += f"- {sec['title']}:\n"
-            for item in sec['items']:
-                status_icon = "[x]" if item.get("status") == "done" else "[ ]"
-                plan_desc += f"  {status_icon} (ID: {item['id']}) {item['content']}\n"
-                
-        plan_context = f"\n{plan_desc}\n\nCandidate Summary: {plan_data.get('summary', '')}"
-
-        template = INTERVIEW_TEMPLATES.get(scenario, INTERVIEW_TEMPLATES["tech_backend"])
-
-        system_instruction = f"""{template['system_prompt']}
-
-        [CRITICAL INSTRUCTION - MANDATORY COMPLIANCE]
-
-        You are executing a PRE-DEFINED interview plan with DIFFICULTY LEVEL {difficulty}/10 ({diff_preset['name']}).
-
-        CURRENT DIFFICULTY SETTINGS:
-        - Interview Style: {diff_preset['style']}
-        - Tone: {diff_preset['tone']}
-
-        IMPORTANT: Adjust your questioning and follow-up style according to this difficulty level!
-        - Lower levels (1-3): Be gentle, give hints, encourage the candidate
-        - Higher levels (8-10): Be relentless, challenge every answer, expose weaknesses, demand perfection
-
-        CURRENT INTERVIEW PLAN STATUS:
-        {plan_context}
-
-        CANDIDATE SUMMARY: {plan_data.get('summary', '')}
-
-        ---
-
-        YOUR RESPONSE FORMAT (Strictly follow):
-        1. Brief evaluation of user's answer (1-2 sentences) - Match the difficulty tone
-        2. Then ask the NEXT unchecked question from the plan above
-
-        ---
-
-        MANDATORY RULES:
-        1. **ONLY ask questions that appear in the "CURRENT INTERVIEW PLAN STATUS" above**
-        2. Find the FIRST item with [ ] (unchecked) status
-        3. Copy that item's content EXACTLY as your next question
-        4. Do NOT add your own questions
-        5. Do NOT skip questions
-        6. Do NOT explore topics outside the plan
-        7. If user's answer is incomplete/vague, still move to next planned question (don't digress)
-
-        WORKFLOW:
-        - Review the plan status above
-        - Identify the FIRST [ ] unchecked item
-        - Use that EXACT item content as your question
-        - Do not ask anything else
-
-        If ALL items are [x] checked, say "面试已结束，感谢你的参与。" and stop.
-        """
-
-        messages = [{"role": "system", "content": system_instruction}]
-        messages.extend(history_list)
-        messages.append({
-            "role": "user",
-            "content": f"[User's Spoken Answer Transcribed]:\n{user_transcript}"
-        })
-
-        import asyncio
         # Step 1: Generate main response (blocking)
-        reply_text = await llm_service.generate_thought_response(messages, model=settings.MODEL_TOOL)
+        reply_text = await llm_service.generate_thought_response(turn_data["messages"], model=settings.MODEL_TOOL, stage="reply")
 
         logger.info(f"📝 回复内容: {reply_text[:100]}...")
 
         # Step 2: Immediately return response to frontend
         # Step 3: Start background plan evaluation while user is listening to TTS
-        
-        # Create a copy of messages and append the AI's reply so the evaluator sees the full context
-        # This ensures the evaluator knows if the AI decided to follow up or move on
-        eval_messages = list(messages)
-        eval_messages.append({"role": "assistant", "content": reply_text})
-
-        asyncio.create_task(
-            interview_service.evaluate_plan_async(
-                eval_messages, resume_text, plan_data, scenario, language, settings.API_KEY, session_key, difficulty
-            )
-        )
-
-        # Ensure current_plan is defined (using cache or fallback to request data)
-        current_plan = interview_service.plan_cache.get(session_key, plan_data)
-
-        # Return session key for polling
-        return {
-            "reply": reply_text,
-            "transcript": user_transcript,
-            "plan_update": current_plan, # Return old plan, client will poll for new one
-            "session_key": session_key,
-            "plan_updated": False,
-            "interview_complete": current_plan.get("interview_complete", False),
-            "final_result": current_plan.get("final_result")
-        }
+        next_turn = await _commit_context_turn(turn_data, reply_text)
+        _schedule_plan_evaluation(turn_data, reply_text, scenario, language, difficulty)
 
+        return await _turn_result(turn_data, reply_text, next_turn)
+
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e) or repr(e) or "Unknown Error"
         logger.error(f"Chat Error: {error_msg}", exc_info=True)
         raise HTTPException(status_code=500, detail=error_msg)
 
+@router.post("/api/chat/stream")
+async def chat_audio_stream(
+    file: UploadFile = File(None),
+    transcript: str = Form(None),
+    history: str = Form("[]"),
+    resume_text: str = Form(""),
+    interview_plan: str = Form("{}"),
+    scenario: str = Form("tech_backend"),
+    language: str = Form("zh-CN"),
+    difficulty: int = Form(5),
+    session_id: str = Form(None),
+    turn: int = Form(None),  # Session-context mode: history/resume/plan are kept server-side
+    resume_id: str = Form(None)  # Legacy mode: stands in for resume_text
+):
+    """Same turn as /api/chat, but reply tokens are pushed as Server-Sent Events.
+
+    Frames: `token` ({"delta": ...}) while generating, then one `done` frame carrying the
+    same payload /api/chat returns, or an `error` frame if generation fails mid-way.
+    """
+    if not settings.API_KEY: raise HTTPException(status_code=500, detail="API Key not configured")
+    usage_tracker.bind(session_id=session_id, scenario=scenario)
+
+    try:
+        turn_data = await _prepare_chat_turn(file, transcript, history, resume_text, interview_plan, scenario, difficulty, session_id, turn, resume_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = str(e) or repr(e) or "Unknown Error"
+        logger.error(f"Chat Error: {error_msg}", exc_info=True)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+    async def event_stream():
+        parts = []
+        try:
+            async for delta in llm_service.stream_thought_response(turn_data["messages"]):
+                parts.append(delta)
+                yield _sse("token", {"delta": delta})
+        except Exception as e:
+            error_msg = getattr(e, "detail", None) or str(e) or repr(e) or "Unknown Error"
+            logger.error(f"Chat Stream Error: {error_msg}", exc_info=True)
+            yield _sse("error", {"detail": error_msg})
+            return
+
+        reply_text = "".join(parts)
+        logger.info(f"📝 回复内容 (流式): {reply_text[:100]}...")
+
+        try:
+            next_turn = await _commit_context_turn(turn_data, reply_text)
+        except HTTPException as e:
+            # Headers are long gone; a turn lost to a concurrent request is reported in-band
+            yield _sse("error", {"detail": e.detail})
+            return
+        _schedule_plan_evaluation(turn_data, reply_text, scenario, language, difficulty)
+        yield _sse("done", await _turn_result(turn_data, reply_text, next_turn))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/api/plan-status/{session_key}")
-async def get_plan_status(session_key: str):
-    """Poll endpoint to get latest plan status"""
-    if session_key in interview_service.plan_cache:
-        return {"plan": interview_service.plan_cache[session_key]}
-    return {"plan": None}
+async def get_plan_status(session_key: str, since: int = None, wait: float = 0):
+    """Latest plan status.
+
+    With `since` (a plan_version cursor) and `wait` > 0 this is a long-poll: the response
+    is held until the plan moves past `since` or `wait` seconds pass (`changed` tells which).
+    """
+    if since is not None and wait > 0:
+        wait = min(wait, settings.PLAN_PUSH_MAX_WAIT_SECONDS)
+        plan = await plan_events.wait_for_change(interview_service.plan_store, session_key, since, wait)
+        if plan is None:
+            return {"plan": None, "version": since, "changed": False}
+        return {"plan": plan, "version": plan_events.plan_version(plan), "changed": True}
+
+    plan = await interview_service.plan_store.aget(session_key)
+    return {"plan": plan, "version": plan_events.plan_version(plan)}
+
+@router.get("/api/plan-events/{session_key}")
+async def plan_events_stream(session_key: str, since: int = 0):
+    """SSE push channel: one `plan` frame per new plan version, `: ping` comments in between."""
+
+    async def event_stream():
+        cursor = since
+        deadline = asyncio.get_running_loop().time() + settings.PLAN_EVENTS_MAX_SECONDS
+        while asyncio.get_running_loop().time() < deadline:
+            plan = await plan_events.wait_for_change(interview_service.plan_store, session_key, cursor, 15.0)
+            if plan is None:
+                yield ": ping\n\n"
+                continue
+            cursor = plan_events.plan_version(plan)
+            yield _sse("plan", {"plan": plan, "version": cursor})
+            if plan.get("interview_complete"):
+                break
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/api/tts")
 async def generate_tts(req: TTSRequest):
     if not settings.API_KEY: raise HTTPException(status_code=500, detail="API Key not configured")
 
-    text = req.text
+    text = tts_service.clean_tts_text(req.text)
     voice = req.voice or "anna"
 
-    # Preprocessing: Remove thinking tags if present
-    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
-    # Simple regex to remove markdown bold/italic
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
-
     if not text:
         raise HTTPException(status_code=400, detail="No text to speak")
 
-    # Add speaker tag [S1] as required by MOSS-TTSD model
-    text_with_tag = f"[S1]{text}"
-
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{settings.BASE_URL}/audio/speech",
-                headers={
-                    "Authorization": f"Bearer {settings.API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "fnlp/MOSS-TTSD-v0.5",
-                    "input": text_with_tag,
-                    "voice": f"fnlp/MOSS-TTSD-v0.5:{voice}",
-                    "response_format": "mp3",
-                    "speed": 1.15
-                }
-            )
-
-            if response.status_code != 200:
-                logger.error(f"TTS Error {response.status_code}: {response.text}")
-                raise HTTPException(status_code=response.status_code, detail=f"TTS Provider Error: {response.text}")
-
-            # Read complete audio data and return as Response
-            from fastapi.responses import Response
-            audio_data = response.content
-            return Response(content=audio_data, media_type="audio/mpeg")
+        audio_data = await tts_service.synthesize(text, voice)
+        return Response(content=audio_data, media_type="audio/mpeg")
 
     except HTTPException:
         raise
@@ -627,3 +709,22 @@ async def generate_tts(req: TTSRequest):
         error_msg = str(e) or repr(e) or "Unknown Error"
         logger.error(f"TTS Error: {error_msg}", exc_info=True)
         raise HTTPException(status_code=500, detail=error_msg)
+
+@router.post("/api/tts/stream")
+async def generate_tts_stream(req: TTSRequest):
+    """Sentence-pipelined TTS: mp3 for sentence 1 is sent while later sentences are still rendering."""
+    if not settings.API_KEY: raise HTTPException(status_code=500, detail="API Key not configured")
+
+    text = tts_service.clean_tts_text(req.text)
+    voice = req.voice or "anna"
+
+    sentences = tts_service.split_sentences(text)
+    if not sentences:
+        raise HTTPException(status_code=400, detail="No text to speak")
+
+    logger.info(f"🔊 流式 TTS: {len(sentences)} 句")
+    return StreamingResponse(
+        tts_service.stream_sentences(sentences, voice),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
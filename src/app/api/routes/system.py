@@ -1,6 +1,9 @@
+import asyncio
 from fastapi import APIRouter
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
+from app.core import metrics
 from app.interview_templates import INTERVIEW_TEMPLATES, LANGUAGE_OPTIONS
+from app.services import eval_scheduler, interview_service, tts_cache, usage_tracker
 
 router = APIRouter()
 
@@ -26,3 +29,23 @@ async def get_scenarios():
 @router.get("/api/languages")
 async def get_languages():
     return {"languages": LANGUAGE_OPTIONS}
+
+@router.get("/api/stats/tts-cache")
+async def get_tts_cache_stats():
+    cache = tts_cache.get_cache()
+    return {"enabled": cache is not None, "stats": cache.stats() if cache else None}
+
+@router.get("/api/stats/sessions")
+async def get_session_stats():
+    return {"plans": interview_service.plan_store.stats(), "evaluations": eval_scheduler.stats()}
+
+@router.get("/api/stats/usage")
+async def get_usage_stats(group_by: str = "model,endpoint", session_id: str = None, scenario: str = None):
+    """Token totals (and cost, for models in USAGE_PRICES); group_by is a comma list of usage_tracker.DIMENSIONS."""
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    return await asyncio.to_thread(usage_tracker.query, dims, session_id, scenario)
+
+@router.get("/metrics")
+async def get_metrics():
+    await metrics.collect()
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 from dotenv import load_dotenv
@@ -28,7 +29,7 @@ if not loaded:
 
 class Settings:
     API_KEY = os.getenv("SILICONFLOW_API_KEY")
-    BASE_URL = "https://api.siliconflow.cn/v1"
+    BASE_URL = os.getenv("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1")  # perf/mock_upstream.py for offline runs
 
     # --- Models Configuration ---
     MODEL_SENSE = "Qwen/Qwen3-Omni-30B-A3B-Instruct"
@@ -48,9 +49,98 @@ class Settings:
         }
     ]
 
+    # Adaptive routing across MODEL_CHAIN (see app/services/model_router.py)
+    ROUTER_EWMA_ALPHA = 0.2              # Weight of the newest sample in latency/error EWMAs
+    ROUTER_LATENCY_WINDOW = 200          # Recent latencies kept per model for percentiles
+    ROUTER_MIN_SAMPLES = 10              # Below this, hedge after ROUTER_HEDGE_DEFAULT_DELAY
+    ROUTER_HEDGE_PERCENTILE = float(os.getenv("ROUTER_HEDGE_PERCENTILE", "0.9"))
+    ROUTER_HEDGE_DEFAULT_DELAY = 8.0     # Seconds
+    ROUTER_HEDGE_MIN_DELAY = 1.5
+    ROUTER_HEDGE_MAX_DELAY = 20.0
+    CIRCUIT_FAILURE_THRESHOLD = 3        # Consecutive failures that open the circuit
+    CIRCUIT_ERROR_RATE = 0.5             # ...or error-rate EWMA above this
+    CIRCUIT_COOLDOWN = 30.0              # Seconds before a half-open trial request
+
+    # --- TTS ---
+    MODEL_TTS = "fnlp/MOSS-TTSD-v0.5"
+    TTS_SPEED = 1.15
+    TTS_STREAM_CONCURRENCY = int(os.getenv("TTS_STREAM_CONCURRENCY", "3"))  # Sentences synthesized in parallel
+    TTS_SENTENCE_MIN_CHARS = 8   # Shorter fragments are merged into the next sentence
+    TTS_DEFAULT_VOICES = ["anna", "alex", "bella", "benjamin", "charles", "claire", "david", "diana"]  # Mirrors static/app.js
+
+    # Synthesized audio cache, keyed by hash(text, voice, model, speed)
+    TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "1") == "1"
+    TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(root_dir, "cache", "tts"))
+    TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    TTS_CACHE_HOT_MAX_BYTES = int(os.getenv("TTS_CACHE_HOT_MAX_BYTES", str(32 * 1024 * 1024)))
+
+    # --- Session State ---
+    # memory: per-process (single worker only); sqlite / redis: shared, safe with multiple uvicorn workers
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+    SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", os.path.join(root_dir, "data", "sessions.db"))
+    SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://127.0.0.1:6379/0")
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(4 * 3600)))  # Idle time before a session's plan is dropped
+    SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "5000"))
+    SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))  # Approximate, JSON-serialized
+
+    # Plan push (long-poll / SSE): max hold per long-poll, and how often shared backends are re-read
+    # for writes made by other workers (same-worker writes wake watchers immediately)
+    PLAN_PUSH_MAX_WAIT_SECONDS = 30.0
+    PLAN_PUSH_RECHECK_SECONDS = float(os.getenv("PLAN_PUSH_RECHECK_SECONDS", "0.5"))  # Bounds cross-worker push delay
+    PLAN_EVENTS_MAX_SECONDS = 600.0  # An SSE plan stream closes after this; the client reconnects
+
+    # --- Question Bank ---
+    # Questions pasted into the evaluator prompt, picked by BM25 relevance (0 = send the first 200)
+    QUESTION_BANK_EVAL_TOP_K = int(os.getenv("QUESTION_BANK_EVAL_TOP_K", "15"))  # Plan evaluation, per turn
+    # A new turn lets the running plan evaluation finish; only one running longer than this is cancelled
+    EVAL_CANCEL_AFTER_SECONDS = float(os.getenv("EVAL_CANCEL_AFTER_SECONDS", "20.0"))
+    # Edited pack files are picked up without a restart; sessions keep the version they were planned with
+    QUESTION_PACK_RELOAD_INTERVAL = float(os.getenv("QUESTION_PACK_RELOAD_INTERVAL", "5"))  # Seconds, 0 = off
+
+    # analyze-video frame dedup (app/services/frame_dedup.py): near-identical frames reuse the last result
+    VISION_DEDUP_ENABLED = os.getenv("VISION_DEDUP_ENABLED", "1") == "1"
+    VISION_DEDUP_MAX_DISTANCE = int(os.getenv("VISION_DEDUP_MAX_DISTANCE", "6"))  # Hamming bits out of 64
+    VISION_REFRESH_SECONDS = float(os.getenv("VISION_REFRESH_SECONDS", "30"))  # Re-analyze at least this often
+
+    # Resume extraction (process pool, see app/services/file_service.py)
+    RESUME_MAX_BYTES = int(os.getenv("RESUME_MAX_BYTES", str(10 * 1024 * 1024)))
+    RESUME_MAX_PAGES = int(os.getenv("RESUME_MAX_PAGES", "20"))  # PDF pages read; the rest is ignored
+    RESUME_PARSE_TIMEOUT = float(os.getenv("RESUME_PARSE_TIMEOUT", "15"))  # Seconds per file
+    RESUME_PARSE_WORKERS = int(os.getenv("RESUME_PARSE_WORKERS", "2"))
+
+    # Local plan composition (app/services/plan_composer.py); the LLM only writes summary + greeting
+    PLAN_SECTIONS = 4            # Including the warm-up section
+    PLAN_ITEMS_PER_SECTION = 3
+    PLAN_PERSONALIZE = os.getenv("PLAN_PERSONALIZE", "1") == "1"
+
+    # Token usage accounting (app/services/usage_tracker.py), flushed to a SQLite file shared by workers
+    USAGE_TRACKING = os.getenv("USAGE_TRACKING", "1") == "1"
+    USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", os.path.join(root_dir, "data", "usage.db"))
+    USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "30"))  # Seconds
+    # {"model": [input, output]} price per million tokens; models without a price report cost null
+    USAGE_PRICES = json.loads(os.getenv("USAGE_PRICES", "{}"))
+
     MODEL_THINK = MODEL_CHAIN[0]["model"]
     MODEL_TOOL = MODEL_CHAIN[0]["model"]
-    
+
+    # --- Upstream HTTP Client ---
+    # One pooled client is shared by every SiliconFlow call (see app/core/http_client.py)
+    UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "1") == "1"  # Needs the optional `h2` package
+    UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+    UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+    UPSTREAM_KEEPALIVE_EXPIRY = 60.0
+    UPSTREAM_CONNECT_TIMEOUT = 10.0
+
+    # Max in-flight requests per upstream model (others wait for a free slot)
+    MODEL_CONCURRENCY_DEFAULT = int(os.getenv("MODEL_CONCURRENCY_DEFAULT", "32"))
+    MODEL_CONCURRENCY = {
+        "zai-org/GLM-4.6": 32,
+        "Qwen/Qwen3-Next-80B-A3B-Instruct": 32,
+        "Qwen/Qwen3-Omni-30B-A3B-Instruct": 16,
+        "Qwen/Qwen3-VL-30B-A3B-Instruct": 16,
+        "fnlp/MOSS-TTSD-v0.5": 16,
+    }
+
 settings = Settings()
 
 if not settings.API_KEY:
@@ -0,0 +1,96 @@
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from app.core import metrics
+from app.core.config import settings
+from app.core.logger import logger
+
+# Shared upstream client: created once per process and reused by every SiliconFlow call,
+# so each interview turn rides on warm keep-alive connections instead of a fresh TCP+TLS handshake.
+_client = None
+_model_slots = {}
+
+
+def _http2_available():
+    if not settings.UPSTREAM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("⚠️ UPSTREAM_HTTP2 已开启但未安装 h2，回退到 HTTP/1.1")
+        return False
+    return True
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide upstream client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = _http2_available()
+        _client = httpx.AsyncClient(
+            base_url=settings.BASE_URL,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(60.0, connect=settings.UPSTREAM_CONNECT_TIMEOUT),
+        )
+        logger.info(f"🔌 上游连接池已创建 (http2={http2}, max_connections={settings.UPSTREAM_MAX_CONNECTIONS})")
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("🔌 上游连接池已关闭")
+    _client = None
+    _model_slots.clear()
+
+
+def _slots_for(model):
+    slots = _model_slots.get(model)
+    if slots is None:
+        limit = settings.MODEL_CONCURRENCY.get(model, settings.MODEL_CONCURRENCY_DEFAULT)
+        slots = asyncio.Semaphore(max(1, limit))
+        _model_slots[model] = slots
+    return slots
+
+
+def _headers(api_key=None):
+    return {
+        "Authorization": f"Bearer {api_key or settings.API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+async def post(path, payload, *, timeout, model=None, api_key=None, stage="llm") -> httpx.Response:
+    """POST `payload` to `path` on the upstream API.
+
+    `timeout` applies to this call only; `model` (defaults to payload["model"]) selects
+    the per-model concurrency slot. `stage` labels the latency metric (stt, reply, evaluate...).
+    """
+    client = get_client()
+    model = model or payload.get("model")
+    async with _slots_for(model):
+        with metrics.timer(metrics.upstream_request_seconds, stage=stage, model=model, status="") as t:
+            response = await client.post(path, json=payload, headers=_headers(api_key), timeout=timeout)
+            t.labels["status"] = response.status_code
+            return response
+
+
+@asynccontextmanager
+async def stream(path, payload, *, timeout, model=None, api_key=None, stage="llm"):
+    """Streaming counterpart of `post`; yields the open response and holds the model slot until exit.
+
+    The recorded latency covers the whole stream, not just the time to the first chunk.
+    """
+    client = get_client()
+    model = model or payload.get("model")
+    async with _slots_for(model):
+        with metrics.timer(metrics.upstream_request_seconds, stage=stage, model=model, status="") as t:
+            async with client.stream("POST", path, json=payload, headers=_headers(api_key), timeout=timeout) as response:
+                t.labels["status"] = response.status_code
+                yield response
@@ -0,0 +1,170 @@
+import asyncio
+import bisect
+import threading
+import time
+
+# Minimal in-process metrics in the Prometheus text exposition format (served at GET /metrics).
+# Per-process: with several uvicorn workers, each worker reports its own series.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            series = list(self._series.items())
+        for key, value in sorted(series):
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            labels = _format_labels(self.labelnames, key, (("le", _format_value(float(bound))),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge whose value is read from `callback` at scrape time.
+
+    A `blocking` callback (e.g. stats of a sqlite/Redis store) is not called by render();
+    `collect()` runs it in a worker thread before each scrape and render() uses that value.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback, blocking=False):
+        super().__init__(name, documentation)
+        self.callback = callback
+        self.blocking = blocking
+        self.value = None
+
+    def render(self):
+        if self.blocking:
+            value = self.value
+        else:
+            try:
+                value = self.callback()
+            except Exception:
+                value = None
+        if value is None:
+            return []  # A failing source (e.g. Redis down) must not break the whole scrape
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {_format_value(value)}"]
+
+
+class timer:
+    """`with timer(histogram, **labels) as t:`; set `t.labels[...]` inside the block (e.g. status)."""
+
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.labels.get("status") in (None, ""):
+            self.labels["status"] = "error"
+        self.histogram.observe(time.monotonic() - self.started, **self.labels)
+        return False
+
+
+async def collect():
+    """Refresh blocking gauges off the event loop; call before render()."""
+    for metric in list(_registry):
+        if isinstance(metric, Gauge) and metric.blocking:
+            try:
+                metric.value = await asyncio.to_thread(metric.callback)
+            except Exception:
+                metric.value = None
+
+
+def render():
+    return "\n".join(line for metric in list(_registry) for line in metric.render()) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Metrics shared across the app ---
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "Route latency until the response starts (streams: time to first byte)",
+    ("method", "route", "status"))
+upstream_request_seconds = Histogram(
+    "upstream_request_duration_seconds", "SiliconFlow call latency by pipeline stage (stt, reply, llm, evaluate, vision, tts)",
+    ("stage", "model", "status"))
+llm_fallbacks = Counter(
+    "llm_fallbacks_total", "Extra chain models tried: hedge = slow model raced, failure = previous model failed",
+    ("model", "reason"))
+json_parse_failures = Counter(
+    "json_parse_failures_total", "Model outputs that could not be parsed as the expected JSON", ("site",))
@@ -1,12 +1,42 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import os
+import time
 
+from app.core import http_client, metrics
+from app.core.config import settings
 from app.core.logger import logger
 from app.api.routes import system, interview
+from app.question_bank import warm_packs, watch_packs
+from app.services import eval_scheduler, file_service, tts_cache, usage_tracker
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the shared upstream pool before the first request and close it on shutdown
+    http_client.get_client()
+    tts_cache.get_cache()
+    # Parse and index the question packs now rather than inside the first analyze-resume request
+    await asyncio.to_thread(warm_packs)
+    pack_watcher = None
+    if settings.QUESTION_PACK_RELOAD_INTERVAL > 0:
+        pack_watcher = asyncio.create_task(watch_packs(settings.QUESTION_PACK_RELOAD_INTERVAL, settings.SESSION_TTL_SECONDS))
+    usage_flusher = None
+    if settings.USAGE_TRACKING:
+        usage_flusher = asyncio.create_task(usage_tracker.run_flusher(settings.USAGE_FLUSH_INTERVAL))
+    yield
+    if pack_watcher is not None:
+        pack_watcher.cancel()
+    await eval_scheduler.shutdown()
+    if usage_flusher is not None:
+        usage_flusher.cancel()
+        usage_tracker.flush()
+    await http_client.close_client()
+    file_service.shutdown_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +45,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.monotonic()
+    status = 500
+    try:
+        usage_tracker.bind(endpoint=request.url.path)
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (not the raw path) so session ids do not explode the series count
+        route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+        metrics.http_request_seconds.observe(time.monotonic() - started, method=request.method, route=route, status=status)
+
 current_dir = os.path.dirname(os.path.abspath(__file__))
 static_dir = os.path.join(current_dir, "static")
 if not os.path.exists(static_dir):
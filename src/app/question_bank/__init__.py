@@ -1,2 +1,2 @@
-from .registry import get_question_pack, list_available_packs
+from .registry import get_question_pack, list_available_packs, load_question_pack, reload_changed_packs, warm_packs, watch_packs
 
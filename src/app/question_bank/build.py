@@ -0,0 +1,22 @@
+"""Compile packs/*.json into memory-mapped .qpk files: ``python -m app.question_bank.build``."""
+import argparse
+
+from .compiled import compile_pack
+from .registry import _PACK_DIR
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile packs/*.json into memory-mapped .qpk files.")
+    parser.add_argument("--packs", default="", help="Comma-separated pack ids (default: every JSON pack)")
+    args = parser.parse_args()
+
+    wanted = [p.strip() for p in args.packs.split(",") if p.strip()]
+    sources = [_PACK_DIR / f"{p}.json" for p in wanted] if wanted else sorted(_PACK_DIR.glob("*.json"))
+    for source in sources:
+        target = source.with_suffix(".qpk")
+        pack = compile_pack(source.stem, source, target)
+        print(f"{source.stem}: {len(pack.questions)} questions, {source.stat().st_size} -> {target.stat().st_size} bytes ({pack.version})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Compiled question packs (`packs/<pack_id>.qpk`): memory-mapped, decoded one question at a time.
+
+Layout (little-endian)::
+
+    b"QPK1" | u32 header_len | header JSON | sections...
+
+The header holds pack_id, version (sha1 of the source JSON, same as `_compute_version`),
+count, the byte ranges of each section, the tag/primary-tag/difficulty indexes as
+`{key: [start, count]}` ranges into the postings section, and the BM25 statistics
+(`{"terms": n, "avg_length": x}`). Sections:
+
+- record_offsets: (count + 1) u64, offsets of each question's JSON within `records`
+- records: one UTF-8 JSON object per question
+- id_offsets / ids / id_order: question ids sorted for binary search, with their indices
+- postings: u32 question indices referenced by the tag and difficulty indexes
+- term_offsets / terms: BM25 terms sorted for binary search
+- term_spans: per term, u32 start and count into `term_postings`
+- term_postings: (u32 question index, u32 term frequency) pairs
+- doc_lengths: u32 indexed length of each question
+
+Build with ``python -m app.question_bank.build [--packs a,b]``; the registry prefers a
+`.qpk` over its `.json` unless the JSON was modified later.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict, defaultdict
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+from .retrieval import add_term_scores, document_terms, idf, tokenize
+from .service import QuestionPack, _compute_version, load_pack_from_bytes, primary_tag
+
+
+MAGIC = b"QPK1"
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_PAIR = struct.Struct("<II")
+_DECODE_CACHE_SIZE = 128  # Decoded questions kept per pack; older ones are re-parsed from the mmap
+
+
+def _find_sorted(mm: mmap.mmap, offsets: int, blob: int, count: int, key: str) -> int | None:
+    """Rank of `key` in a sorted offsets/bytes string table, or None."""
+    def at(rank: int) -> str:
+        start = _U64.unpack_from(mm, offsets + 8 * rank)[0]
+        end = _U64.unpack_from(mm, offsets + 8 * (rank + 1))[0]
+        return mm[blob + start:blob + end].decode("utf-8")
+
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if at(mid) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo if lo < count and at(lo) == key else None
+
+
+class _U32Array:
+    """Indexable view of a u32 section, read on access."""
+
+    __slots__ = ("_mm", "_offset")
+
+    def __init__(self, mm: mmap.mmap, offset: int):
+        self._mm = mm
+        self._offset = offset
+
+    def __getitem__(self, i: int) -> int:
+        return _U32.unpack_from(self._mm, self._offset + 4 * i)[0]
+
+
+class CompiledIndex:
+    """BM25 scoring straight from a compiled pack's term postings (same scores as `PackIndex`)."""
+
+    def __init__(self, mm: mmap.mmap, header: dict[str, Any], base: int):
+        sections = header["sections"]
+        self.pack_id = header["pack_id"]
+        self.version = header["version"]
+        self.size = header["count"]
+        self._mm = mm
+        self._term_count = header["bm25"]["terms"]
+        self._avg_length = header["bm25"]["avg_length"]
+        self._term_offsets = base + sections["term_offsets"][0]
+        self._terms = base + sections["terms"][0]
+        self._spans = base + sections["term_spans"][0]
+        self._postings = base + sections["term_postings"][0]
+        self._lengths = _U32Array(mm, base + sections["doc_lengths"][0])
+
+    def scores(self, query: str) -> list[float]:
+        scores = [0.0] * self.size
+        if not self.size:
+            return scores
+        for term in set(tokenize(query)):
+            rank = _find_sorted(self._mm, self._term_offsets, self._terms, self._term_count, term)
+            if rank is None:
+                continue
+            start, count = _PAIR.unpack_from(self._mm, self._spans + 8 * rank)
+            posts = _PAIR.iter_unpack(self._mm[self._postings + 8 * start:self._postings + 8 * (start + count)])
+            add_term_scores(scores, idf(self.size, count), posts, self._lengths, self._avg_length)
+        return scores
+
+
+class CompiledQuestions(Sequence):
+    """Read-only sequence of question dicts backed by an mmap; nothing is decoded up front.
+
+    The most recently decoded questions are kept (a bounded LRU), so repeated lookups of
+    the same few questions do not re-parse them.
+    """
+
+    def __init__(self, mm: mmap.mmap, header: dict[str, Any], base: int):
+        self._mm = mm
+        self._count = header["count"]
+        sections = header["sections"]
+        self._offsets = base + sections["record_offsets"][0]
+        self._records = base + sections["records"][0]
+        self._id_offsets = base + sections["id_offsets"][0]
+        self._ids = base + sections["ids"][0]
+        self._id_order = base + sections["id_order"][0]
+        self._postings = base + sections["postings"][0]
+        self._tags = header["tags"]
+        self._difficulty = header["difficulty"]
+        self._primary_tags = header.get("primary_tags")  # Absent in packs compiled before it was added
+        self.bm25_index = CompiledIndex(mm, header, base) if "bm25" in header else None
+        self._decoded: "OrderedDict[int, dict[str, Any]]" = OrderedDict()
+        self._decoded_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("question index out of range")
+        with self._decoded_lock:
+            q = self._decoded.get(i)
+            if q is not None:
+                self._decoded.move_to_end(i)
+                return q
+        start = _U64.unpack_from(self._mm, self._offsets + 8 * i)[0]
+        end = _U64.unpack_from(self._mm, self._offsets + 8 * (i + 1))[0]
+        q = json.loads(self._mm[self._records + start:self._records + end].decode("utf-8"))
+        with self._decoded_lock:
+            self._decoded[i] = q
+            while len(self._decoded) > _DECODE_CACHE_SIZE:
+                self._decoded.popitem(last=False)
+        return q
+
+    def _posting_range(self, span) -> list[int]:
+        if not span:
+            return []
+        start, count = span
+        return [_U32.unpack_from(self._mm, self._postings + 4 * (start + k))[0] for k in range(count)]
+
+    def indices_with_tag(self, tag: str) -> list[int]:
+        return self._posting_range(self._tags.get(tag))
+
+    def difficulty_levels(self) -> dict[Any, list[int]]:
+        levels = {json.loads(level): self._posting_range(span) for level, span in self._difficulty.items()}
+        rated = {i for members in levels.values() for i in members}
+        unrated = [i for i in range(self._count) if i not in rated]
+        if unrated:
+            levels[None] = unrated
+        return levels
+
+    def primary_tag_groups(self) -> dict[str, list[int]]:
+        if self._primary_tags is None:
+            groups: dict[str, list[int]] = {}
+            for i in range(self._count):
+                groups.setdefault(primary_tag(self[i]), []).append(i)
+            return groups
+        return {tag: self._posting_range(span) for tag, span in self._primary_tags.items()}
+
+    def index_of_id(self, qid: str) -> int | None:
+        rank = _find_sorted(self._mm, self._id_offsets, self._ids, self._count, qid)
+        if rank is None:
+            return None
+        return _U32.unpack_from(self._mm, self._id_order + 4 * rank)[0]
+
+
+def read_header(path: Path) -> tuple[dict[str, Any], int]:
+    with open(path, "rb") as f:
+        if f.read(4) != MAGIC:
+            raise ValueError(f"Not a compiled question pack: {path}")
+        header_len = _U32.unpack(f.read(4))[0]
+        return json.loads(f.read(header_len).decode("utf-8")), 8 + header_len
+
+
+def load_compiled_pack(pack_id: str, path: Path) -> QuestionPack:
+    header, base = read_header(path)
+    if header.get("pack_id") != pack_id:
+        raise ValueError(f"Compiled pack {path} is for {header.get('pack_id')!r}, not {pack_id!r}")
+    with open(path, "rb") as f:
+        # The mapping outlives the file handle; a rebuilt file replaces the inode, not these bytes
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return QuestionPack(pack_id=pack_id, version=header["version"], questions=CompiledQuestions(mm, header, base))
+
+
+def compile_pack(pack_id: str, source: Path, target: Path) -> QuestionPack:
+    raw = source.read_bytes()
+    pack = load_pack_from_bytes(pack_id, raw, source)  # Same validation as the JSON loader
+
+    records = bytearray()
+    record_offsets = [0]
+    tags: dict[str, list[int]] = defaultdict(list)
+    primary_tags: dict[str, list[int]] = defaultdict(list)
+    difficulty: dict[str, list[int]] = defaultdict(list)
+    term_postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+    doc_lengths: list[int] = []
+    for i, q in enumerate(pack.questions):
+        records += json.dumps(q, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        record_offsets.append(len(records))
+        for tag in q.get("tags") or ():
+            if isinstance(tag, str):
+                tags[tag].append(i)
+        primary_tags[primary_tag(q)].append(i)
+        if isinstance(q.get("difficulty"), (int, float)):
+            difficulty[str(q["difficulty"])].append(i)
+        terms = document_terms(q)
+        doc_lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            term_postings[term].append((i, tf))
+
+    id_order = sorted(range(len(pack.questions)), key=lambda i: pack.questions[i]["id"])
+    ids = bytearray()
+    id_offsets = [0]
+    for i in id_order:
+        ids += pack.questions[i]["id"].encode("utf-8")
+        id_offsets.append(len(ids))
+
+    postings: list[int] = []
+    tag_spans = {}
+    for tag, members in sorted(tags.items()):
+        tag_spans[tag] = [len(postings), len(members)]
+        postings.extend(members)
+    primary_spans = {}
+    for tag, members in sorted(primary_tags.items()):
+        primary_spans[tag] = [len(postings), len(members)]
+        postings.extend(members)
+    difficulty_spans = {}
+    for level, members in sorted(difficulty.items()):
+        difficulty_spans[level] = [len(postings), len(members)]
+        postings.extend(members)
+
+    terms = bytearray()
+    term_offsets = [0]
+    term_spans = []
+    flat_postings: list[tuple[int, int]] = []
+    for term, posts in sorted(term_postings.items()):
+        terms += term.encode("utf-8")
+        term_offsets.append(len(terms))
+        term_spans.append((len(flat_postings), len(posts)))
+        flat_postings.extend(posts)
+
+    blobs = [
+        ("record_offsets", b"".join(_U64.pack(o) for o in record_offsets)),
+        ("records", bytes(records)),
+        ("id_offsets", b"".join(_U64.pack(o) for o in id_offsets)),
+        ("ids", bytes(ids)),
+        ("id_order", b"".join(_U32.pack(i) for i in id_order)),
+        ("postings", b"".join(_U32.pack(i) for i in postings)),
+        ("term_offsets", b"".join(_U64.pack(o) for o in term_offsets)),
+        ("terms", bytes(terms)),
+        ("term_spans", b"".join(_PAIR.pack(*span) for span in term_spans)),
+        ("term_postings", b"".join(_PAIR.pack(*post) for post in flat_postings)),
+        ("doc_lengths", b"".join(_U32.pack(n) for n in doc_lengths)),
+    ]
+    sections = {}
+    position = 0
+    for name, blob in blobs:
+        sections[name] = [position, len(blob)]
+        position += len(blob)
+    header = json.dumps({
+        "pack_id": pack_id,
+        "version": _compute_version(raw),
+        "count": len(pack.questions),
+        "sections": sections,
+        "tags": tag_spans,
+        "primary_tags": primary_spans,
+        "difficulty": difficulty_spans,
+        "bm25": {"terms": len(term_spans), "avg_length": sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0},
+    }, ensure_ascii=False).encode("utf-8")
+
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_U32.pack(len(header)))
+        f.write(header)
+        for _, blob in blobs:
+            f.write(blob)
+    os.replace(tmp, target)
+    return pack
+
@@ -1,12 +1,37 @@
 from __future__ import annotations
 
-from functools import lru_cache
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 
-from .service import QuestionPack, load_pack_from_file
+from .retrieval import get_pack_index
+from .compiled import load_compiled_pack, read_header
+from .service import QuestionPack, _compute_version, load_pack_from_bytes
 
 
 _PACK_DIR = Path(__file__).resolve().parent / "packs"
+_MAX_VERSIONS = 8  # Retained versions per pack, current one included
+
+logger = logging.getLogger("server")  # Same logger as app.core.logger, without importing the app
+
+
+class _PackEntry:
+    """Current version of one pack plus the older versions sessions may still be pinned to."""
+
+    __slots__ = ("current", "signature", "versions")
+
+    def __init__(self, pack: QuestionPack, signature: tuple[str, int, int]):
+        self.current = pack
+        self.signature = signature
+        self.versions: "OrderedDict[str, list]" = OrderedDict()  # version -> [pack, last_used]
+        self.versions[pack.version] = [pack, time.monotonic()]
+
+
+_entries: dict[str, _PackEntry] = {}
+_lock = threading.Lock()
 
 
 def list_available_packs() -> list[str]:
@@ -15,18 +40,138 @@ def list_available_packs() -> list[str]:
     packs: list[str] = []
     for p in _PACK_DIR.glob("*.json"):
         packs.append(p.stem)
-    packs.sort()
-    return packs
+    for p in _PACK_DIR.glob("*.qpk"):
+        packs.append(p.stem)
+    return sorted(set(packs))
 
 
 def _pack_path(pack_id: str) -> Path:
-    return _PACK_DIR / f"{pack_id}.json"
+    """The compiled .qpk when present and not older than the JSON source, else the JSON."""
+    source = _PACK_DIR / f"{pack_id}.json"
+    compiled = _PACK_DIR / f"{pack_id}.qpk"
+    try:
+        compiled_mtime = compiled.stat().st_mtime_ns
+    except FileNotFoundError:
+        return source
+    try:
+        if source.stat().st_mtime_ns > compiled_mtime:
+            return source
+    except FileNotFoundError:
+        pass
+    return compiled
+
+
+def _signature(path: Path) -> tuple[str, int, int]:
+    st = path.stat()
+    return str(path), st.st_mtime_ns, st.st_size
+
+
+def _load(pack_id: str, path: Path) -> tuple[QuestionPack, tuple[str, int, int]]:
+    signature = _signature(path)
+    if path.suffix == ".qpk":
+        # Only the header is read; questions (and the retrieval index) are decoded on demand
+        return load_compiled_pack(pack_id, path), signature
+    pack = load_pack_from_bytes(pack_id, path.read_bytes(), path)
+    get_pack_index(pack)
+    return pack, signature
+
+
+def get_question_pack(pack_id: str, version: str | None = None) -> QuestionPack:
+    """Current version of a pack, or `version` if it is still retained (sessions pin the version
+    they were planned with). Unknown versions fall back to the current one."""
+    entry = _entries.get(pack_id)
+    if entry is None:
+        path = _pack_path(pack_id)
+        if not path.exists():
+            raise FileNotFoundError(f"Question pack not found: {pack_id}")
+        pack, signature = _load(pack_id, path)
+        with _lock:
+            entry = _entries.setdefault(pack_id, _PackEntry(pack, signature))
+
+    if version and version != entry.current.version:
+        retained = entry.versions.get(version)
+        if retained is not None:
+            retained[1] = time.monotonic()
+            return retained[0]
+    return entry.current
+
+
+async def load_question_pack(pack_id: str, version: str | None = None) -> QuestionPack:
+    """`get_question_pack` for the event loop: a pack not loaded yet is parsed and indexed
+    in a worker thread instead of blocking every other request meanwhile."""
+    if pack_id in _entries:
+        return get_question_pack(pack_id, version)
+    return await asyncio.to_thread(get_question_pack, pack_id, version)
+
+
+def warm_packs() -> list[str]:
+    """Load and index every available pack (blocking; the app runs it in a thread at startup)."""
+    warmed = []
+    for pack_id in list_available_packs():
+        try:
+            get_pack_index(get_question_pack(pack_id))
+            warmed.append(pack_id)
+        except Exception as e:
+            logger.warning(f"⚠️ 题库预加载失败 {pack_id}: {e}")
+    return warmed
+
+
+def reload_changed_packs(retention: float) -> list[str]:
+    """Swap in packs whose files changed; drop old versions unused for `retention` seconds.
+
+    A changed mtime/size only triggers a re-hash (for .qpk files, a header read); the pack
+    is re-parsed (and re-indexed) only when the content hash differs. Returns the pack ids
+    that got a new version.
+    """
+    reloaded = []
+    now = time.monotonic()
+    for pack_id, entry in list(_entries.items()):
+        path = _pack_path(pack_id)
+        try:
+            signature = _signature(path)
+        except FileNotFoundError:
+            continue  # Keep serving the last good version
+        if signature != entry.signature:
+            try:
+                if path.suffix == ".qpk":
+                    version = read_header(path)[0]["version"]
+                else:
+                    raw = path.read_bytes()
+                    version = _compute_version(raw)
+                if version == entry.current.version:
+                    entry.signature = signature
+                else:
+                    if path.suffix == ".qpk":
+                        pack = load_compiled_pack(pack_id, path)
+                    else:
+                        pack = load_pack_from_bytes(pack_id, raw, path)
+                        get_pack_index(pack)
+                    with _lock:
+                        entry.versions[entry.current.version][1] = now  # Sessions were using it until now
+                        entry.versions[pack.version] = [pack, now]
+                        entry.versions.move_to_end(pack.version)
+                        entry.current = pack
+                        entry.signature = signature
+                    reloaded.append(pack_id)
+                    logger.info(f"📚 题库已热更新: {pack_id} -> {pack.version}")
+            except Exception as e:
+                # Half-written or invalid file: keep the current version, retry on the next change
+                entry.signature = signature
+                logger.warning(f"⚠️ 题库热更新失败 {pack_id}: {e}")
 
+        with _lock:
+            for version, (pack, last_used) in list(entry.versions.items()):
+                expired = now - last_used > retention or len(entry.versions) > _MAX_VERSIONS
+                if version != entry.current.version and expired:
+                    del entry.versions[version]
+    return reloaded
 
-@lru_cache(maxsize=64)
-def get_question_pack(pack_id: str) -> QuestionPack:
-    path = _pack_path(pack_id)
-    if not path.exists():
-        raise FileNotFoundError(f"Question pack not found: {pack_id}")
-    return load_pack_from_file(pack_id, path)
 
+async def watch_packs(interval: float, retention: float) -> None:
+    """Background loop for the app lifespan: poll pack files every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(reload_changed_packs, retention)
+        except Exception as e:
+            logger.warning(f"⚠️ 题库检查失败: {e}")
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any
+
+from .service import QuestionPack
+
+
+_INDEX_FIELDS = ("question", "topic", "tags", "followups", "variants")
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9_+#.\-]*|[\u3400-\u9fff]+")
+_CJK_RE = re.compile(r"[\u3400-\u9fff]")
+
+_K1 = 1.5
+_B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased latin words plus CJK character bigrams (single CJK characters stay unigrams)."""
+    tokens: list[str] = []
+    for word in _WORD_RE.findall(text.lower()):
+        if _CJK_RE.match(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.strip(".-"))
+    return [t for t in tokens if t]
+
+
+def _field_text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return " ".join(_field_text(v) for v in value)
+    return ""
+
+
+def document_terms(q: dict[str, Any]) -> Counter[str]:
+    """Term frequencies of one question over the indexed fields."""
+    return Counter(tokenize(" ".join(_field_text(q.get(f)) for f in _INDEX_FIELDS)))
+
+
+def idf(size: int, df: int) -> float:
+    return math.log(1 + (size - df + 0.5) / (df + 0.5))
+
+
+def add_term_scores(scores: list[float], idf_value: float, posts, lengths, avg_length: float) -> None:
+    """BM25 contribution of one query term, from its (doc_id, tf) postings."""
+    for doc_id, tf in posts:
+        norm = _K1 * (1 - _B + _B * lengths[doc_id] / avg_length)
+        scores[doc_id] += idf_value * tf * (_K1 + 1) / (tf + norm)
+
+
+class PackIndex:
+    """BM25 index over one question pack version, built in memory (JSON packs).
+
+    Compiled packs store the same postings in their .qpk (see `compiled.CompiledIndex`).
+    """
+
+    def __init__(self, pack: QuestionPack):
+        self.pack_id = pack.pack_id
+        self.version = pack.version
+        self.size = len(pack.questions)
+        self._postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self._lengths: list[int] = []
+        for doc_id, q in enumerate(pack.questions):
+            terms = document_terms(q)
+            self._lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self._postings[term].append((doc_id, tf))
+        self._avg_length = (sum(self._lengths) / self.size) if self.size else 0.0
+        self._idf = {term: idf(self.size, len(posts)) for term, posts in self._postings.items()}
+
+    def scores(self, query: str) -> list[float]:
+        scores = [0.0] * self.size
+        if not self.size:
+            return scores
+        for term in set(tokenize(query)):
+            posts = self._postings.get(term)
+            if posts:
+                add_term_scores(scores, self._idf[term], posts, self._lengths, self._avg_length)
+        return scores
+
+
+_MAX_INDEXES = 32
+_indexes: "OrderedDict[tuple[str, str], PackIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_pack_index(pack: QuestionPack) -> PackIndex:
+    # Compiled packs score straight from the postings in their mmap: nothing to build or cache
+    stored = getattr(pack.questions, "bm25_index", None)
+    if stored is not None:
+        return stored
+    key = (pack.pack_id, pack.version)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = PackIndex(pack)
+    with _lock:
+        # Old pack versions stay indexed while sessions pinned to them are still asking
+        _indexes[key] = index
+        while len(_indexes) > _MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def select_questions(
+    pack: QuestionPack,
+    query: str,
+    k: int,
+    *,
+    required_ids: tuple[str, ...] = (),
+) -> tuple[int, ...]:
+    """Indices of the `k` questions most relevant to `query`, in pack order.
+
+    `required_ids` are always included.
+    """
+    n = len(pack.questions)
+    if k >= n:
+        return tuple(range(n))
+    scores = get_pack_index(pack).scores(query)
+    # Ties (including the all-zero case) fall back to pack order
+    ranked = sorted(range(n), key=lambda i: (-scores[i], i))
+
+    chosen: set[int] = set()
+    for qid in required_ids:
+        i = pack.index_of_id(qid)
+        if i is not None:
+            chosen.add(i)
+
+    for i in ranked:
+        if len(chosen) >= k:
+            break
+        chosen.add(i)
+    return tuple(sorted(chosen))
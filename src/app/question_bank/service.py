@@ -1,5 +1,9 @@
 import json
 import hashlib
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -9,7 +13,50 @@ from typing import Any
 class QuestionPack:
     pack_id: str
     version: str
-    questions: list[dict[str, Any]]
+    # A list for JSON packs; a lazily decoded `compiled.CompiledQuestions` for .qpk packs
+    questions: Sequence[dict[str, Any]]
+
+    def indices_with_tag(self, tag: str) -> list[int]:
+        lookup = getattr(self.questions, "indices_with_tag", None)
+        if lookup is not None:
+            return lookup(tag)
+        return [i for i, q in enumerate(self.questions) if tag in (q.get("tags") or ())]
+
+    def index_of_id(self, qid: str) -> int | None:
+        lookup = getattr(self.questions, "index_of_id", None)
+        if lookup is not None:
+            return lookup(qid)
+        return next((i for i, q in enumerate(self.questions) if q.get("id") == qid), None)
+
+    def difficulty_levels(self) -> dict[int | float | None, list[int]]:
+        """Question indices per difficulty; questions without a numeric one are under None."""
+        lookup = getattr(self.questions, "difficulty_levels", None)
+        if lookup is not None:
+            return lookup()
+        levels: dict[int | float | None, list[int]] = {}
+        for i, q in enumerate(self.questions):
+            levels.setdefault(_difficulty_of(q), []).append(i)
+        return levels
+
+    def primary_tag_groups(self) -> dict[str, list[int]]:
+        """Question indices by first tag ("general" for untagged questions)."""
+        lookup = getattr(self.questions, "primary_tag_groups", None)
+        if lookup is not None:
+            return lookup()
+        groups: dict[str, list[int]] = {}
+        for i, q in enumerate(self.questions):
+            groups.setdefault(primary_tag(q), []).append(i)
+        return groups
+
+
+def _difficulty_of(q: dict[str, Any]) -> int | float | None:
+    d = q.get("difficulty")
+    return d if isinstance(d, (int, float)) else None
+
+
+def primary_tag(q: dict[str, Any]) -> str:
+    tags = q.get("tags")
+    return tags[0] if isinstance(tags, list) and tags and isinstance(tags[0], str) else "general"
 
 
 def _compute_version(file_bytes: bytes) -> str:
@@ -17,7 +64,10 @@ def _compute_version(file_bytes: bytes) -> str:
 
 
 def load_pack_from_file(pack_id: str, file_path: Path) -> QuestionPack:
-    raw = file_path.read_bytes()
+    return load_pack_from_bytes(pack_id, file_path.read_bytes(), file_path)
+
+
+def load_pack_from_bytes(pack_id: str, raw: bytes, file_path: Path | str = "<bytes>") -> QuestionPack:
     version = _compute_version(raw)
     try:
         data = json.loads(raw.decode("utf-8"))
@@ -42,13 +92,31 @@ def load_pack_from_file(pack_id: str, file_path: Path) -> QuestionPack:
     return QuestionPack(pack_id=pack_id, version=version, questions=questions)
 
 
-def render_pack_for_prompt(
-    pack: QuestionPack,
-    *,
-    max_questions: int | None = 200,
-    fields: tuple[str, ...] = ("id", "question", "tags", "difficulty", "followups", "variants"),
-) -> str:
-    if max_questions is None:
+@dataclass(frozen=True)
+class RenderedPack:
+    text: str
+    byte_length: int
+    token_estimate: int
+
+
+DEFAULT_PROMPT_FIELDS = ("id", "question", "tags", "difficulty", "followups", "variants")
+
+_RENDER_CACHE_SIZE = 256
+_render_cache: "OrderedDict[tuple, RenderedPack]" = OrderedDict()
+_render_lock = threading.Lock()
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per ~4 other characters."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _render(pack: QuestionPack, max_questions: int | None, fields: tuple[str, ...], indices: tuple[int, ...] | None) -> str:
+    if indices is not None:
+        subset = [pack.questions[i] for i in indices]
+    elif max_questions is None:
         subset = pack.questions
     else:
         subset = pack.questions[: max(0, max_questions)]
@@ -64,3 +132,40 @@ def render_pack_for_prompt(
     }
     return json.dumps(payload, ensure_ascii=False)
 
+
+def render_pack_segment(
+    pack: QuestionPack,
+    *,
+    max_questions: int | None = 200,
+    fields: tuple[str, ...] = DEFAULT_PROMPT_FIELDS,
+    indices: tuple[int, ...] | None = None,
+) -> RenderedPack:
+    """Rendered prompt segment for a pack, memoized by (pack_id, version, max_questions, fields).
+
+    `indices` (e.g. from `retrieval.select_questions`) renders that subset instead of the
+    first `max_questions` and is part of the key. Packs are immutable per version, so a hit
+    is always identical to a fresh render.
+    """
+    key = (pack.pack_id, pack.version, max_questions, tuple(fields), indices)
+    with _render_lock:
+        cached = _render_cache.get(key)
+        if cached is not None:
+            _render_cache.move_to_end(key)
+            return cached
+
+    text = _render(pack, max_questions, tuple(fields), indices)
+    rendered = RenderedPack(text=text, byte_length=len(text.encode("utf-8")), token_estimate=estimate_tokens(text))
+    with _render_lock:
+        _render_cache[key] = rendered
+        while len(_render_cache) > _RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return rendered
+
+
+def render_pack_for_prompt(
+    pack: QuestionPack,
+    *,
+    max_questions: int | None = 200,
+    fields: tuple[str, ...] = DEFAULT_PROMPT_FIELDS,
+) -> str:
+    return render_pack_segment(pack, max_questions=max_questions, fields=fields).text
@@ -9,3 +9,4 @@ class VideoAnalysisRequest(BaseModel):
     images: List[str]
     current_topic: Optional[str] = ""
     language: Optional[str] = "zh-CN"
+    session_id: Optional[str] = None  # Enables frame dedup against the session's last analyzed frames
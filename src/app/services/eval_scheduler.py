@@ -0,0 +1,108 @@
+import asyncio
+import copy
+import time
+from app.core import metrics
+from app.core.config import settings
+from app.core.logger import logger
+from app.services import interview_service
+
+# Per-session plan evaluation queue. At most one evaluator call runs per session; turns that
+# arrive meanwhile are coalesced into one follow-up call once it finishes. A running call is
+# only cancelled (its answers folded into the follow-up) when it has been going for longer
+# than EVAL_CANCEL_AFTER_SECONDS, i.e. it is probably stuck. Task references live here so
+# fire-and-forget evaluations cannot be garbage-collected mid-flight.
+
+
+class _SessionQueue:
+    __slots__ = ("job", "backlog", "worker", "current", "started_at")
+
+    def __init__(self):
+        self.job = None      # latest submitted turn (its messages include every earlier turn)
+        self.backlog = 0     # answers submitted but not yet evaluated
+        self.worker = None   # drain loop task
+        self.current = None  # in-flight evaluate_plan_async task
+        self.started_at = 0.0
+
+
+_queues = {}  # session_key -> _SessionQueue
+_counters = {"submitted": 0, "runs": 0, "coalesced": 0, "cancelled": 0}
+
+
+def submit(session_key, messages, resume_text, plan_data, scenario, language, api_key, difficulty):
+    """Queue an evaluation of the latest turn for `session_key`; returns immediately."""
+    queue = _queues.get(session_key)
+    if queue is None:
+        queue = _queues[session_key] = _SessionQueue()
+    running = queue.current is not None and not queue.current.done()
+    if queue.job is not None or running:
+        _counters["coalesced"] += 1
+    queue.job = {
+        "messages": messages,
+        "resume_text": resume_text,
+        "plan_data": plan_data,
+        "scenario": scenario,
+        "language": language,
+        "api_key": api_key,
+        "difficulty": difficulty,
+    }
+    queue.backlog += 1
+    _counters["submitted"] += 1
+
+    if running and time.monotonic() - queue.started_at > settings.EVAL_CANCEL_AFTER_SECONDS:
+        queue.current.cancel()
+        _counters["cancelled"] += 1
+        logger.info(f"⏹️ 计划评估超过 {settings.EVAL_CANCEL_AFTER_SECONDS:.0f}s 未完成，取消并合并到下一次 ({session_key[:8]})")
+    if queue.worker is None or queue.worker.done():
+        queue.worker = asyncio.create_task(_drain(session_key, queue))
+
+
+async def _drain(session_key, queue):
+    try:
+        while queue.job is not None:
+            job, queue.job = queue.job, None
+            answers, queue.backlog = queue.backlog, 0
+            if answers > 1:
+                logger.info(f"🧮 合并 {answers} 轮回答为一次计划评估 ({session_key[:8]})")
+
+            # Start from the newest stored plan, not the snapshot taken when the turn was submitted
+            plan_data = await interview_service.plan_store.aget(session_key, job["plan_data"])
+            queue.current = asyncio.create_task(interview_service.evaluate_plan_async(
+                job["messages"], job["resume_text"], copy.deepcopy(plan_data), job["scenario"], job["language"],
+                job["api_key"], session_key, job["difficulty"], new_answers=answers,
+            ))
+            queue.started_at = time.monotonic()
+            _counters["runs"] += 1
+            await asyncio.wait({queue.current})
+            if queue.current.cancelled():
+                # Overran its time: evaluate these answers together with the newer turn
+                queue.backlog += answers
+    finally:
+        if queue.current is not None and not queue.current.done():
+            queue.current.cancel()
+        queue.current = None
+        if _queues.get(session_key) is queue and queue.job is None:
+            del _queues[session_key]
+
+
+def _pending():
+    return sum(q.backlog + (1 if q.current is not None and not q.current.done() else 0) for q in _queues.values())
+
+
+metrics.Gauge("eval_tasks_pending", "Answers waiting for (or in) a plan evaluation", _pending)
+
+
+def stats():
+    return {
+        "active_sessions": len(_queues),
+        "running": sum(1 for q in _queues.values() if q.current is not None and not q.current.done()),
+        **_counters,
+    }
+
+
+async def shutdown():
+    workers = [q.worker for q in _queues.values() if q.worker is not None and not q.worker.done()]
+    for worker in workers:
+        worker.cancel()
+    if workers:
+        await asyncio.gather(*workers, return_exceptions=True)
+        logger.info(f"⏹️ 已取消 {len(workers)} 个进行中的计划评估")
@@ -1,27 +1,120 @@
+import asyncio
 import io
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import docx
 import PyPDF2
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
+from app.core.config import settings
 from app.core.logger import logger
 
-def parse_resume(file: UploadFile) -> str:
-    content = file.file.read()
-    filename = file.filename.lower()
-    text = ""
-    try:
-        if filename.endswith(".pdf"):
-            reader = PyPDF2.PdfReader(io.BytesIO(content))
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        elif filename.endswith(".docx"):
-            doc = docx.Document(io.BytesIO(content))
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-        else:
-            text = content.decode("utf-8", errors="ignore")
-    except Exception as e:
-        logger.error(f"Error parsing resume: {e}")
-        return "Error parsing resume."
-    finally:
-        file.file.seek(0)
-    return text.strip()
+# PDF/DOCX extraction is CPU-bound and can take seconds on large scans, so it runs in a small
+# process pool instead of on the event loop. A job that exceeds RESUME_PARSE_TIMEOUT has its
+# pool torn down (the only way to stop a running worker); other jobs retry on a fresh pool.
+# Workers come from a forkserver, not fork(): forking the server would copy its event loop,
+# threads and sockets into every worker.
+_pool = None
+_worker_pids = None  # Queue each worker of the current pool reports its pid on
+
+PARSE_ERROR_TEXT = "Error parsing resume."
+
+
+def _report_pid(queue):
+    """Worker initializer."""
+    queue.put(os.getpid())
+
+
+def _get_pool():
+    global _pool, _worker_pids
+    if _pool is None:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        _worker_pids = context.SimpleQueue()
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.RESUME_PARSE_WORKERS,
+            mp_context=context,
+            initializer=_report_pid,
+            initargs=(_worker_pids,),
+        )
+    return _pool
+
+
+def _kill_pool():
+    global _pool, _worker_pids
+    pool, pids = _pool, _worker_pids
+    _pool, _worker_pids = None, None
+    if pool is None:
+        return
+    # shutdown() only stops idle workers; a stuck parse has to be killed by pid
+    pool.shutdown(wait=False, cancel_futures=True)
+    while not pids.empty():
+        try:
+            os.kill(pids.get(), signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def shutdown_pool():
+    global _pool, _worker_pids
+    pool, _pool, _worker_pids = _pool, None, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_text(content: bytes, filename: str, max_pages: int) -> str:
+    """Runs in a worker process."""
+    parts = []
+    if filename.endswith(".pdf"):
+        reader = PyPDF2.PdfReader(io.BytesIO(content))
+        for page in reader.pages[:max_pages]:
+            parts.append(page.extract_text() or "")
+    elif filename.endswith(".docx"):
+        doc = docx.Document(io.BytesIO(content))
+        for para in doc.paragraphs:
+            parts.append(para.text)
+    else:
+        return content.decode("utf-8", errors="ignore").strip()
+    return "\n".join(parts).strip()
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    content = await file.read(settings.RESUME_MAX_BYTES + 1)
+    await file.seek(0)
+    if len(content) > settings.RESUME_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Resume file exceeds {settings.RESUME_MAX_BYTES // (1024 * 1024)} MB")
+    return content
+
+
+async def extract_text(content: bytes, filename: str) -> str:
+    """Resume text from raw upload bytes, or PARSE_ERROR_TEXT if the file could not be read."""
+    filename = filename.lower()
+    for attempt in range(2):
+        pool = _get_pool()
+        future = None
+        try:
+            future = pool.submit(_extract_text, content, filename, settings.RESUME_MAX_PAGES)
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=settings.RESUME_PARSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"⏱️ 简历解析超时 ({settings.RESUME_PARSE_TIMEOUT}s): {filename}")
+            if _pool is pool:
+                _kill_pool()
+            raise HTTPException(status_code=422, detail="Resume parsing timed out")
+        except asyncio.CancelledError:
+            # Client went away: a queued job is dropped; a running one is left to finish
+            if future is not None:
+                future.cancel()
+            raise
+        except BrokenProcessPool:
+            # Another job's timeout killed the pool under us, or a worker crashed on this file
+            if _pool is pool:
+                _kill_pool()
+            if attempt == 0:
+                continue
+            logger.error("Error parsing resume: worker pool unavailable")
+            return PARSE_ERROR_TEXT
+        except Exception as e:
+            logger.error(f"Error parsing resume: {e}")
+            return PARSE_ERROR_TEXT
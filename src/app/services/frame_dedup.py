@@ -0,0 +1,104 @@
+import base64
+import binascii
+import hashlib
+import io
+import math
+import time
+from app.core import metrics
+from app.core.config import settings
+from app.core.logger import logger
+from app.services.session_store import create_session_store
+
+try:
+    from PIL import Image
+except ImportError:  # Optional: without Pillow only byte-identical frames are recognised
+    Image = None
+
+# Per-session fingerprints of the last frames sent to the vision model, with its normalized
+# result. Frames arrive every few seconds and mostly show the same still candidate, so a set
+# whose perceptual hashes are all within VISION_DEDUP_MAX_DISTANCE bits of the stored ones
+# reuses that result until VISION_REFRESH_SECONDS have passed.
+frame_store = create_session_store("frames")
+
+vision_frames = metrics.Counter("vision_frame_sets_total", "analyze-video requests by outcome (analyzed / reused)", ("result",))
+
+_HASH_SIZE = 32   # Frames are downscaled to 32x32 grayscale before the DCT
+_LOW_FREQ = 8     # The top-left 8x8 DCT block gives a 64-bit hash
+_DCT = [[math.cos(math.pi * (2 * x + 1) * u / (2 * _HASH_SIZE)) for x in range(_HASH_SIZE)] for u in range(_LOW_FREQ)]
+
+
+def _decode(img_b64):
+    data = img_b64.split(",", 1)[1] if img_b64.startswith("data:") else img_b64
+    return base64.b64decode(data, validate=False)
+
+
+def _phash(raw):
+    img = Image.open(io.BytesIO(raw)).convert("L").resize((_HASH_SIZE, _HASH_SIZE), Image.BILINEAR)
+    pixels = list(img.getdata())
+    rows = [pixels[y * _HASH_SIZE:(y + 1) * _HASH_SIZE] for y in range(_HASH_SIZE)]
+    # Separable DCT-II, low frequencies only: first along x for every row, then along y
+    partial = [[sum(c * p for c, p in zip(_DCT[u], row)) for u in range(_LOW_FREQ)] for row in rows]
+    coeffs = [
+        sum(_DCT[v][y] * partial[y][u] for y in range(_HASH_SIZE))
+        for v in range(_LOW_FREQ) for u in range(_LOW_FREQ)
+    ]
+    ac = coeffs[1:]  # The DC term only tracks overall brightness
+    median = sorted(ac)[len(ac) // 2]
+    bits = 0
+    for c in coeffs:
+        bits = (bits << 1) | (1 if c > median else 0)
+    return f"p{bits:016x}"
+
+
+def fingerprint(img_b64):
+    """Perceptual hash of one base64 frame ("p..."), or a content hash ("s...") without Pillow."""
+    try:
+        raw = _decode(img_b64)
+    except (binascii.Error, ValueError):
+        return None
+    if Image is not None:
+        try:
+            return _phash(raw)
+        except Exception:
+            pass  # Not a decodable image: fall back to exact matching
+    return "s" + hashlib.sha1(raw).hexdigest()[:16]
+
+
+def _distance(a, b):
+    if a is None or b is None or a[0] != b[0]:
+        return None
+    if a[0] == "p":
+        return bin(int(a[1:], 16) ^ int(b[1:], 16)).count("1")
+    return 0 if a == b else None
+
+
+def _similar(hashes, previous):
+    """Every new frame is within the distance threshold of some previously analyzed frame."""
+    if not hashes or not previous:
+        return False
+    for h in hashes:
+        distances = [d for d in (_distance(h, p) for p in previous) if d is not None]
+        if not distances or min(distances) > settings.VISION_DEDUP_MAX_DISTANCE:
+            return False
+    return True
+
+
+async def reusable_result(session_id, hashes):
+    """The cached normalized result when these frames match the last analyzed set, else None."""
+    if not settings.VISION_DEDUP_ENABLED or not session_id:
+        return None
+    entry = await frame_store.aget(session_id)
+    if entry is None or time.time() - entry["analyzed_at"] > settings.VISION_REFRESH_SECONDS:
+        return None
+    if not _similar(hashes, entry["hashes"]):
+        return None
+    vision_frames.inc(result="reused")
+    logger.info(f"🖼️ 画面无明显变化，复用视觉分析结果 ({session_id[:8]})")
+    return entry["result"]
+
+
+async def remember(session_id, hashes, result, reusable=True):
+    vision_frames.inc(result="analyzed")
+    if not reusable or not settings.VISION_DEDUP_ENABLED or not session_id or result.get("analysis_error"):
+        return
+    await frame_store.aset(session_id, {"hashes": hashes, "result": result, "analyzed_at": time.time()})
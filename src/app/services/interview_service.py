@@ -1,15 +1,62 @@
+import asyncio
+import copy
 import json
-import httpx
+from app.core import http_client, metrics
 from app.core.config import settings
 from app.core.logger import logger
-from app.question_bank import get_question_pack
-from app.question_bank.service import render_pack_for_prompt
+from app.question_bank import load_question_pack
+from app.question_bank.retrieval import select_questions
+from app.question_bank.service import render_pack_segment
+from app.services import plan_events, usage_tracker
+from app.services.plan_model import InterviewPlan
+from app.services.session_store import create_session_store
 
-# Session storage for updated plans
-plan_cache = {}
+# Session storage for updated plans (bounded TTL + LRU; backend per settings.SESSION_BACKEND)
+plan_store = create_session_store("plans")
 
-async def evaluate_plan_async(history_list, resume_text, plan_data, scenario, language, api_key, session_key, difficulty=5):
-    """Evaluate conversation and update interview plan using function calling"""
+
+async def update_plan(session_key, change, initial=None):
+    """Apply `change` to the stored plan (or a copy of `initial` if none is stored) and save it.
+
+    The read, the `plan_version` bump and the write are one atomic store update, so concurrent
+    writers (chat turns, the evaluator, other workers) each get their own version and neither
+    overwrites the other's changes. `change` gets a private copy and returns the new plan, or
+    None to leave things as they are; it may be re-run if another writer got in first.
+    Returns the saved plan (None if nothing was written) and wakes anyone watching the session.
+    """
+    def apply(stored):
+        base = stored if stored is not None else initial
+        if base is None:
+            return None
+        plan = change(copy.deepcopy(base))
+        if plan is None:
+            return None
+        plan["plan_version"] = plan_events.plan_version(stored) + 1
+        return plan
+
+    saved = await plan_store.aupdate(session_key, apply)
+    if saved is not None:
+        plan_events.notify(session_key)
+    return saved
+
+
+async def save_plan(session_key, plan):
+    """Store a freshly built plan as the session's next `plan_version`; returns that version."""
+    return (await update_plan(session_key, lambda _: plan, plan))["plan_version"]
+
+
+def _latest_user_answer(history_list):
+    for msg in reversed(history_list):
+        if isinstance(msg, dict) and msg.get("role") == "user" and isinstance(msg.get("content"), str):
+            return msg["content"]
+    return ""
+
+
+async def evaluate_plan_async(history_list, resume_text, plan_data, scenario, language, api_key, session_key, difficulty=5, new_answers=1):
+    """Evaluate conversation and update interview plan using function calling.
+
+    `new_answers` > 1 when the scheduler coalesced several turns into this call.
+    """
     try:
         # Difficulty context
         DIFFICULTY_DESC = {
@@ -87,39 +134,42 @@ async def evaluate_plan_async(history_list, resume_text, plan_data, scenario, la
         ]
         
         # Build Plan Context with status tracking
-        plan_desc = "CURRENT INTERVIEW PLAN:\n"
-        pending_items = []
-        completed_items = []
-        total_items = 0
-        
-        for sec in plan_data.get("sections", []):
-            plan_desc += f"\n## {sec['title']}:\n"
-            for item in sec['items']:
-                total_items += 1
-                if item.get("status") == "done":
-                    plan_desc += f"  ✅ [DONE] (ID: {item['id']}) {item['content']} - Score: {item.get('score', 'N/A')}\n"
-                    completed_items.append(item['id'])
-                else:
-                    asked_flag = " 🟣[ASKED]" if item.get("asked") else ""
-                    plan_desc += f"  ⬜ [PENDING{asked_flag}] (ID: {item['id']}) {item['content']}\n"
-                    pending_items.append(f"ID {item['id']}: {item['content'][:40]}")
-        
-        all_done = len(pending_items) == 0
+        plan = InterviewPlan.from_dict(plan_data)
+        plan_desc = plan.render_eval_status()
+        pending_items = plan.pending_summaries()
 
         pack_id = None
+        pack_version = None
         try:
             meta = plan_data.get("meta") if isinstance(plan_data.get("meta"), dict) else {}
             pack_id = meta.get("question_pack_id") or scenario
+            pack_version = meta.get("question_pack_version") or None
         except Exception:
             pack_id = scenario
 
         question_bank_json = '{"pack_id": null, "version": null, "questions": []}'
         try:
-            pack = get_question_pack(pack_id)
-            question_bank_json = render_pack_for_prompt(pack, max_questions=200)
+            # The version this session was planned with, while it is still retained
+            pack = await load_question_pack(pack_id, pack_version)
+            # Only the questions relevant to the item being answered and the latest answer
+            bank_subset = None
+            if settings.QUESTION_BANK_EVAL_TOP_K > 0:
+                asked_item = plan.asked_item() or plan.first_pending()
+                query = " ".join(filter(None, [asked_item.content if asked_item else "", _latest_user_answer(history_list)]))
+                required = (str(asked_item.bank_id),) if asked_item and asked_item.bank_id else ()
+                # BM25 scoring (and, for a compiled pack, building its index) is CPU work: keep it off the loop
+                bank_subset = await asyncio.to_thread(select_questions, pack, query, settings.QUESTION_BANK_EVAL_TOP_K, required_ids=required)
+            rendered_bank = render_pack_segment(pack, max_questions=200, indices=bank_subset)
+            question_bank_json = rendered_bank.text
+            logger.debug(f"📚 题库片段 {pack_id}: {rendered_bank.byte_length} bytes, ~{rendered_bank.token_estimate} tokens")
         except Exception as e:
             logger.warning(f"Question pack unavailable for {pack_id}: {str(e)}")
         
+        if new_answers > 1:
+            latest_instruction = f"Analyze the *latest {new_answers}* user answers, in order (they arrived before the plan could be updated)."
+        else:
+            latest_instruction = "Analyze the *latest* user answer."
+
         # Strict system prompt to prevent chatting
         system_prompt = f"""You are a background process that updates an interview checklist.
         
@@ -139,7 +189,7 @@ QUESTION BANK (JSON):
 {question_bank_json}
 
 INSTRUCTIONS:
-    1. Analyze the *latest* user answer.
+    1. {latest_instruction}
     2. If it answers a PENDING item:
        - Check if the answer quality meets the DIFFICULTY STANDARD.
        - If YES: call `mark_item_complete` (score 60-100).
@@ -159,66 +209,72 @@ INSTRUCTIONS:
         
         # Construct messages strictly for tool calling
         messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(history_list[-8:])  # Keep context short but include last question
+        # Keep context short but include last question (and every answer not yet evaluated)
+        messages.extend(history_list[-max(8, 2 * new_answers + 2):])
         messages.append({"role": "user", "content": "Analyze the above conversation and update the plan immediately. Call tools now."})
 
         # Use the same GLM-4.6 model for plan evaluation (with Function Calling)
         eval_model = settings.MODEL_TOOL  # Reuse GLM-4.6
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            logger.info(f"📡 发送计划评估请求至 {eval_model}...")
+        logger.info(f"📡 发送计划评估请求至 {eval_model}...")
 
-            response = await client.post(
-                f"{settings.BASE_URL}/chat/completions",
-                headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-                json={
-                    "model": eval_model,
-                    "messages": messages,
-                    "tools": tools,
-                    "tool_choice": "auto",
-                    "temperature": 0.01  # Low temperature for deterministic tool calling
-                }
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"❌ 计划 API 错误 ({response.status_code}): {response.text}")
-                return {"updated": False, "interview_complete": False}
-            
-            data = response.json()
-            logger.debug(f"📥 计划 API 响应: {json.dumps(data, indent=2, ensure_ascii=False)[:1000]}")
-            
-            message = data['choices'][0]['message']
-            
-            if not message.get('tool_calls'):
-                logger.info(f"ℹ️ 无工具调用。内容: {message.get('content', 'empty')[:100]}")
-                return {"updated": False, "interview_complete": False}
-            
-            # Process tool calls
-            updated_plan = plan_data.copy()
-            asked_item_id = None
-            for sec in updated_plan.get("sections", []):
-                for item in sec.get("items", []):
-                    if item.get("status") != "done" and item.get("asked"):
-                        asked_item_id = str(item.get("id"))
-                        break
-                if asked_item_id:
-                    break
+        response = await http_client.post(
+            "/chat/completions",
+            {
+                "model": eval_model,
+                "messages": messages,
+                "tools": tools,
+                "tool_choice": "auto",
+                "temperature": 0.01  # Low temperature for deterministic tool calling
+            },
+            timeout=30.0,
+            api_key=api_key,
+            stage="evaluate"
+        )
+        
+        if response.status_code != 200:
+            logger.error(f"❌ 计划 API 错误 ({response.status_code}): {response.text}")
+            return {"updated": False, "interview_complete": False}
+        
+        data = response.json()
+        usage_tracker.record(eval_model, data.get("usage"), "evaluate")
+        logger.debug(f"📥 计划 API 响应: {json.dumps(data, indent=2, ensure_ascii=False)[:1000]}")
+        
+        message = data['choices'][0]['message']
+        
+        if not message.get('tool_calls'):
+            logger.info(f"ℹ️ 无工具调用。内容: {message.get('content', 'empty')[:100]}")
+            return {"updated": False, "interview_complete": False}
+        
+        # Process tool calls
+        asked_item = plan.asked_item()
+        asked_item_id = asked_item.key if asked_item else None
+        
+        logger.info(f"🛠️ 处理 {len(message['tool_calls'])} 个工具调用")
+        
+        calls = []
+        for tool_call in message['tool_calls']:
+            fn_name = tool_call['function']['name']
+            try:
+                fn_args = json.loads(tool_call['function']['arguments'])
+            except:
+                metrics.json_parse_failures.inc(site="evaluate_tool_args")
+                logger.error(f"❌ Failed to parse args: {tool_call['function']['arguments']}")
+                continue
+                
+            logger.info(f"🔧 工具: {fn_name} | 参数: {fn_args}")
+            calls.append((fn_name, fn_args))
+
+        outcome = {}
+
+        def apply_calls(stored):
+            # Applied to the plan as stored now: a chat turn may have saved it since this evaluation started
+            plan = InterviewPlan.from_dict(stored)
             interview_complete = False
             final_result = None
             updates_made = 0
-            
-            logger.info(f"🛠️ 处理 {len(message['tool_calls'])} 个工具调用")
-            
-            for tool_call in message['tool_calls']:
-                fn_name = tool_call['function']['name']
-                try:
-                    fn_args = json.loads(tool_call['function']['arguments'])
-                except:
-                    logger.error(f"❌ Failed to parse args: {tool_call['function']['arguments']}")
-                    continue
-                    
-                logger.info(f"🔧 工具: {fn_name} | 参数: {fn_args}")
-                
+
+            for fn_name, fn_args in calls:
                 if fn_name == 'mark_item_complete':
                     item_id = str(fn_args.get('item_id'))
                     raw_score = fn_args.get('score', 0)
@@ -233,27 +289,17 @@ INSTRUCTIONS:
                     if score == 0: # Fallback if model forgot to assign score
                          score = 60
 
-                    for sec in updated_plan.get('sections', []):
-                        for item in sec['items']:
-                            if str(item['id']) == item_id:
-                                item['status'] = 'done'
-                                item['score'] = score
-                                item['evaluation'] = evaluation
-                                item['suggestion'] = suggestion
-                                item['locked'] = True  # Lock completed items
-                                updates_made += 1
-                                logger.info(f"✅ Marked item {item_id} complete: Score {score}")
+                    if plan.mark_item_complete(item_id, score, evaluation, suggestion):
+                        updates_made += 1
+                        logger.info(f"✅ Marked item {item_id} complete: Score {score}")
                                 
                 elif fn_name == 'modify_pending_item':
                     item_id = str(fn_args.get('item_id'))
                     new_content = fn_args.get('new_content', '')
                     
-                    for sec in updated_plan.get('sections', []):
-                        for item in sec['items']:
-                            if str(item['id']) == item_id and item.get('status') != 'done' and not item.get("asked") and not item.get("locked"):
-                                item['content'] = new_content
-                                updates_made += 1
-                                logger.info(f"📝 Modified pending item {item_id}")
+                    if plan.modify_pending_item(item_id, new_content):
+                        updates_made += 1
+                        logger.info(f"📝 Modified pending item {item_id}")
                                 
                 elif fn_name == 'insert_followup_question':
                     after_id = str(fn_args.get('after_item_id'))
@@ -264,22 +310,9 @@ INSTRUCTIONS:
                         logger.info(f"⏭️ Ignored follow-up insertion after {after_id} (asked item is {asked_item_id})")
                         continue
 
-                    inserted = False
-                    for sec in updated_plan.get('sections', []):
-                        if inserted: break
-                        items = sec['items']
-                        for i, item in enumerate(items):
-                            if str(item['id']) == after_id:
-                                items.insert(i + 1, {
-                                    "id": new_id,
-                                    "content": content,
-                                    "status": "pending",
-                                    "is_followup": True
-                                })
-                                inserted = True
-                                updates_made += 1
-                                logger.info(f"➕ Inserted follow-up {new_id} after {after_id}")
-                                break
+                    if plan.insert_followup_question(after_id, new_id, content):
+                        updates_made += 1
+                        logger.info(f"➕ Inserted follow-up {new_id} after {after_id}")
                                 
                 elif fn_name == 'complete_interview':
                     interview_complete = True
@@ -288,21 +321,29 @@ INSTRUCTIONS:
                         "summary": fn_args.get('summary', '')
                     }
                     logger.info(f"🏁 Interview completed! Final score: {final_result['final_score']}")
-            
-            # Cache updated plan
-            if updates_made > 0 or interview_complete:
-                updated_plan['interview_complete'] = interview_complete
-                if final_result:
-                    updated_plan['final_result'] = final_result
-                plan_cache[session_key] = updated_plan
-                logger.info(f"💾 Cached plan for {session_key[:8]} ({updates_made} updates)")
-            
-            return {
-                "updated": updates_made > 0,
-                "interview_complete": interview_complete,
-                "final_result": final_result
-            }
-            
+
+            outcome.update(updates_made=updates_made, interview_complete=interview_complete, final_result=final_result)
+            if not (updates_made > 0 or interview_complete):
+                return None
+            updated_plan = plan.to_dict()
+            updated_plan['interview_complete'] = interview_complete
+            if final_result:
+                updated_plan['final_result'] = final_result
+            return updated_plan
+
+        # Cache updated plan
+        if await update_plan(session_key, apply_calls, plan_data) is not None:
+            logger.info(f"💾 Cached plan for {session_key[:8]} ({outcome['updates_made']} updates)")
+        updates_made = outcome.get("updates_made", 0)
+        interview_complete = outcome.get("interview_complete", False)
+        final_result = outcome.get("final_result")
+        
+        return {
+            "updated": updates_made > 0,
+            "interview_complete": interview_complete,
+            "final_result": final_result
+        }
+        
     except Exception as e:
         logger.error(f"❌ Plan eval error: {str(e)}", exc_info=True)
         return {"updated": False, "interview_complete": False}
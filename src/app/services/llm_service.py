@@ -1,95 +1,207 @@
-import httpx
+import asyncio
 import json
+import time
 from fastapi import HTTPException
+from app.core import http_client, metrics
 from app.core.config import settings
 from app.core.logger import logger
+from app.services import usage_tracker
+from app.services.model_router import is_upstream_failure, router as model_router
 
-async def generate_thought_response(messages, tools=None, tool_choice="auto", model=None):
-    """Call LLM with fallback chain logic"""
-    
-    # Logic copied from main.py, using settings
+class ModelCallError(Exception):
+    pass
+
+async def _call_chain_model(config, messages, tools, tool_choice, stage):
+    """One non-streaming attempt against a single MODEL_CHAIN entry, reported to the router."""
+    payload = {
+        "model": config["model"],
+        "messages": messages,
+        "stream": False,
+        "max_tokens": 4096,
+        "temperature": 0.3,
+    }
+
+    if config["extra_body"]:
+        payload.update(config["extra_body"])
+
+    if tools:
+        payload["tools"] = tools
+        payload["tool_choice"] = tool_choice
+
+    started = time.monotonic()
+    try:
+        response = await http_client.post("/chat/completions", payload, timeout=60.0, stage=stage)
+    except asyncio.CancelledError:
+        # Hedge loser: record how long it had been running so the hedge delay does not drift down
+        model_router.record_censored(config, time.monotonic() - started)
+        raise
+    except Exception as e:
+        if is_upstream_failure(exc=e):
+            model_router.record_failure(config)
+        logger.warning(f"Model {config['name']} Exception: {str(e)}")
+        raise ModelCallError(str(e) or repr(e)) from e
+
+    if response.status_code != 200:
+        if is_upstream_failure(response.status_code):
+            model_router.record_failure(config)
+        logger.warning(f"Model {config['name']} Failed: {response.status_code} - {response.text}")
+        raise ModelCallError(f"HTTP {response.status_code}: {response.text}")
+
+    model_router.record_success(config, time.monotonic() - started)
+    data = response.json()
+    usage_tracker.record(config["model"], data.get("usage"), stage)
+    choice = data['choices'][0]
+    if choice['message'].get('tool_calls'):
+         return {"tool_calls": choice['message']['tool_calls']}
+    return choice['message']['content']
+
+async def generate_thought_response(messages, tools=None, tool_choice="auto", model=None, stage="llm"):
+    """Call LLM over MODEL_CHAIN with hedging and circuit breaking.
+
+    The healthiest-first chain comes from the router. If the current model has not answered
+    within its hedge delay (a latency percentile), the next model is fired as well and the
+    first successful answer wins; failures fall through to the next model immediately.
+    `model` is accepted for call-site compatibility but the chain always decides.
+    """
+    chain = model_router.plan_chain(settings.MODEL_CHAIN)
+    pending = {}
+    next_idx = 0
     last_exception = None
 
-    # If model is explicitly provided (and not None), user might want to bypass chain?
-    # Original logic: "So we ignore the `model` param unless we want to force something else, instead we iterate through MODEL_CHAIN."
-    # But current code ignores `model` param passed to function and iterates chain.
-    # We will keep that behavior but allow override if we really want to? 
-    # Actually the original code just ignored `model` arg completely in the loop.
-    
-    chain = settings.MODEL_CHAIN
-    
-    for config in chain:
-        current_model = config["model"]
-        extra_body = config["extra_body"]
-        logger.info(f"尝试模型: {config['name']} ({current_model})...")
+    def launch(reason=None):
+        nonlocal next_idx
+        config = chain[next_idx]
+        next_idx += 1
+        logger.info(f"尝试模型: {config['name']} ({config['model']})...")
+        if reason:
+            metrics.llm_fallbacks.inc(model=config["model"], reason=reason)
+        task = asyncio.create_task(_call_chain_model(config, messages, tools, tool_choice, stage))
+        pending[task] = config
+        return config
+
+    try:
+        newest = launch()
+        while pending:
+            hedge_after = model_router.hedge_delay(newest) if next_idx < len(chain) else None
+            done, _ = await asyncio.wait(pending.keys(), timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                logger.info(f"⏱️ {newest['name']} 超过 {hedge_after:.1f}s 未返回，对冲请求下一个模型")
+                newest = launch("hedge")
+                continue
+
+            for task in done:
+                config = pending.pop(task)
+                if task.exception() is None:
+                    if next_idx > 1:
+                        logger.info(f"🏁 对冲/回退胜出: {config['name']}")
+                    return task.result()
+                last_exception = str(task.exception())
+
+            if not pending and next_idx < len(chain):
+                newest = launch("failure")
+    finally:
+        # Cancel hedging losers (or everything, if the caller itself was cancelled)
+        for task in pending:
+            task.cancel()
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            payload = {
-                "model": current_model,
-                "messages": messages,
-                "stream": False,
-                "max_tokens": 4096,
-                "temperature": 0.3,
-            }
-            
-            if extra_body:
-                payload.update(extra_body)
-            
-            if tools:
-                payload["tools"] = tools
-                payload["tool_choice"] = tool_choice
-
-            try:
-                response = await client.post(
-                    f"{settings.BASE_URL}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {settings.API_KEY}",
-                        "Content-Type": "application/json"
-                    },
-                    json=payload
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    choice = data['choices'][0]
-                    if choice['message'].get('tool_calls'):
-                         return {"tool_calls": choice['message']['tool_calls']}
-                    return choice['message']['content']
-                
-                logger.warning(f"Model {config['name']} Failed: {response.status_code} - {response.text}")
-                last_exception = f"HTTP {response.status_code}: {response.text}"
-
-            except Exception as e:
-                logger.warning(f"Model {config['name']} Exception: {str(e)}")
-                last_exception = str(e)
-                continue 
-    
     logger.critical("All models in chain failed.")
     raise HTTPException(status_code=500, detail=f"All AI models failed. Last error: {last_exception}")
 
-async def call_vision_model(messages):
-    async with httpx.AsyncClient(timeout=30.0) as client:
+async def stream_thought_response(messages):
+    """Stream reply tokens from the fallback chain.
+
+    Falls through to the next model only while nothing has been yielded yet;
+    once tokens reach the caller, a mid-stream failure is raised as-is.
+    """
+    last_exception = None
+
+    for attempt, config in enumerate(model_router.plan_chain(settings.MODEL_CHAIN)):
+        current_model = config["model"]
+        logger.info(f"尝试模型 (流式): {config['name']} ({current_model})...")
+        if attempt:
+            metrics.llm_fallbacks.inc(model=current_model, reason="failure")
+
+        payload = {
+            "model": current_model,
+            "messages": messages,
+            "stream": True,
+            "stream_options": {"include_usage": True},  # Final chunk carries the token usage
+            "max_tokens": 4096,
+            "temperature": 0.3,
+        }
+        if config["extra_body"]:
+            payload.update(config["extra_body"])
+
+        started = False
+        usage = None
         try:
-            response = await client.post(
-                f"{settings.BASE_URL}/chat/completions",
-                headers={"Authorization": f"Bearer {settings.API_KEY}", "Content-Type": "application/json"},
-                json={
-                    "model": settings.MODEL_VISION,
-                    "messages": messages,
-                    "max_tokens": 512,
-                    "temperature": 0.1
-                }
-            )
-
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=f"Vision API Error: {response.text}")
-
-            data = response.json()
-            return data['choices'][0]['message']['content']
+            async with http_client.stream("/chat/completions", payload, timeout=60.0, stage="reply") as response:
+                if response.status_code != 200:
+                    if is_upstream_failure(response.status_code):
+                        model_router.record_failure(config)
+                    body = (await response.aread()).decode("utf-8", errors="ignore")
+                    logger.warning(f"Model {config['name']} Failed: {response.status_code} - {body}")
+                    last_exception = f"HTTP {response.status_code}: {body}"
+                    continue
+
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except json.JSONDecodeError:
+                        continue
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    choices = chunk.get("choices") or []
+                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if delta:
+                        started = True
+                        yield delta
+            model_router.record_success(config)
+            usage_tracker.record(current_model, usage, "reply")
+            return
 
         except Exception as e:
-            logger.error(f"Vision Analysis Error: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
+            if is_upstream_failure(exc=e):
+                model_router.record_failure(config)
+            if started:
+                raise
+            logger.warning(f"Model {config['name']} Exception: {str(e)}")
+            last_exception = str(e)
+            continue
+
+    logger.critical("All models in chain failed.")
+    raise HTTPException(status_code=500, detail=f"All AI models failed. Last error: {last_exception}")
+
+async def call_vision_model(messages):
+    try:
+        response = await http_client.post(
+            "/chat/completions",
+            {
+                "model": settings.MODEL_VISION,
+                "messages": messages,
+                "max_tokens": 512,
+                "temperature": 0.1
+            },
+            timeout=30.0,
+            stage="vision"
+        )
+
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=f"Vision API Error: {response.text}")
+
+        data = response.json()
+        usage_tracker.record(settings.MODEL_VISION, data.get("usage"), "vision")
+        return data['choices'][0]['message']['content']
+
+    except Exception as e:
+        logger.error(f"Vision Analysis Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 async def transcribe_audio(audio_b64, mime_type="audio/wav"):
     sense_messages = [
@@ -106,13 +218,15 @@ async def transcribe_audio(audio_b64, mime_type="audio/wav"):
         }
     ]
 
-    async with httpx.AsyncClient(timeout=90.0) as client:  # Increased from 30s to 90s
-        response = await client.post(
-            f"{settings.BASE_URL}/chat/completions",
-            headers={"Authorization": f"Bearer {settings.API_KEY}", "Content-Type": "application/json"},
-            json={"model": settings.MODEL_SENSE, "messages": sense_messages, "stream": False}
-        )
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail=f"Sense Error: {response.text}")
+    response = await http_client.post(
+        "/chat/completions",
+        {"model": settings.MODEL_SENSE, "messages": sense_messages, "stream": False},
+        timeout=90.0,
+        stage="stt"
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=f"Sense Error: {response.text}")
 
-        return response.json()['choices'][0]['message']['content']
+    data = response.json()
+    usage_tracker.record(settings.MODEL_SENSE, data.get("usage"), "stt")
+    return data['choices'][0]['message']['content']
@@ -0,0 +1,134 @@
+import time
+from collections import deque
+import httpx
+from app.core.config import settings
+from app.core.logger import logger
+
+
+def is_upstream_failure(status_code=None, exc=None):
+    """Whether an outcome says something about the model's health.
+
+    Only 5xx, 429, timeouts and transport errors count towards the circuit breaker; other 4xx
+    mean the request itself was bad and would fail on any model.
+    """
+    if exc is not None:
+        return isinstance(exc, httpx.TransportError)
+    return status_code >= 500 or status_code == 429
+
+
+class ModelHealth:
+    """Rolling latency/error statistics and circuit state for one chain entry."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latency_ewma = None
+        self.error_ewma = 0.0
+        self.latencies = deque(maxlen=settings.ROUTER_LATENCY_WINDOW)
+        self.calls = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_at = 0.0
+
+    def record_success(self, latency=None):
+        alpha = settings.ROUTER_EWMA_ALPHA
+        self.calls += 1
+        self.error_ewma = (1 - alpha) * self.error_ewma
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        if latency is not None:
+            self.latencies.append(latency)
+            self.latency_ewma = latency if self.latency_ewma is None else (1 - alpha) * self.latency_ewma + alpha * latency
+
+    def record_censored(self, elapsed):
+        """A request cancelled after `elapsed` seconds (a hedge loser): its latency is at least that.
+
+        Without these samples only the winners' latencies are kept and the hedge delay keeps
+        shrinking towards ROUTER_HEDGE_MIN_DELAY.
+        """
+        self.latencies.append(elapsed)
+
+    def record_failure(self):
+        alpha = settings.ROUTER_EWMA_ALPHA
+        self.calls += 1
+        self.error_ewma = (1 - alpha) * self.error_ewma + alpha
+        self.consecutive_failures += 1
+        tripped = self.consecutive_failures >= settings.CIRCUIT_FAILURE_THRESHOLD or (
+            self.calls >= settings.ROUTER_MIN_SAMPLES and self.error_ewma >= settings.CIRCUIT_ERROR_RATE
+        )
+        if tripped:
+            self.open_until = time.monotonic() + settings.CIRCUIT_COOLDOWN
+            logger.warning(f"🚧 熔断开启: {self.name} (连续失败 {self.consecutive_failures}, 错误率 {self.error_ewma:.2f})")
+
+    def allows_request(self, now):
+        if not self.open_until:
+            return True
+        if now < self.open_until:
+            return False
+        # Half-open: after the cooldown let one trial through per cooldown period
+        if now - self.trial_at >= settings.CIRCUIT_COOLDOWN:
+            self.trial_at = now
+            return True
+        return False
+
+    def latency_percentile(self, q):
+        if len(self.latencies) < settings.ROUTER_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "latency_p_hedge": self.latency_percentile(settings.ROUTER_HEDGE_PERCENTILE),
+            "error_rate": round(self.error_ewma, 3),
+            "calls": self.calls,
+            "circuit_open": self.open_until > time.monotonic(),
+        }
+
+
+class ModelRouter:
+    """Orders MODEL_CHAIN by health and decides when to hedge to the next model."""
+
+    def __init__(self):
+        self._health = {}
+
+    def health(self, config):
+        name = config["name"]
+        if name not in self._health:
+            self._health[name] = ModelHealth(name)
+        return self._health[name]
+
+    def plan_chain(self, chain):
+        """Chain entries to try, in configured order, skipping open circuits.
+
+        If every circuit is open, the full chain is returned so requests still go out.
+        """
+        now = time.monotonic()
+        available = [c for c in chain if self.health(c).allows_request(now)]
+        skipped = [c["name"] for c in chain if c not in available]
+        if skipped:
+            logger.info(f"🚧 跳过熔断中的模型: {', '.join(skipped)}")
+        return available or list(chain)
+
+    def hedge_delay(self, config):
+        """Seconds to wait on `config` before firing a hedged request to the next model."""
+        observed = self.health(config).latency_percentile(settings.ROUTER_HEDGE_PERCENTILE)
+        delay = observed if observed is not None else settings.ROUTER_HEDGE_DEFAULT_DELAY
+        return max(settings.ROUTER_HEDGE_MIN_DELAY, min(settings.ROUTER_HEDGE_MAX_DELAY, delay))
+
+    def record_success(self, config, latency=None):
+        self.health(config).record_success(latency)
+
+    def record_censored(self, config, elapsed):
+        self.health(config).record_censored(elapsed)
+
+    def record_failure(self, config):
+        self.health(config).record_failure()
+
+    def snapshot(self):
+        return [h.snapshot() for h in self._health.values()]
+
+
+router = ModelRouter()
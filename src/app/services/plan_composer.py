@@ -0,0 +1,226 @@
+import hashlib
+import json
+import random
+import re
+from app.core import metrics
+from app.core.config import settings
+from app.core.logger import logger
+from app.question_bank.retrieval import get_pack_index
+from app.question_bank.service import primary_tag
+from app.services import llm_service
+
+# Builds interview plans locally from the question pack: sections come from the questions'
+# primary tag, sections and items are picked by resume relevance (BM25), and ties are broken
+# by a jitter seeded from session_id, so a session always gets the same plan. The LLM only
+# writes the summary and greeting (see `personalize`) and, when the pack is not in the
+# session's language, translates the picked questions and section titles in the same call.
+
+_OPENER_TAGS = ("intro", "project")
+_JSON_BLOCK_RE = re.compile(r'```json\s*(.*?)\s*```', re.DOTALL)
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+_CJK_RE = re.compile(r"[\u3400-\u9fff]")
+
+
+def _rng(session_id):
+    return random.Random(int(hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:16], 16))
+
+
+def _difficulties(pack):
+    """Difficulty per question index from the pack's difficulty index (5 when unrated)."""
+    difficulty = [5] * len(pack.questions)
+    for level, members in pack.difficulty_levels().items():
+        if level is not None:
+            for i in members:
+                difficulty[i] = level
+    return difficulty
+
+
+def _section_title(questions):
+    topics = list(dict.fromkeys(q.get("topic") for q in questions if q.get("topic")))
+    return " / ".join(topics[:3]) or primary_tag(questions[0])
+
+
+def _pick_opener(pack, scores, difficulty):
+    """The warm-up question: an intro/project question, easiest and most relevant first."""
+    openers = sorted({i for tag in _OPENER_TAGS for i in pack.indices_with_tag(tag)})
+    if not openers:
+        return None
+    return min(openers, key=lambda i: (difficulty[i], -scores[i], i))
+
+
+def compose_plan(pack, resume_text, scenario, session_id, sections=None, items_per_section=None):
+    """Deterministic plan for (pack version, resume, session_id), in the LLM plan's JSON shape."""
+    sections = sections or settings.PLAN_SECTIONS
+    items_per_section = items_per_section or settings.PLAN_ITEMS_PER_SECTION
+    rng = _rng(session_id)
+    scores = get_pack_index(pack).scores(resume_text)
+    # Per-session jitter breaks ties (and the all-zero scores of an empty resume) differently per session
+    jitter = [rng.random() * 0.5 for _ in range(len(pack.questions))]
+    # Grouping and ordering use the pack's tag/difficulty indexes; only the picked questions are decoded
+    difficulty = _difficulties(pack)
+
+    opener = _pick_opener(pack, scores, difficulty)
+
+    groups = {}
+    for tag, members in pack.primary_tag_groups().items():
+        members = [i for i in members if i != opener]
+        if members:
+            groups[tag] = sorted(members, key=lambda i: -(scores[i] + jitter[i]))
+
+    def group_rank(tag):
+        # Mean over a full section, so small tags cannot win on a single lucky question
+        top = groups[tag][:items_per_section]
+        return -sum(scores[i] + jitter[i] for i in top) / items_per_section
+
+    chosen_tags = sorted(groups, key=lambda tag: (group_rank(tag), tag))[: max(1, sections - (1 if opener is not None else 0))]
+    phases = [groups[tag][:items_per_section] for tag in chosen_tags]
+    # Easier phases first, and easier questions first inside a phase
+    phases = [sorted(p, key=lambda i: (difficulty[i], i)) for p in phases]
+    phases.sort(key=lambda p: (sum(difficulty[i] for i in p) / len(p), p[0]))
+    if opener is not None:
+        phases.insert(0, [opener])
+
+    plan_sections = []
+    next_id = 1
+    for phase in phases:
+        questions = [pack.questions[i] for i in phase]
+        items = []
+        for q in questions:
+            items.append({"id": str(next_id), "bank_id": q["id"], "content": q["question"], "status": "pending"})
+            next_id += 1
+        plan_sections.append({"title": _section_title(questions), "items": items})
+
+    return {
+        "summary": "",
+        "meta": {
+            "scenario": scenario,
+            "session_id": session_id,
+            "question_pack_id": pack.pack_id,
+            "question_pack_version": pack.version,
+            "composer": "local",
+        },
+        "sections": plan_sections,
+    }
+
+
+def default_greeting(template, language):
+    if language.startswith("zh"):
+        return f"你好，欢迎参加{template['name']}面试，我们开始吧。"
+    return f"Hi, welcome to the {template.get('name_en', template['name'])} interview. Let's get started."
+
+
+def _is_chinese(language):
+    return language.lower().startswith("zh")
+
+
+def plan_language(plan):
+    """"zh" or "en" by the script of the plan's question text (packs are Chinese or English)."""
+    text = "".join(item["content"] for sec in plan.get("sections", []) for item in sec["items"])
+    if not text:
+        return None
+    return "zh" if len(_CJK_RE.findall(text)) * 5 >= len(text) else "en"
+
+
+def needs_localization(plan, language):
+    current = plan_language(plan)
+    return current is not None and (current == "zh") != _is_chinese(language)
+
+
+def _parse_json(reply_text):
+    code_block = _JSON_BLOCK_RE.search(reply_text)
+    if code_block:
+        json_str = code_block.group(1)
+    else:
+        json_match = _JSON_OBJECT_RE.search(reply_text)
+        json_str = json_match.group(0) if json_match else ""
+    try:
+        data = json.loads(json_str)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _translations(data, plan):
+    """Section titles and item texts from a reply, or None unless every one of them is there."""
+    titles, items = data.get("titles"), data.get("items")
+    if not isinstance(titles, list) or not isinstance(items, dict) or len(titles) != len(plan["sections"]):
+        return None
+    if not all(isinstance(t, str) and t.strip() for t in titles):
+        return None
+    texts = {}
+    for sec in plan["sections"]:
+        for item in sec["items"]:
+            text = items.get(item["id"])
+            if not isinstance(text, str) or not text.strip():
+                return None
+            texts[item["id"]] = text.strip()
+    return {"titles": [t.strip() for t in titles], "items": texts}
+
+
+async def personalize(resume_text, template, language, plan=None):
+    """Candidate summary and a one-line greeting from the LLM; {} on failure or when disabled.
+
+    If `plan` is in another language than the session, the same call translates its section
+    titles and items, returned under "translations" (left out unless complete).
+    """
+    if not settings.PLAN_PERSONALIZE:
+        return {}
+    localize = plan is not None and needs_localization(plan, language)
+    fields = '"summary": "2-3 sentence professional summary of the candidate", "greeting": "1-2 sentence friendly welcome addressed to the candidate"'
+    if localize:
+        fields += ', "titles": ["each section title, translated, same order"], "items": {"<item id>": "the item\'s question, translated"}'
+    system_prompt = f"""You are {template['role']} opening a {template['name']} interview.
+Read the candidate's resume and return ONLY a JSON object (no markdown, no extra text):
+{{{fields}}}
+All fields MUST be in {language}. The greeting must NOT ask any question; the first question is appended separately."""
+    user_content = f"[Candidate Resume START]\n{resume_text}\n[Candidate Resume END]"
+    if localize:
+        source = {
+            "titles": [sec["title"] for sec in plan["sections"]],
+            "items": {item["id"]: item["content"] for sec in plan["sections"] for item in sec["items"]},
+        }
+        system_prompt += f"\nAlso translate every section title and every item into {language}, keeping each question's meaning and the item ids unchanged."
+        user_content += f"\n\n[Interview Plan To Translate]\n{json.dumps(source, ensure_ascii=False)}"
+    try:
+        reply_text = await llm_service.generate_thought_response([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ], stage="personalize")
+    except Exception as e:
+        logger.warning(f"⚠️ 计划个性化失败，使用默认摘要与开场: {e}")
+        return {}
+    data = _parse_json(reply_text)
+    if not data:
+        metrics.json_parse_failures.inc(site="personalize")
+    personal = {k: data[k].strip() for k in ("summary", "greeting") if isinstance(data.get(k), str) and data[k].strip()}
+    if localize:
+        translations = _translations(data, plan)
+        if translations is None:
+            logger.warning(f"⚠️ 计划翻译不完整，保留题库原文 ({language})")
+        else:
+            personal["translations"] = translations
+    return personal
+
+
+def finalize_plan(plan, personal, template, language):
+    """Merge the personalization pass into a composed plan and build `initial_greeting`.
+
+    A plan left in another language than the session (no usable translation) gets the
+    default greeting in the plan's own language, so the opening does not mix languages.
+    """
+    translations = personal.get("translations")
+    if translations:
+        for sec, title in zip(plan["sections"], translations["titles"]):
+            sec["title"] = title
+            for item in sec["items"]:
+                item["content"] = translations["items"][item["id"]]
+        plan["meta"]["language"] = language
+    plan["summary"] = personal.get("summary") or plan.get("summary") or ""
+    greeting = personal.get("greeting") or default_greeting(template, language)
+    if not translations and needs_localization(plan, language):
+        language = "zh-CN" if plan_language(plan) == "zh" else "en-US"
+        greeting = default_greeting(template, language)
+    first_item = next((item for sec in plan["sections"] for item in sec["items"]), None)
+    separator = "" if _is_chinese(language) else " "
+    plan["initial_greeting"] = f"{greeting}{separator}{first_item['content']}" if first_item else greeting
+    return plan
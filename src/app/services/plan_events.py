@@ -0,0 +1,67 @@
+import asyncio
+import time
+from app.core.config import settings
+
+# Per-session wake-ups for plan watchers (long-poll / SSE). Writers in this process wake
+# waiters immediately. Writes made by another worker are picked up by one shared store
+# re-check per session (not one per waiter), and only the shared backends need it.
+_events = {}   # session_key -> asyncio.Event, replaced after every wake-up
+_waiters = {}  # session_key -> requests currently waiting
+_pollers = {}  # session_key -> re-check task
+
+
+def plan_version(plan):
+    if not isinstance(plan, dict):
+        return 0
+    try:
+        return int(plan.get("plan_version") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def notify(session_key):
+    event = _events.pop(session_key, None)
+    if event is not None:
+        event.set()
+
+
+async def _poll(store, session_key, version):
+    """Re-read the stored version every PLAN_PUSH_RECHECK_SECONDS while anyone is waiting."""
+    try:
+        while _waiters.get(session_key):
+            await asyncio.sleep(settings.PLAN_PUSH_RECHECK_SECONDS)
+            latest = plan_version(await store.aget(session_key))
+            if latest != version:
+                version = latest
+                notify(session_key)
+    finally:
+        _pollers.pop(session_key, None)
+
+
+async def wait_for_change(store, session_key, since, timeout):
+    """Return the stored plan once its version exceeds `since`, or None after `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    while True:
+        plan = await store.aget(session_key)
+        if plan is not None and plan_version(plan) > since:
+            return plan
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+
+        event = _events.get(session_key)
+        if event is None:
+            event = _events[session_key] = asyncio.Event()
+        _waiters[session_key] = _waiters.get(session_key, 0) + 1
+        if settings.SESSION_BACKEND != "memory" and session_key not in _pollers:
+            _pollers[session_key] = asyncio.create_task(_poll(store, session_key, plan_version(plan)))
+        try:
+            await asyncio.wait_for(event.wait(), timeout=remaining)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            _waiters[session_key] -= 1
+            if not _waiters[session_key]:
+                del _waiters[session_key]
+                if _events.get(session_key) is event:
+                    del _events[session_key]
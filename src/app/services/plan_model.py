@@ -0,0 +1,165 @@
+"""Typed, indexed view of an interview plan.
+
+Plans travel as JSON (`{"sections": [{"title", "items": [...]}], ...}`) between the LLM,
+the session store and the frontend. `InterviewPlan` wraps that shape with typed items and
+an id -> item index; each chat turn and evaluation builds one from the stored dict, applies
+its changes and writes `to_dict()` back, which keeps any keys this module does not know about.
+"""
+
+_ITEM_FIELDS = ("id", "bank_id", "content", "status", "asked", "score", "evaluation", "suggestion", "locked", "is_followup")
+
+
+class PlanItem:
+    __slots__ = _ITEM_FIELDS + ("extra", "section")
+
+    def __init__(self, section, data):
+        for name in _ITEM_FIELDS:
+            setattr(self, name, data.get(name))
+        self.extra = {k: v for k, v in data.items() if k not in _ITEM_FIELDS}
+        self.section = section
+
+    @property
+    def key(self):
+        return str(self.id)
+
+    @property
+    def done(self):
+        return self.status == "done"
+
+    def chat_line(self):
+        status_icon = "[x]" if self.done else "[ ]"
+        return f"  {status_icon} (ID: {self.id}) {self.content}\n"
+
+    def eval_line(self):
+        if self.done:
+            score = self.score if self.score is not None else "N/A"
+            return f"  ✅ [DONE] (ID: {self.id}) {self.content} - Score: {score}\n"
+        asked_flag = " 🟣[ASKED]" if self.asked else ""
+        return f"  ⬜ [PENDING{asked_flag}] (ID: {self.id}) {self.content}\n"
+
+    def to_dict(self):
+        data = {}
+        for name in _ITEM_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        data.update(self.extra)
+        return data
+
+
+class PlanSection:
+    __slots__ = ("plan", "title", "items", "extra")
+
+    def __init__(self, plan, data):
+        self.plan = plan
+        self.title = data.get("title", "")
+        self.items = [PlanItem(self, item) for item in data.get("items", []) if isinstance(item, dict)]
+        self.extra = {k: v for k, v in data.items() if k not in ("title", "items")}
+
+    def to_dict(self):
+        data = {"title": self.title, "items": [item.to_dict() for item in self.items]}
+        data.update(self.extra)
+        return data
+
+
+class InterviewPlan:
+    def __init__(self, data):
+        data = data if isinstance(data, dict) else {}
+        self.sections = [PlanSection(self, sec) for sec in data.get("sections", []) if isinstance(sec, dict)]
+        self.extra = {k: v for k, v in data.items() if k != "sections"}
+        self._key_order = list(data)
+        self._index = {}
+        for item in self.items():
+            self._index.setdefault(item.key, item)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data)
+
+    def to_dict(self):
+        data = dict(self.extra)
+        data["sections"] = [sec.to_dict() for sec in self.sections]
+        return {key: data[key] for key in self._key_order if key in data} | data
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, item_id):
+        return self._index.get(str(item_id))
+
+    def items(self):
+        for sec in self.sections:
+            yield from sec.items
+
+    # --- pointers ---
+
+    def first_pending(self):
+        return next((item for item in self.items() if not item.done), None)
+
+    def asked_item(self):
+        return next((item for item in self.items() if item.asked and not item.done), None)
+
+    def mark_asked(self):
+        """Flag the first pending item as the one the candidate is now answering.
+
+        Returns False when the flags were already that way, so callers can skip the write.
+        """
+        target = self.first_pending()
+        changed = False
+        for item in self.items():
+            if item is not target and item.asked and not item.done:
+                item.asked = None
+                changed = True
+        if target is not None and not target.asked:
+            target.asked = True
+            changed = True
+        return changed
+
+    # --- evaluator operations ---
+
+    def mark_item_complete(self, item_id, score, evaluation, suggestion):
+        item = self.get(item_id)
+        if item is None:
+            return False
+        item.status = "done"
+        item.score = score
+        item.evaluation = evaluation
+        item.suggestion = suggestion
+        item.locked = True  # Lock completed items
+        return True
+
+    def modify_pending_item(self, item_id, new_content):
+        item = self.get(item_id)
+        if item is None or item.done or item.asked or item.locked:
+            return False
+        item.content = new_content
+        return True
+
+    def insert_followup_question(self, after_item_id, new_id, content):
+        anchor = self.get(after_item_id)
+        if anchor is None or str(new_id) in self._index:
+            return False
+        section = anchor.section
+        item = PlanItem(section, {"id": new_id, "content": content, "status": "pending", "is_followup": True})
+        section.items.insert(section.items.index(anchor) + 1, item)
+        self._index[item.key] = item
+        return True
+
+    # --- prompt rendering ---
+
+    def render_chat_status(self):
+        parts = ["CURRENT INTERVIEW PLAN STATUS:\n"]
+        for sec in self.sections:
+            parts.append(f"- {sec.title}:\n")
+            parts.extend(item.chat_line() for item in sec.items)
+        return "".join(parts)
+
+    def render_eval_status(self):
+        parts = ["CURRENT INTERVIEW PLAN:\n"]
+        for sec in self.sections:
+            parts.append(f"\n## {sec.title}:\n")
+            parts.extend(item.eval_line() for item in sec.items)
+        return "".join(parts)
+
+    def pending_summaries(self):
+        return [f"ID {item.id}: {(item.content or '')[:40]}" for item in self.items() if not item.done]
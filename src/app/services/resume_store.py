@@ -0,0 +1,48 @@
+import hashlib
+from app.core.logger import logger
+from app.services import file_service
+from app.services.session_store import create_session_store
+
+# Parsed resumes keyed by a hash of the uploaded bytes (or pasted text). The key doubles as the
+# opaque `resume_id` clients send back instead of re-uploading the file or re-posting the text.
+resume_store = create_session_store("resumes")
+
+
+def _resume_id(kind, data):
+    return hashlib.sha256(kind.encode("utf-8") + b"\x00" + data).hexdigest()[:32]
+
+
+async def get_text(resume_id):
+    if not resume_id:
+        return None
+    entry = await resume_store.aget(resume_id)
+    return entry["text"] if entry else None
+
+
+async def resolve(file=None, manual_text=None, resume_id=None):
+    """(resume_id, text) from an upload, pasted text or a known resume_id, in that order.
+
+    Returns (None, "") when nothing usable was given (or the resume_id has expired).
+    """
+    if file:
+        content = await file_service.read_upload(file)
+        ext = (file.filename or "").lower().rsplit(".", 1)[-1]
+        rid = _resume_id(ext, content)
+        cached = await get_text(rid)
+        if cached is not None:
+            logger.info(f"📄 简历解析缓存命中 ({rid[:8]})")
+            return rid, cached
+        text = await file_service.extract_text(content, file.filename or "")
+        if text == file_service.PARSE_ERROR_TEXT:
+            return None, text  # Not cached: a retry may succeed
+        await resume_store.aset(rid, {"text": text})
+        return rid, text
+    if manual_text and manual_text.strip():
+        text = manual_text.strip()
+        rid = _resume_id("text", text.encode("utf-8"))
+        await resume_store.aset(rid, {"text": text})
+        return rid, text
+    text = await get_text(resume_id)
+    if text is not None:
+        return resume_id, text
+    return None, ""
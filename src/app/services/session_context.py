@@ -0,0 +1,65 @@
+from fastapi import HTTPException
+from app.core import metrics
+from app.core.logger import logger
+from app.services.session_store import create_session_store
+
+# Server-side interview context (resume text + conversation history + turn counter), keyed by
+# session_id. Lets /api/chat clients send only the new answer and their turn number.
+context_store = create_session_store("contexts")
+
+metrics.Gauge("sessions_active", "Interview sessions with a live server-side context", lambda: len(context_store), blocking=True)
+
+
+async def create_context(session_id, scenario, language, resume_text):
+    context = {
+        "session_id": session_id,
+        "scenario": scenario,
+        "language": language,
+        "resume_text": resume_text,
+        "history": [],
+        "turn": 0,
+    }
+    await context_store.aset(session_id, context)
+    return context
+
+
+async def get_context(session_id):
+    if not session_id:
+        return None
+    return await context_store.aget(session_id)
+
+
+async def require_context(session_id, turn):
+    """Load the context for a context-mode request, rejecting stale or unknown sessions with 409.
+
+    The client recovers from a 409 by re-sending its full state once (legacy mode).
+    """
+    context = await get_context(session_id)
+    if context is None:
+        raise HTTPException(status_code=409, detail={"code": "session_context_missing", "turn": None})
+    if turn != context["turn"]:
+        logger.warning(f"⚠️ 会话 {session_id[:8]} 客户端轮次 {turn} 与服务端 {context['turn']} 不一致")
+        raise HTTPException(status_code=409, detail={"code": "stale_turn", "turn": context["turn"]})
+    return context
+
+
+async def append_messages(session_id, messages, advance_turn=True, expected_turn=None):
+    """Append messages to the stored history; returns the new turn number (None if the context is gone).
+
+    With `expected_turn`, the turn is re-checked inside the atomic update: a concurrent request
+    for the same turn that committed first makes this one fail with 409 stale_turn.
+    """
+    def change(context):
+        if context is None:
+            return None
+        if expected_turn is not None and context["turn"] != expected_turn:
+            logger.warning(f"⚠️ 会话 {session_id[:8]} 提交时轮次已变为 {context['turn']}（期望 {expected_turn}）")
+            raise HTTPException(status_code=409, detail={"code": "stale_turn", "turn": context["turn"]})
+        # The memory backend hands back the live object; build a new one instead of mutating it
+        context = {**context, "history": context["history"] + list(messages)}
+        if advance_turn:
+            context["turn"] += 1
+        return context
+
+    context = await context_store.aupdate(session_id, change)
+    return context["turn"] if context is not None else None
@@ -0,0 +1,535 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+from app.core.config import settings
+from app.core.logger import logger
+
+
+class SessionStore:
+    """Interface shared by all session backends.
+
+    Values are JSON-serializable. Entries expire `ttl` seconds after their last read or
+    write (sliding TTL); beyond `max_entries` (and, where supported, roughly `max_bytes`)
+    the least recently used entries are evicted. Only the in-memory backend hands back
+    the stored object itself, so callers must `set` again after mutating a value.
+
+    Code on the event loop uses the `a*` variants: the shared backends block on sqlite3 or
+    socket I/O, so those run in a worker thread.
+    """
+
+    _SWEEP_EVERY = 64   # writes between expiry/limit sweeps (shared backends)
+    _REFRESH_BELOW = 0.5  # shared backends extend the TTL on read only once less than this fraction is left
+
+    def __init__(self, name, ttl, max_entries, max_bytes):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def update(self, key, change):
+        """Atomically replace the value with `change(current)` (current is None when missing).
+
+        If `change` returns None nothing is written. Returns the value written, or None.
+        `change` may run more than once when a concurrent writer gets in first.
+        """
+        raise NotImplementedError
+
+    async def aget(self, key, default=None):
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key, value):
+        await asyncio.to_thread(self.set, key, value)
+
+    async def adelete(self, key):
+        await asyncio.to_thread(self.delete, key)
+
+    async def aupdate(self, key, change):
+        return await asyncio.to_thread(self.update, key, change)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """Bounded in-process store; state is lost on restart and not shared between workers.
+
+    Because the TTL is uniform and refreshed on every touch, LRU order is also expiry
+    order, so expired entries are always at the front.
+    """
+
+    backend = "memory"
+
+    def __init__(self, name, ttl, max_entries, max_bytes):
+        super().__init__(name, ttl, max_entries, max_bytes)
+        self._lock = threading.RLock()  # Re-entered by update()
+        self._data = OrderedDict()  # key -> [expires_at, size, value]
+        self._bytes = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _approx_size(value):
+        try:
+            return len(json.dumps(value, ensure_ascii=False, default=str))
+        except (TypeError, ValueError):
+            return 0
+
+    def _drop(self, key):
+        entry = self._data.pop(key)
+        self._bytes -= entry[1]
+
+    def _purge_expired(self, now):
+        while self._data:
+            key, entry = next(iter(self._data.items()))
+            if entry[0] > now:
+                break
+            self._drop(key)
+            self.expired += 1
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            entry[0] = now + self.ttl
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def __contains__(self, key):
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            return key in self._data
+
+    def set(self, key, value):
+        size = self._approx_size(value)
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = [now + self.ttl, size, value]
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                if oldest == key:
+                    break
+                self._drop(oldest)
+                self.evicted += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def update(self, key, change):
+        with self._lock:
+            value = change(self.get(key))
+            if value is not None:
+                self.set(key, value)
+            return value
+
+    # Nothing here blocks, so skip the thread hop
+    async def aget(self, key, default=None):
+        return self.get(key, default)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+    async def adelete(self, key):
+        self.delete(key)
+
+    async def aupdate(self, key, change):
+        return self.update(key, change)
+
+    def __len__(self):
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            return len(self._data)
+
+    def stats(self):
+        data = super().stats()
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            data.update({
+                "entries": len(self._data),
+                "approx_bytes": self._bytes,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            })
+        return data
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store in a shared SQLite file (WAL mode) so every uvicorn worker sees the same sessions.
+
+    Expiry uses wall-clock time because several processes share the file. Expired rows are
+    swept on writes; LRU eviction orders by last-touched time. Reads only write back a new
+    expiry once the entry is past half its TTL, so a hot session costs one UPDATE per ttl/2.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, name, ttl, max_entries, max_bytes, path):
+        super().__init__(name, ttl, max_entries, max_bytes)
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL, touched_at REAL NOT NULL, PRIMARY KEY (ns, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_touched ON sessions (ns, touched_at)")
+
+    def _conn(self):
+        # sqlite3 connections are per-thread; route handlers and to_thread workers each get one
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires_at FROM sessions WHERE ns = ? AND key = ? AND expires_at > ?",
+            (self.name, key, now),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        if row[1] - now < self.ttl * self._REFRESH_BELOW:
+            conn.execute(
+                "UPDATE sessions SET expires_at = ?, touched_at = ? WHERE ns = ? AND key = ?",
+                (now + self.ttl, now, self.name, key),
+            )
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        self._write(self._conn(), key, value, time.time())
+
+    def _write(self, conn, key, value, now):
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (ns, key, value, size, expires_at, touched_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.name, key, payload, len(payload), now + self.ttl, now),
+        )
+        self._writes += 1
+        if self._writes % self._SWEEP_EVERY == 0:
+            self._sweep(conn, now)
+
+    def _sweep(self, conn, now):
+        conn.execute("DELETE FROM sessions WHERE ns = ? AND expires_at <= ?", (self.name, now))
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions WHERE ns = ?", (self.name,)
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Walk from least recently touched until both limits hold again
+        doomed = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM sessions WHERE ns = ? ORDER BY touched_at", (self.name,)
+        ):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((self.name, key))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM sessions WHERE ns = ? AND key = ?", doomed)
+        logger.info(f"🧹 会话存储 {self.name} 淘汰 {len(doomed)} 条")
+
+    def update(self, key, change):
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front, so no other writer can slip in between
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT value FROM sessions WHERE ns = ? AND key = ? AND expires_at > ?", (self.name, key, now)
+            ).fetchone()
+            value = change(json.loads(row[0]) if row else None)
+            if value is not None:
+                self._write(conn, key, value, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM sessions WHERE ns = ? AND key = ?", (self.name, key))
+
+    def __len__(self):
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM sessions WHERE ns = ? AND expires_at > ?", (self.name, time.time())
+        ).fetchone()
+        return row[0]
+
+    def stats(self):
+        data = super().stats()
+        count, total = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions WHERE ns = ? AND expires_at > ?",
+            (self.name, time.time()),
+        ).fetchone()
+        data.update({"entries": count, "approx_bytes": total, "path": self.path})
+        return data
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConflictError(Exception):
+    """An update lost the WATCH race too many times; the connection itself is fine."""
+
+
+class _RespConnection:
+    """Just enough of the Redis protocol (RESP2) for the session store; one per thread."""
+
+    def __init__(self, host, port, db, password, timeout):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile("rb")
+        if password:
+            self.command("AUTH", password)
+        if db:
+            self.command("SELECT", db)
+
+    def _send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        self._sock.sendall(b"".join(parts))
+
+    def _read(self):
+        line = self._file.readline()
+        if not line:
+            raise RedisError("connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RedisError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            data = self._file.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(body)
+            if size < 0:
+                return None
+            return [self._read() for _ in range(size)]
+        raise RedisError(f"unexpected reply: {line!r}")
+
+    def command(self, *args):
+        self._send(*args)
+        return self._read()
+
+    def pipeline(self, *commands):
+        for args in commands:
+            self._send(*args)
+        return [self._read() for _ in commands]
+
+    def close(self):
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class RedisSessionStore(SessionStore):
+    """Store on any Redis-protocol server (Redis, KeyDB, a local stand-in...).
+
+    Values live under `<prefix>:<name>:<key>` with a PX TTL, refreshed on read once less than
+    half of it is left. A sorted set of last-touched times enforces `max_entries` LRU; byte
+    limits are left to the server's own maxmemory policy.
+    """
+
+    backend = "redis"
+
+    def __init__(self, name, ttl, max_entries, max_bytes, url, prefix="easyinterview"):
+        super().__init__(name, ttl, max_entries, max_bytes)
+        parsed = urlparse(url)
+        self._host = parsed.hostname or "127.0.0.1"
+        self._port = parsed.port or 6379
+        self._db = int(parsed.path.lstrip("/") or 0)
+        self._password = parsed.password
+        self._local = threading.local()
+        self._ns = f"{prefix}:{name}"
+        self._index = f"{self._ns}:__lru__"
+        self._writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _RespConnection(self._host, self._port, self._db, self._password, timeout=2.0)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, fn):
+        # One reconnect attempt covers server restarts and idle disconnects
+        try:
+            return fn(self._conn())
+        except (OSError, RedisError) as e:
+            logger.warning(f"Redis 会话存储重连: {e}")
+            conn = getattr(self._local, "conn", None)
+            if conn is not None:
+                conn.close()
+            self._local.conn = None
+            return fn(self._conn())
+
+    def _key(self, key):
+        return f"{self._ns}:{key}"
+
+    def get(self, key, default=None):
+        now = time.time()
+        ttl_ms = int(self.ttl * 1000)
+        raw, left_ms = self._call(lambda c: c.pipeline(("GET", self._key(key)), ("PTTL", self._key(key))))
+        if raw is None:
+            self.misses += 1
+            return default
+        if left_ms < ttl_ms * self._REFRESH_BELOW:
+            self._call(lambda c: c.pipeline(
+                ("PEXPIRE", self._key(key), ttl_ms),
+                ("ZADD", self._index, "XX", now, key),
+            ))
+        self.hits += 1
+        return json.loads(raw)
+
+    def _write_commands(self, key, value, now):
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        return (
+            ("SET", self._key(key), payload, "PX", int(self.ttl * 1000)),
+            ("ZADD", self._index, now, key),
+        )
+
+    def set(self, key, value):
+        now = time.time()
+        self._call(lambda c: c.pipeline(*self._write_commands(key, value, now)))
+        self._writes += 1
+        if self._writes % self._SWEEP_EVERY == 0:
+            self._sweep(now)
+
+    _UPDATE_ATTEMPTS = 10
+
+    @staticmethod
+    def _unwatch(conn):
+        # Best effort: a broken connection is dropped (and its WATCH with it) by _call anyway
+        try:
+            conn.command("UNWATCH")
+        except (OSError, RedisError):
+            pass
+
+    def update(self, key, change):
+        # Optimistic: WATCH the key, and EXEC aborts (nil reply) if anyone wrote it meanwhile
+        def run(c):
+            for attempt in range(self._UPDATE_ATTEMPTS):
+                if attempt:
+                    # Jittered backoff so writers racing on one key stop colliding in lockstep
+                    time.sleep(random.uniform(0, 0.002 * attempt))
+                c.command("WATCH", self._key(key))
+                watching = True
+                try:
+                    raw = c.command("GET", self._key(key))
+                    value = change(json.loads(raw) if raw is not None else None)
+                    if value is None:
+                        return None
+                    # EXEC clears the WATCH whether it commits or aborts
+                    watching = False
+                    replies = c.pipeline(("MULTI",), *self._write_commands(key, value, time.time()), ("EXEC",))
+                finally:
+                    if watching:
+                        self._unwatch(c)
+                if replies[-1] is not None:
+                    return value
+            raise RedisConflictError(f"update of {key} kept conflicting")
+        # RedisConflictError is not a RedisError, so _call passes it through without reconnecting
+        value = self._call(run)
+        if value is not None:
+            self._writes += 1
+        return value
+
+    def _sweep(self, now):
+        def run(c):
+            c.command("ZREMRANGEBYSCORE", self._index, "-inf", now - self.ttl)
+            excess = c.command("ZCARD", self._index) - self.max_entries
+            if excess > 0:
+                doomed = c.command("ZRANGE", self._index, 0, excess - 1)
+                c.pipeline(
+                    ("DEL", *[self._key(k.decode()) for k in doomed]),
+                    ("ZREM", self._index, *doomed),
+                )
+        self._call(run)
+
+    def delete(self, key):
+        self._call(lambda c: c.pipeline(("DEL", self._key(key)), ("ZREM", self._index, key)))
+
+    def __len__(self):
+        return self._call(lambda c: c.command("ZCOUNT", self._index, time.time() - self.ttl, "+inf"))
+
+    def stats(self):
+        data = super().stats()
+        data.update({"entries": len(self), "server": f"{self._host}:{self._port}/{self._db}"})
+        return data
+
+
+def create_session_store(name, ttl=None, max_entries=None, max_bytes=None):
+    """Build the store for `name` on the backend selected by settings.SESSION_BACKEND."""
+    ttl = settings.SESSION_TTL_SECONDS if ttl is None else ttl
+    max_entries = settings.SESSION_MAX_ENTRIES if max_entries is None else max_entries
+    max_bytes = settings.SESSION_MAX_BYTES if max_bytes is None else max_bytes
+
+    backend = settings.SESSION_BACKEND
+    if backend == "sqlite":
+        return SQLiteSessionStore(name, ttl, max_entries, max_bytes, settings.SESSION_SQLITE_PATH)
+    if backend == "redis":
+        return RedisSessionStore(name, ttl, max_entries, max_bytes, settings.SESSION_REDIS_URL)
+    if backend != "memory":
+        logger.warning(f"⚠️ 未知 SESSION_BACKEND={backend}，使用内存存储")
+    return MemorySessionStore(name, ttl, max_entries, max_bytes)
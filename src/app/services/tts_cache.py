@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from app.core.config import settings
+from app.core.logger import logger
+
+
+def make_key(text, voice, model, speed):
+    raw = f"{model}\x00{voice}\x00{speed}\x00{text}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class TTSCache:
+    """Content-addressed mp3 cache: a small in-memory hot tier over a size-bounded disk LRU.
+
+    Disk recency survives restarts through file mtimes (bumped on every hit). Several
+    workers may share one directory; a file evicted by another worker is simply a miss.
+    """
+
+    def __init__(self, directory, max_bytes, hot_max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hot_max_bytes = hot_max_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> size on disk, oldest first
+        self._disk_bytes = 0
+        self._hot = OrderedDict()    # key -> mp3 bytes, oldest first
+        self._hot_bytes = 0
+        self.hits_hot = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def _load_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".mp3"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, name[:-4], st.st_size))
+        entries.sort()
+        for _, key, size in entries:
+            self._index[key] = size
+            self._disk_bytes += size
+        if entries:
+            logger.info(f"🔊 TTS 缓存已加载: {len(entries)} 条, {self._disk_bytes / 1024 / 1024:.1f} MB")
+        self._evict_disk()
+
+    def _remember_hot(self, key, data):
+        if len(data) > self.hot_max_bytes:
+            return
+        old = self._hot.pop(key, None)
+        if old is not None:
+            self._hot_bytes -= len(old)
+        self._hot[key] = data
+        self._hot_bytes += len(data)
+        while self._hot_bytes > self.hot_max_bytes and self._hot:
+            _, evicted = self._hot.popitem(last=False)
+            self._hot_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def get_hot(self, key):
+        with self._lock:
+            data = self._hot.get(key)
+            if data is not None:
+                self._hot.move_to_end(key)
+                if key in self._index:
+                    self._index.move_to_end(key)
+                self.hits_hot += 1
+            return data
+
+    def get(self, key):
+        """Hot tier, then disk. Blocking; call from a worker thread on the request path."""
+        data = self.get_hot(key)
+        if data is not None:
+            return data
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, None)
+        except FileNotFoundError:
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+                self.misses += 1
+            return None
+        with self._lock:
+            if key not in self._index:
+                self._index[key] = len(data)
+                self._disk_bytes += len(data)
+            self._index.move_to_end(key)
+            self._remember_hot(key, data)
+            self.hits_disk += 1
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self._disk_bytes -= old
+            self._index[key] = len(data)
+            self._disk_bytes += len(data)
+            self._remember_hot(key, data)
+            self._evict_disk()
+
+    async def aget(self, key):
+        data = self.get_hot(key)
+        if data is not None:
+            return data
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key, data):
+        await asyncio.to_thread(self.put, key, data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_hot + self.hits_disk + self.misses
+            return {
+                "entries": len(self._index),
+                "disk_bytes": self._disk_bytes,
+                "max_bytes": self.max_bytes,
+                "hot_entries": len(self._hot),
+                "hot_bytes": self._hot_bytes,
+                "hits_hot": self.hits_hot,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits_hot + self.hits_disk) / lookups, 4) if lookups else None,
+            }
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None and settings.TTS_CACHE_ENABLED:
+        _cache = TTSCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_BYTES, settings.TTS_CACHE_HOT_MAX_BYTES)
+    return _cache
+
+
+def _prewarm_texts(pack_ids=None):
+    """Every question text in the packs, plus the sentences the streaming endpoint will request."""
+    from app.question_bank import get_question_pack, list_available_packs
+    from app.services.tts_service import clean_tts_text, split_sentences
+
+    texts = ["面试已结束，感谢你的参与。"]
+    for pack_id in pack_ids or list_available_packs():
+        for q in get_question_pack(pack_id).questions:
+            text = clean_tts_text(q["question"])
+            texts.append(text)
+            texts.extend(split_sentences(text))
+    # Keep first-seen order, drop duplicates
+    return list(dict.fromkeys(t for t in texts if t))
+
+
+async def prewarm(voices, pack_ids=None, concurrency=4):
+    from app.core import http_client
+    from app.services.tts_service import synthesize
+
+    texts = await asyncio.to_thread(_prewarm_texts, pack_ids)
+    slots = asyncio.Semaphore(max(1, concurrency))
+    done = 0
+    failed = 0
+
+    async def render(text, voice):
+        nonlocal done, failed
+        async with slots:
+            try:
+                await synthesize(text, voice)
+            except Exception as e:
+                failed += 1
+                logger.warning(f"TTS 预热失败 ({voice}): {text[:30]} - {getattr(e, 'detail', None) or e}")
+            done += 1
+            if done % 50 == 0:
+                logger.info(f"🔥 TTS 预热进度 {done}/{len(texts) * len(voices)}")
+
+    logger.info(f"🔥 TTS 预热: {len(texts)} 段文本 x {len(voices)} 个音色")
+    try:
+        await asyncio.gather(*(render(t, v) for v in voices for t in texts))
+    finally:
+        await http_client.close_client()
+    logger.info(f"🔥 TTS 预热完成, 失败 {failed}, 缓存: {get_cache().stats()}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pre-render question bank texts into the TTS cache.")
+    parser.add_argument("--voices", default=",".join(settings.TTS_DEFAULT_VOICES), help="Comma-separated voice names")
+    parser.add_argument("--packs", default="", help="Comma-separated pack ids (default: all packs)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    if get_cache() is None:
+        raise SystemExit("TTS_CACHE_ENABLED is off; nothing to pre-warm.")
+    asyncio.run(prewarm(
+        [v.strip() for v in args.voices.split(",") if v.strip()],
+        [p.strip() for p in args.packs.split(",") if p.strip()] or None,
+        args.concurrency,
+    ))
@@ -0,0 +1,123 @@
+import asyncio
+import re
+from fastapi import HTTPException
+from app.core import http_client
+from app.core.config import settings
+from app.core.logger import logger
+from app.services import tts_cache
+
+# Sentence terminators for zh/en text; the terminator stays with its sentence
+_SENTENCE_RE = re.compile(r'[^。！？!?；;\n]+[。！？!?；;]*|\n+')
+
+
+def clean_tts_text(text):
+    """Strip what should not be spoken (thinking blocks, markdown emphasis)."""
+    # Preprocessing: Remove thinking tags if present
+    text = re.sub(r'<think>.*?</think>', '', text or "", flags=re.DOTALL).strip()
+    # Simple regex to remove markdown bold/italic
+    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
+    return text
+
+
+def split_sentences(text, min_chars=None):
+    """Split text into speakable sentences, merging fragments shorter than `min_chars`."""
+    min_chars = settings.TTS_SENTENCE_MIN_CHARS if min_chars is None else min_chars
+    # English full stops only end a sentence when followed by whitespace ("3.5" stays intact)
+    text = re.sub(r'\.\s+', '.\n', text)
+    sentences = []
+    buf = ""
+    for match in _SENTENCE_RE.finditer(text):
+        piece = match.group(0).strip()
+        if not piece:
+            continue
+        if buf and buf[-1].isascii() and piece[0].isascii():
+            buf += " "
+        buf += piece
+        if len(buf) >= min_chars:
+            sentences.append(buf)
+            buf = ""
+    if buf:
+        if sentences and len(buf) < min_chars:
+            sentences[-1] += buf
+        else:
+            sentences.append(buf)
+    return sentences
+
+
+_inflight = {}
+
+
+async def synthesize(text, voice):
+    """Render `text` to mp3 bytes with MOSS-TTSD, served from the TTS cache when possible."""
+    cache = tts_cache.get_cache()
+    if cache is None:
+        return await _synthesize_upstream(text, voice)
+
+    key = tts_cache.make_key(text, voice, settings.MODEL_TTS, settings.TTS_SPEED)
+    data = await cache.aget(key)
+    if data is not None:
+        return data
+
+    # Identical concurrent misses share one upstream call
+    pending = _inflight.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(_synthesize_and_store(cache, key, text, voice))
+        _inflight[key] = pending
+        pending.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(pending)
+
+
+async def _synthesize_and_store(cache, key, text, voice):
+    data = await _synthesize_upstream(text, voice)
+    if data:
+        await cache.aput(key, data)
+    return data
+
+
+async def _synthesize_upstream(text, voice):
+    # Add speaker tag [S1] as required by MOSS-TTSD model
+    text_with_tag = f"[S1]{text}"
+
+    response = await http_client.post(
+        "/audio/speech",
+        {
+            "model": settings.MODEL_TTS,
+            "input": text_with_tag,
+            "voice": f"{settings.MODEL_TTS}:{voice}",
+            "response_format": "mp3",
+            "speed": settings.TTS_SPEED
+        },
+        timeout=60.0,
+        stage="tts"
+    )
+
+    if response.status_code != 200:
+        logger.error(f"TTS Error {response.status_code}: {response.text}")
+        raise HTTPException(status_code=response.status_code, detail=f"TTS Provider Error: {response.text}")
+
+    return response.content
+
+
+async def stream_sentences(sentences, voice, concurrency=None):
+    """Yield mp3 audio per sentence, in order, while later sentences synthesize in parallel.
+
+    At most `concurrency` upstream calls run at once. A sentence that fails is logged and
+    skipped so the rest of the reply still plays.
+    """
+    slots = asyncio.Semaphore(max(1, concurrency or settings.TTS_STREAM_CONCURRENCY))
+
+    async def render(sentence):
+        async with slots:
+            return await synthesize(sentence, voice)
+
+    tasks = [asyncio.create_task(render(s)) for s in sentences]
+    try:
+        for i, task in enumerate(tasks):
+            try:
+                yield await task
+            except Exception as e:
+                logger.error(f"TTS sentence {i + 1}/{len(tasks)} failed: {getattr(e, 'detail', None) or e}")
+    finally:
+        # Client went away or we finished early: drop the sentences nobody will hear
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from app.core.config import settings
+from app.core.logger import logger
+
+# Token usage per (session, scenario, endpoint, stage, model). Upstream calls add to an in-memory
+# delta; a background task flushes deltas into a SQLite file shared by all workers, which the
+# stats endpoint queries. `endpoint` is the app route that triggered the call and `stage` the
+# upstream call kind (reply, evaluate, stt, vision, llm), so prompt bloat can be traced to its source.
+
+DIMENSIONS = ("session_id", "scenario", "endpoint", "stage", "model")
+
+_scope = contextvars.ContextVar("usage_scope", default=None)
+_pending = defaultdict(lambda: [0, 0, 0])  # dims -> [calls, prompt_tokens, completion_tokens]
+_lock = threading.Lock()
+_local = threading.local()
+_schema_ready = False
+
+
+def bind(endpoint=None, session_id=None, scenario=None):
+    """Attribute upstream calls made from the current request (and tasks it spawns) to these values."""
+    scope = dict(_scope.get() or {})
+    for key, value in (("endpoint", endpoint), ("session_id", session_id), ("scenario", scenario)):
+        if value:
+            scope[key] = value
+    _scope.set(scope)
+
+
+def record(model, usage, stage):
+    """Add one upstream response's `usage` block; calls without one are counted with 0 tokens."""
+    if not settings.USAGE_TRACKING:
+        return
+    usage = usage if isinstance(usage, dict) else {}
+    scope = _scope.get() or {}
+    key = (scope.get("session_id") or "", scope.get("scenario") or "", scope.get("endpoint") or "", stage, model or "")
+    with _lock:
+        entry = _pending[key]
+        entry[0] += 1
+        entry[1] += int(usage.get("prompt_tokens") or 0)
+        entry[2] += int(usage.get("completion_tokens") or 0)
+
+
+def _conn():
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(settings.USAGE_DB_PATH)), exist_ok=True)
+        conn = sqlite3.connect(settings.USAGE_DB_PATH, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        _local.conn = conn
+    if not _schema_ready:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            " session_id TEXT NOT NULL, scenario TEXT NOT NULL, endpoint TEXT NOT NULL, stage TEXT NOT NULL,"
+            " model TEXT NOT NULL, calls INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL,"
+            " completion_tokens INTEGER NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (session_id, scenario, endpoint, stage, model))"
+        )
+        _schema_ready = True
+    return conn
+
+
+def flush():
+    """Write pending deltas to the usage database; returns the number of rows touched."""
+    with _lock:
+        batch = list(_pending.items())
+        _pending.clear()
+    if not batch:
+        return 0
+    now = time.time()
+    try:
+        conn = _conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO usage (session_id, scenario, endpoint, stage, model, calls, prompt_tokens, completion_tokens, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (session_id, scenario, endpoint, stage, model) DO UPDATE SET"
+                " calls = calls + excluded.calls, prompt_tokens = prompt_tokens + excluded.prompt_tokens,"
+                " completion_tokens = completion_tokens + excluded.completion_tokens, updated_at = excluded.updated_at",
+                [(*key, calls, prompt, completion, now) for key, (calls, prompt, completion) in batch],
+            )
+    except sqlite3.Error as e:
+        # Put the deltas back so the next flush retries them
+        with _lock:
+            for key, (calls, prompt, completion) in batch:
+                entry = _pending[key]
+                entry[0] += calls
+                entry[1] += prompt
+                entry[2] += completion
+        logger.error(f"❌ 用量写入失败: {e}")
+        return 0
+    return len(batch)
+
+
+async def run_flusher(interval):
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(flush)
+
+
+def _cost(model, prompt_tokens, completion_tokens):
+    price = settings.USAGE_PRICES.get(model)
+    if not price:
+        return None
+    return round((prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000, 6)
+
+
+def query(group_by=("model", "endpoint"), session_id=None, scenario=None):
+    """Totals from the usage database (after a flush), grouped by a subset of DIMENSIONS."""
+    flush()
+    group_by = [d for d in group_by if d in DIMENSIONS]
+    where, params = [], []
+    if session_id:
+        where.append("session_id = ?")
+        params.append(session_id)
+    if scenario:
+        where.append("scenario = ?")
+        params.append(scenario)
+    sql = "SELECT session_id, scenario, endpoint, stage, model, calls, prompt_tokens, completion_tokens FROM usage"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    groups = {}
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": None}
+    for row in _conn().execute(sql, params):
+        dims = dict(zip(DIMENSIONS, row[:5]))
+        calls, prompt, completion = row[5:]
+        # Cost is priced per model, so it is computed per stored row before grouping
+        cost = _cost(dims["model"], prompt, completion)
+        key = tuple(dims[d] for d in group_by)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {**{d: dims[d] for d in group_by}, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": None}
+        group["calls"] += calls
+        group["prompt_tokens"] += prompt
+        group["completion_tokens"] += completion
+        totals["calls"] += calls
+        totals["prompt_tokens"] += prompt
+        totals["completion_tokens"] += completion
+        if cost is not None:
+            group["cost"] = round((group["cost"] or 0.0) + cost, 6)
+            totals["cost"] = round((totals["cost"] or 0.0) + cost, 6)
+
+    rows = sorted(groups.values(), key=lambda g: -g["prompt_tokens"])
+    return {"group_by": group_by, "totals": totals, "rows": rows}
@@ -68,6 +68,8 @@ const app = {
         recordingStartTime: 0,
         history: [],
         resumeText: "",
+        resumeId: null,  // Server-side parsed resume (sent instead of the file / text when known)
+        sessionTurn: null,  // Server-side session context turn (null = send full state)
 
         selectedScenario: 'tech_backend',
         selectedLanguage: 'zh-CN',
@@ -434,8 +436,11 @@ const app = {
             const data = await res.json();
             app.state.currentPlan = data;
             if (data.session_id) app.state.currentSessionId = data.session_id;
+            // Server keeps history/resume/plan for this session; later turns send only the turn number
+            app.state.sessionTurn = (typeof data.turn === 'number') ? data.turn : null;
             // Also store resume/context text for later
             if (data.resume_text) app.state.resumeText = data.resume_text;
+            app.state.resumeId = data.resume_id || null;
 
             app.showPlanModal();
 
@@ -608,6 +613,12 @@ const app = {
 
     confirmPlan: () => {
         document.getElementById('plan-modal').classList.add('hidden');
+        // analyze-resume returns the opening line with the plan (and records it server-side)
+        const opening = app.state.currentPlan?.opening;
+        if (opening) {
+            app.enterRoom(opening);
+            return;
+        }
         app.startInterviewRequest(app.state.selectedFile, document.getElementById('manual-context')?.value.trim());
     },
 
@@ -624,13 +635,23 @@ const app = {
         }
 
         const formData = new FormData();
-        if (file) formData.append('file', file);
-        if (manualText) formData.append('manual_text', manualText);
+        const contextMode = typeof app.state.sessionTurn === 'number' && app.state.currentSessionId;
+        if (!contextMode) {
+            if (app.state.resumeId) {
+                formData.append('resume_id', app.state.resumeId);
+            } else {
+                if (file) formData.append('file', file);
+                if (manualText) formData.append('manual_text', manualText);
+            }
+        }
 
         formData.append('scenario', app.state.selectedScenario);
         formData.append('language', app.state.selectedLanguage);
+        if (app.state.currentSessionId) {
+            formData.append('session_id', app.state.currentSessionId);
+        }
         const plan = app.state.currentPlan?.interview_plan || app.state.currentPlan;
-        if (plan) {
+        if (plan && !contextMode) {
             formData.append('interview_plan', JSON.stringify(plan));
         }
 
@@ -640,12 +661,19 @@ const app = {
                 body: formData
             });
 
+            if (res.status === 409 && app.state.resumeId) {
+                // Cached resume expired on the server: upload the file / text again
+                app.state.resumeId = null;
+                return app.startInterviewRequest(file, manualText);
+            }
             if (!res.ok) throw new Error("Upload Failed");
 
             const data = await res.json();
 
             // Store final text context
             if (data.resume_text) app.state.resumeText = data.resume_text;
+            if (data.resume_id) app.state.resumeId = data.resume_id;
+            if (typeof data.turn !== 'number') app.state.sessionTurn = null;
 
             app.enterRoom(data.reply);
 
@@ -714,7 +742,8 @@ const app = {
                 body: JSON.stringify({
                     images: frames,
                     current_topic: app.state.selectedScenario,
-                    language: app.state.selectedLanguage
+                    language: app.state.selectedLanguage,
+                    session_id: app.state.currentSessionId || null
                 })
             });
 
@@ -1028,11 +1057,9 @@ const app = {
         app.sendAudioToAI(blob);
     },
 
-    sendAudioToAI: async (blob) => {
+    sendAudioToAI: async (blob, forceFullState = false) => {
         const formData = new FormData();
         formData.append("file", blob, "recording.wav");
-        formData.append("history", JSON.stringify(app.state.history));
-        formData.append("resume_text", app.state.resumeText);
         formData.append("scenario", app.state.selectedScenario);
         formData.append("language", app.state.selectedLanguage);
         formData.append("difficulty", app.state.difficulty.toString());  // Add difficulty level
@@ -1040,29 +1067,56 @@ const app = {
             formData.append("session_id", app.state.currentSessionId);
         }
 
-        // Include Current Plan State for AI
-        if (app.state.currentPlan && app.state.currentPlan.interview_plan) {
-            formData.append("interview_plan", JSON.stringify(app.state.currentPlan.interview_plan));
-        } else if (app.state.currentPlan) {
-            formData.append("interview_plan", JSON.stringify(app.state.currentPlan));
+        const contextMode = !forceFullState && typeof app.state.sessionTurn === 'number' && app.state.currentSessionId;
+        if (contextMode) {
+            // Session-context mode: the server already holds history, resume and plan
+            formData.append("turn", app.state.sessionTurn.toString());
+        } else {
+            formData.append("history", JSON.stringify(app.state.history));
+            if (app.state.resumeId) {
+                formData.append("resume_id", app.state.resumeId);
+            } else {
+                formData.append("resume_text", app.state.resumeText);
+            }
+
+            // Include Current Plan State for AI
+            if (app.state.currentPlan && app.state.currentPlan.interview_plan) {
+                formData.append("interview_plan", JSON.stringify(app.state.currentPlan.interview_plan));
+            } else if (app.state.currentPlan) {
+                formData.append("interview_plan", JSON.stringify(app.state.currentPlan));
+            }
         }
 
         try {
-            const res = await fetch('/api/chat', {
+            const res = await fetch('/api/chat/stream', {
                 method: 'POST',
                 body: formData
             });
 
+            if (res.status === 409 && contextMode) {
+                // Server context expired or out of sync: re-send the full client state once
+                console.warn("Session context stale, re-sending full state");
+                app.state.sessionTurn = null;
+                return app.sendAudioToAI(blob, true);
+            }
+            if (res.status === 409 && app.state.resumeId) {
+                // Cached resume expired on the server: fall back to sending the text
+                app.state.resumeId = null;
+                return app.sendAudioToAI(blob, true);
+            }
+
             if (!res.ok) {
                 const errText = await res.text();
                 throw new Error("AI Backend Error: " + errText);
             }
-            const data = await res.json();
+            // Render tokens as they arrive; the final frame carries the full turn payload
+            const data = await app.readChatStream(res, (partial) => app.updateCurrentQuestion(partial));
 
             // Update session key if provided
             if (data.session_key) {
                 app.state.currentSessionKey = data.session_key;
             }
+            app.state.sessionTurn = (typeof data.turn === 'number') ? data.turn : null;
 
             // 解析 <hear> 标签 或 使用 data.transcript
             let aiResponseText = data.reply;
@@ -1135,60 +1189,120 @@ const app = {
         }
     },
 
-    startPlanPolling: (sessionKey) => {
-        if (app.state.planPollTimer) {
-            clearInterval(app.state.planPollTimer);
-            app.state.planPollTimer = null;
+    readChatStream: async (res, onPartial) => {
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let reply = "";
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let sep;
+            while ((sep = buffer.indexOf("\n\n")) !== -1) {
+                const frame = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+
+                let event = "message";
+                let payload = "";
+                frame.split("\n").forEach(line => {
+                    if (line.startsWith("event:")) event = line.slice(6).trim();
+                    else if (line.startsWith("data:")) payload += line.slice(5).trim();
+                });
+                if (!payload) continue;
+                const data = JSON.parse(payload);
+
+                if (event === "token") {
+                    reply += data.delta;
+                    if (onPartial) onPartial(reply);
+                } else if (event === "done") {
+                    return data;
+                } else if (event === "error") {
+                    if (data.detail && data.detail.code) {
+                        // Another request committed this turn first: re-send full state next time
+                        app.state.sessionTurn = null;
+                        throw new Error("AI Backend Error: " + data.detail.code);
+                    }
+                    throw new Error("AI Backend Error: " + data.detail);
+                }
+            }
         }
+        throw new Error("AI Backend Error: stream closed before completion");
+    },
 
-        const startAt = Date.now();
-        const timeoutMs = 8000;
-        const intervalMs = 500;
+    startPlanPolling: async (sessionKey) => {
+        // Long-poll with a plan_version cursor: the server answers once the background
+        // evaluation writes a newer plan (or when the wait expires), so each real change costs one request.
+        const token = {};
+        app.state.planPollToken = token;
 
-        app.state.planPollTimer = setInterval(async () => {
-            try {
-                if (Date.now() - startAt > timeoutMs) {
-                    clearInterval(app.state.planPollTimer);
-                    app.state.planPollTimer = null;
-                    return;
-                }
+        const current = app.state.currentPlan?.interview_plan || app.state.currentPlan;
+        let since = current?.plan_version || 0;
+        const deadline = Date.now() + 30000;
 
-                const res = await fetch(`/api/plan-status/${sessionKey}`);
+        while (app.state.planPollToken === token && Date.now() < deadline) {
+            try {
+                const res = await fetch(`/api/plan-status/${sessionKey}?since=${since}&wait=20`);
                 if (!res.ok) return;
                 const data = await res.json();
-                const plan = data?.plan;
-                if (!plan) return;
-
-                const current = app.state.currentPlan?.interview_plan || app.state.currentPlan;
-                const currentJson = current ? JSON.stringify(current) : "";
-                const nextJson = JSON.stringify(plan);
-                if (nextJson && nextJson !== currentJson) {
-                    app.state.currentPlan = plan;
-                    app.renderSidePanel(plan);
-
-                    if (plan.interview_complete && plan.final_result) {
-                        app.showScoreModal(plan.final_result);
-                    }
+                if (app.state.planPollToken !== token) return;
+                if (!data.changed || !data.plan) continue;
+
+                const plan = data.plan;
+                since = data.version;
+                app.state.currentPlan = plan;
+                app.renderSidePanel(plan);
 
-                    clearInterval(app.state.planPollTimer);
-                    app.state.planPollTimer = null;
+                if (plan.interview_complete && plan.final_result) {
+                    app.showScoreModal(plan.final_result);
                 }
+                return;
             } catch (e) {
-                clearInterval(app.state.planPollTimer);
-                app.state.planPollTimer = null;
+                return;
             }
-        }, intervalMs);
+        }
     },
 
     playTTS: async (text) => {
         try {
-            const res = await fetch('/api/tts', {
+            const res = await fetch('/api/tts/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ text: text, voice: app.state.currentVoice })
             });
             if (!res.ok) throw new Error("TTS Failed");
 
+            if (app.state.currentAudio) {
+                app.state.currentAudio.pause();
+                app.state.currentAudio = null;
+            }
+
+            // Progressive playback: start on the first sentence's mp3 while the rest streams in
+            if (window.MediaSource && MediaSource.isTypeSupported('audio/mpeg') && res.body) {
+                const mediaSource = new MediaSource();
+                const audio = new Audio(URL.createObjectURL(mediaSource));
+                app.state.currentAudio = audio;
+
+                mediaSource.addEventListener('sourceopen', async () => {
+                    const sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+                    sourceBuffer.mode = 'sequence';
+                    const reader = res.body.getReader();
+                    let started = false;
+                    while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        if (app.state.currentAudio !== audio) { reader.cancel(); return; }
+                        sourceBuffer.appendBuffer(value);
+                        await new Promise(resolve => sourceBuffer.addEventListener('updateend', resolve, { once: true }));
+                        if (!started) { started = true; audio.play(); }
+                    }
+                    if (mediaSource.readyState === 'open') mediaSource.endOfStream();
+                }, { once: true });
+                return;
+            }
+
             const blob = await res.blob();
             if (blob.size === 0) {
                 console.warn("TTS returned empty audio blob");
@@ -1196,11 +1310,6 @@ const app = {
             }
             const url = URL.createObjectURL(blob);
 
-            if (app.state.currentAudio) {
-                app.state.currentAudio.pause();
-                app.state.currentAudio = null;
-            }
-
             const audio = new Audio(url);
             app.state.currentAudio = audio;
             audio.play();
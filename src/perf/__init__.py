@@ -0,0 +1,4 @@
+"""Offline performance tooling: a mock SiliconFlow upstream, load tests and benchmarks.
+
+Run from `src/`, e.g. ``python -m perf.mock_upstream --port 9100``.
+"""
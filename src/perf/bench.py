@@ -0,0 +1,230 @@
+"""Micro-benchmarks for the server-side CPU hot paths, with a stored baseline.
+
+    cd src && python -m perf.bench                       # run, compare to the baseline if present
+    cd src && python -m perf.bench --save-baseline       # record the current numbers as baseline
+    cd src && python -m perf.bench -k plan --repeat 7    # only benchmarks whose name contains "plan"
+
+Each benchmark is timed per call (auto-ranged to roughly `--min-time` seconds per repeat) and
+reported as the median over repeats. With a baseline, any benchmark slower than
+`--threshold` (default 20%) is flagged and the exit status is 1. Baselines are
+machine-specific, so none is committed: record one on the machine that runs the comparison.
+CI does this per pull request, timing the base commit and then the head on the same runner.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("SILICONFLOW_API_KEY", "bench")  # Settings only; nothing calls upstream
+
+from app.api.routes.interview import extract_json_object
+from app.question_bank.registry import _PACK_DIR
+from app.question_bank.service import _render_cache, load_pack_from_file, render_pack_for_prompt
+from app.services import file_service, plan_composer
+from app.services.plan_model import InterviewPlan
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_BASELINE = HERE / "baselines" / "bench.json"
+
+_benchmarks = []
+
+
+def bench(name, setup=None):
+    """Register `fn` as benchmark `name`; `setup()` runs untimed before every call."""
+    def wrap(fn):
+        _benchmarks.append((name, fn, setup))
+        return fn
+    return wrap
+
+
+# --- Samples ---
+
+def _sample_plan(items, sections=4):
+    per_section = max(1, items // sections)
+    plan_sections = []
+    next_id = 1
+    for s in range(sections):
+        section_items = []
+        for _ in range(per_section if s < sections - 1 else items - per_section * (sections - 1)):
+            item = {"id": str(next_id), "bank_id": f"q{next_id}", "content": f"请解释第 {next_id} 个系统设计问题中的缓存一致性与降级策略。", "status": "pending"}
+            if next_id <= items // 3:
+                item.update(status="done", score=75, evaluation="回答完整，举例清晰。", suggestion="补充监控指标。")
+            elif next_id == items // 3 + 1:
+                item["asked"] = True
+            section_items.append(item)
+            next_id += 1
+        plan_sections.append({"title": f"阶段 {s + 1}", "items": section_items})
+    return {"summary": "候选人有五年后端经验。", "meta": {"scenario": "tech_backend"}, "sections": plan_sections, "initial_greeting": "你好"}
+
+
+def _sample_pdf(pages=3, lines=40):
+    """A small text PDF built by hand (PyPDF2 cannot write text)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(pages):
+        text = "".join(f"({'Senior backend engineer, Python Go Redis Kafka, page %d line %d' % (p, i)}) Tj 0 -14 Td " for i in range(lines))
+        stream = f"BT /F1 10 Tf 40 800 Td {text}ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_ref = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content_ref} 0 R /Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+
+def _sample_docx(paragraphs=120):
+    import docx
+    document = docx.Document()
+    for i in range(paragraphs):
+        document.add_paragraph(f"第 {i} 段：负责订单系统重构，使用 Redis 缓存与 Kafka 异步削峰，p99 延迟降低 80%。")
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+VISION_REPLIES = {
+    "clean": '{"metrics":{"confidence":55,"eye_contact":60,"attire":75,"clarity":70},"alert":{"level":"none","message_cn":null,"message_en":null}}',
+    "fenced": '```json\n{"metrics":{"confidence":"55%","eye_contact":0.6,"attire":7.5,"clarity":70},"alert":{"level":"warning","message_cn":"光线偏暗","message_en":"Too dark"}}\n```',
+    "noisy": "Sure! Here is my analysis of the frames. " * 40 + '{"metrics":{"confidence":55,"eye_contact":60,"attire":75,"clarity":70},"alert":{"level":"none","message_cn":null,"message_en":null}} Hope this helps.',
+}
+PERSONALIZE_REPLY = "```json\n" + json.dumps({"summary": "五年后端经验，熟悉高并发。" * 3, "greeting": "你好，欢迎参加面试。"}, ensure_ascii=False) + "\n```"
+
+
+# --- Benchmarks ---
+
+def _register_pack_benchmarks():
+    for path in sorted(_PACK_DIR.glob("*.json")):
+        pack_id = path.stem
+        pack = load_pack_from_file(pack_id, path)
+        bench(f"render_pack_for_prompt[{pack_id}]", setup=_render_cache.clear)(lambda pack=pack: render_pack_for_prompt(pack))
+        bench(f"load_pack_from_file[{pack_id}]")(lambda pack_id=pack_id, path=path: load_pack_from_file(pack_id, path))
+    bench("render_pack_for_prompt[cached]")(lambda pack=pack: render_pack_for_prompt(pack))
+
+
+for _name, _reply in VISION_REPLIES.items():
+    bench(f"extract_json_object[{_name}]")(lambda reply=_reply: extract_json_object(reply))
+bench("plan_composer._parse_json")(lambda: plan_composer._parse_json(PERSONALIZE_REPLY))
+
+for _size in (10, 50, 200):
+    _plan = _sample_plan(_size)
+    # A fresh InterviewPlan per call, as each chat turn and evaluation builds one from the stored dict
+    bench(f"plan.render_chat_status[{_size}]")(lambda plan=_plan: InterviewPlan.from_dict(plan).render_chat_status())
+    bench(f"plan.render_eval_status[{_size}]")(lambda plan=_plan: InterviewPlan.from_dict(plan).render_eval_status())
+    bench(f"plan.round_trip[{_size}]")(lambda plan=_plan: InterviewPlan.from_dict(plan).to_dict())
+
+_PDF = _sample_pdf()
+_DOCX = _sample_docx()
+# The CPU part of resume extraction (what runs inside the worker process)
+bench("extract_text[pdf-3p]")(lambda: file_service._extract_text(_PDF, "resume.pdf", 20))
+bench("extract_text[docx]")(lambda: file_service._extract_text(_DOCX, "resume.docx", 20))
+
+
+# --- Runner ---
+
+def _time_once(fn, setup):
+    if setup is not None:
+        setup()
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def measure(fn, setup, repeat, min_time):
+    # Auto-range: how many calls fit in min_time, judged from a warm-up call
+    warmup = max(_time_once(fn, setup), 1e-7)
+    number = max(1, min(100_000, int(min_time / warmup)))
+    per_call = []
+    for _ in range(repeat):
+        total = sum(_time_once(fn, setup) for _ in range(number))
+        per_call.append(total / number)
+    return {
+        "median_us": round(statistics.median(per_call) * 1e6, 3),
+        "min_us": round(min(per_call) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(per_call) * 1e6, 3) if len(per_call) > 1 else 0.0,
+        "calls": number * repeat,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EasyInterview micro-benchmarks")
+    parser.add_argument("-k", dest="filter", default=None, help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Target seconds per repeat")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--out", default=None, help="Also write this run's results as JSON")
+    args = parser.parse_args()
+
+    _register_pack_benchmarks()
+    selected = [b for b in _benchmarks if not args.filter or args.filter in b[0]]
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+    elif not args.save_baseline:
+        print(f"no baseline at {args.baseline}; record one with --save-baseline to compare runs")
+
+    results = {}
+    regressions = []
+    width = max(len(name) for name, _, _ in selected) if selected else 10
+    print(f"{'benchmark':<{width}}  {'median':>12}  {'baseline':>12}  change")
+    for name, fn, setup in selected:
+        result = measure(fn, setup, args.repeat, args.min_time)
+        results[name] = result
+        old = baseline.get(name)
+        change = ""
+        if old:
+            ratio = result["median_us"] / old["median_us"] - 1
+            change = f"{ratio * 100:+.1f}%"
+            if ratio > args.threshold:
+                regressions.append(name)
+                change += "  << REGRESSION"
+        print(f"{name:<{width}}  {result['median_us']:>10.1f}us  {(str(round(old['median_us'], 1)) + 'us') if old else '-':>12}  {change}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "machine": f"{platform.system()} {platform.machine()}",
+        "results": results,
+    }
+    if args.save_baseline:
+        if args.filter and os.path.exists(args.baseline):
+            # A filtered run updates only its own entries
+            with open(args.baseline, encoding="utf-8") as f:
+                merged = json.load(f)
+            merged["results"].update(results)
+            report = {**merged, **{k: report[k] for k in ("created_at", "python", "machine")}}
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"baseline saved to {args.baseline}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""Concurrent-candidate load test against a running (or spawned) app.
+
+Each simulated candidate runs the real flow: analyze-resume -> upload-resume -> N chat turns
+(each followed by TTS of the reply and a plan-status long-poll, then think time), while a
+side loop posts video frames to analyze-video every `--video-interval` seconds.
+
+The JSON report has p50/p95/p99 latency, throughput and error rate per endpoint, plus the
+server's RSS growth (Linux, when the server pid is known). Compare two runs with `--baseline`;
+`--max-error-rate` turns a run into a pass/fail check (CI runs a short one against the mock).
+
+    cd src && python -m perf.loadtest --spawn-mock --spawn-server --candidates 50 --turns 5 \\
+        --out perf/reports/run.json
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+try:
+    from PIL import Image
+except ImportError:  # Optional: frames are then random bytes (fine for the mock, not for a real model)
+    Image = None
+
+RESUMES = [
+    "张三，5 年后端开发经验，熟悉 Python、Go、Redis、Kafka，负责过订单系统的高并发重构。",
+    "李四，3 年 Java 开发，Spring Cloud 微服务，MySQL 分库分表，参与过支付对账系统。",
+    "Wang Wu, 4 years as a backend engineer. Built a recommendation API in Python/FastAPI with PostgreSQL and Celery.",
+]
+ANSWERS = [
+    "我负责订单服务的拆分，用 Redis 做了热点缓存，把 p99 从 800ms 降到 120ms。",
+    "当时用消息队列削峰，消费端做幂等，失败的消息进入死信队列人工补偿。",
+    "I would shard by user id and add a read replica before touching the write path.",
+    "这个我不太确定，但我的思路是先加监控定位瓶颈，再针对性优化。",
+]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = defaultdict(list)
+
+    async def call(self, name, coro):
+        started = time.monotonic()
+        try:
+            response = await coro
+        except Exception as e:
+            self._fail(name, time.monotonic() - started, f"{type(e).__name__}: {e}")
+            return None
+        elapsed = time.monotonic() - started
+        if response.status_code >= 400:
+            self._fail(name, elapsed, f"HTTP {response.status_code}: {response.text[:200]}")
+            return None
+        self.latencies[name].append(elapsed)
+        return response
+
+    def _fail(self, name, elapsed, detail):
+        self.latencies[name].append(elapsed)
+        self.errors[name] += 1
+        if len(self.error_samples[name]) < 5:
+            self.error_samples[name].append(detail)
+
+    def summary(self, duration):
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            count = len(values)
+            endpoints[name] = {
+                "count": count,
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / count, 4) if count else 0.0,
+                "throughput_rps": round(count / duration, 3) if duration else None,
+                "mean_ms": round(sum(values) / count * 1000, 1) if count else None,
+                "p50_ms": round(percentile(values, 0.50) * 1000, 1) if count else None,
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1) if count else None,
+                "p99_ms": round(percentile(values, 0.99) * 1000, 1) if count else None,
+                "max_ms": round(values[-1] * 1000, 1) if count else None,
+                "error_samples": self.error_samples[name],
+            }
+        total = sum(e["count"] for e in endpoints.values())
+        errors = sum(e["errors"] for e in endpoints.values())
+        return endpoints, {
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "throughput_rps": round(total / duration, 3) if duration else None,
+        }
+
+
+def _rss_kb(pid):
+    """RSS of `pid` plus its direct children (resume-parse workers), from /proc; None elsewhere."""
+    def read(p):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except (OSError, ValueError):
+            return None
+        return 0
+
+    total = read(pid)
+    if total is None:
+        return None
+    try:
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            if ppid == pid:
+                total += read(entry) or 0
+    except OSError:
+        pass
+    return total
+
+
+async def sample_memory(pid, interval, samples, stop):
+    while not stop.is_set():
+        rss = _rss_kb(pid)
+        if rss is not None:
+            samples.append((round(time.monotonic(), 2), rss))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def make_frames(rng, count=3):
+    frames = []
+    for _ in range(count):
+        if Image is not None:
+            img = Image.new("RGB", (160, 120), tuple(rng.randrange(256) for _ in range(3)))
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=70)
+            data = buf.getvalue()
+        else:
+            data = rng.randbytes(4096)
+        frames.append("data:image/jpeg;base64," + base64.b64encode(data).decode("ascii"))
+    return frames
+
+
+async def video_loop(client, rec, args, rng, session_id, stop):
+    frames = make_frames(rng)
+    while not stop.is_set():
+        if rng.random() < args.scene_change:
+            frames = make_frames(rng)
+        body = {"images": frames, "language": "zh-CN", "session_id": session_id}
+        await rec.call("analyze-video", client.post("/api/analyze-video", json=body))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=args.video_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def candidate(idx, client, rec, args):
+    rng = random.Random(args.seed * 100003 + idx if args.seed is not None else None)
+    await asyncio.sleep(args.ramp * idx / max(1, args.candidates))
+    scenario = rng.choice(args.scenarios)
+
+    r = await rec.call("analyze-resume", client.post("/api/analyze-resume", data={
+        "manual_text": rng.choice(RESUMES), "scenario": scenario, "language": "zh-CN"}))
+    if r is None:
+        return
+    data = r.json()
+    session_id = data["session_id"]
+    turn = data.get("turn")
+
+    stop = asyncio.Event()
+    video = asyncio.create_task(video_loop(client, rec, args, rng, session_id, stop)) if args.video_interval > 0 else None
+    try:
+        r = await rec.call("upload-resume", client.post("/api/upload-resume", data={
+            "session_id": session_id, "scenario": scenario, "language": "zh-CN"}))
+        if r is None:
+            return
+        reply = r.json().get("reply") or data.get("opening") or ""
+        version = None
+        for _ in range(args.turns):
+            if reply:
+                await rec.call("tts", client.post("/api/tts", json={"text": reply[:200], "voice": "anna"}))
+            await asyncio.sleep(max(0.0, rng.gauss(args.think, args.think / 4)))
+
+            form = {"transcript": rng.choice(ANSWERS), "session_id": session_id, "scenario": scenario,
+                    "language": "zh-CN", "difficulty": "5"}
+            if turn is not None:
+                form["turn"] = str(turn)
+            r = await rec.call("chat", client.post("/api/chat", data=form))
+            if r is None:
+                break
+            result = r.json()
+            reply, turn = result.get("reply") or "", result.get("turn")
+            if result.get("interview_complete"):
+                break
+
+            params = {"wait": args.poll_wait, "since": version if version is not None else 0}
+            r = await rec.call("plan-status", client.get(f"/api/plan-status/{result['session_key']}", params=params))
+            if r is not None:
+                version = r.json().get("version", version)
+    finally:
+        stop.set()
+        if video is not None:
+            await video
+
+
+def _spawn(cmd, env, url, name):
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{name} exited with code {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.3)
+    proc.terminate()
+    raise RuntimeError(f"{name} did not start within 30s")
+
+
+def compare(report, baseline):
+    lines = [f"{'endpoint':<16}{'p50':>18}{'p95':>18}{'p99':>18}{'err%':>14}"]
+    for name, cur in report["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(name)
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if old and old.get(key) and cur.get(key) is not None:
+                cells.append(f"{cur[key]:.0f} ({(cur[key] / old[key] - 1) * 100:+.0f}%)")
+            else:
+                cells.append(f"{cur[key]:.0f}" if cur.get(key) is not None else "-")
+        err = f"{cur['error_rate'] * 100:.1f}" + (f" ({old['error_rate'] * 100:.1f})" if old else "")
+        lines.append(f"{name:<16}" + "".join(f"{c:>18}" for c in cells) + f"{err:>14}")
+    return "\n".join(lines)
+
+
+async def run(args):
+    procs = []
+    env = dict(os.environ)
+    pid = args.server_pid
+    try:
+        if args.spawn_mock:
+            mock_cmd = [sys.executable, "-m", "perf.mock_upstream", "--port", str(args.mock_port), *args.mock_arg]
+            procs.append(_spawn(mock_cmd, env, f"http://127.0.0.1:{args.mock_port}/mock/stats", "mock upstream"))
+            args.upstream = f"http://127.0.0.1:{args.mock_port}/v1"
+        if args.spawn_server:
+            env["SILICONFLOW_BASE_URL"] = args.upstream or env.get("SILICONFLOW_BASE_URL", "")
+            env.setdefault("SILICONFLOW_API_KEY", "loadtest")
+            server_cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"]
+            server = _spawn(server_cmd, env, f"http://127.0.0.1:{args.port}/api/languages", "app server")
+            procs.append(server)
+            args.target = f"http://127.0.0.1:{args.port}"
+            pid = server.pid
+
+        rec = Recorder()
+        samples = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_memory(pid, 1.0, samples, stop)) if pid else None
+        limits = httpx.Limits(max_connections=args.candidates * 3 + 10, max_keepalive_connections=args.candidates * 3)
+        started = time.monotonic()
+        async with httpx.AsyncClient(base_url=args.target, timeout=args.timeout, limits=limits) as client:
+            await asyncio.gather(*(candidate(i, client, rec, args) for i in range(args.candidates)))
+        duration = time.monotonic() - started
+        stop.set()
+        if sampler is not None:
+            await sampler
+
+        endpoints, totals = rec.summary(duration)
+        memory = None
+        if samples:
+            rss = [kb for _, kb in samples]
+            memory = {
+                "start_rss_mb": round(rss[0] / 1024, 1),
+                "end_rss_mb": round(rss[-1] / 1024, 1),
+                "peak_rss_mb": round(max(rss) / 1024, 1),
+                "growth_mb": round((rss[-1] - rss[0]) / 1024, 1),
+                "samples": len(rss),
+            }
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {
+                "target": args.target, "upstream": args.upstream, "candidates": args.candidates, "turns": args.turns,
+                "think": args.think, "ramp": args.ramp, "video_interval": args.video_interval,
+                "scene_change": args.scene_change, "poll_wait": args.poll_wait, "seed": args.seed,
+            },
+            "duration_s": round(duration, 2),
+            "totals": totals,
+            "endpoints": endpoints,
+            "server_memory": memory,
+        }
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EasyInterview load test")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="App base URL (ignored with --spawn-server)")
+    parser.add_argument("--server-pid", type=int, default=None, help="Pid of an already running server, for memory sampling")
+    parser.add_argument("--spawn-server", action="store_true", help="Start uvicorn app.main:app for the run")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--upstream", default=None, help="SILICONFLOW_BASE_URL for a spawned server")
+    parser.add_argument("--spawn-mock", action="store_true", help="Start perf.mock_upstream and use it as upstream")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--mock-arg", action="append", default=[], help="Extra argument for the mock (repeatable)")
+    parser.add_argument("--candidates", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--think", type=float, default=3.0, help="Mean seconds between a reply and the next answer")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Seconds over which candidates start")
+    parser.add_argument("--video-interval", type=float, default=5.0, help="0 disables analyze-video")
+    parser.add_argument("--scene-change", type=float, default=0.2, help="Chance the frames change between video posts")
+    parser.add_argument("--poll-wait", type=float, default=2.0, help="plan-status long-poll wait per turn")
+    parser.add_argument("--scenarios", default="tech_backend", help="Comma-separated scenario ids")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="Exit 1 if the overall error rate exceeds this (CI)")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"report written to {args.out}")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print(compare(report, json.load(f)))
+    if args.max_error_rate is not None and report["totals"]["error_rate"] > args.max_error_rate:
+        print(f"error rate {report['totals']['error_rate']} exceeds {args.max_error_rate}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""Local stand-in for the SiliconFlow API, for offline load tests and benchmarks.
+
+Serves `/v1/chat/completions` (plain, tool calls, SSE streaming, audio and image inputs) and
+`/v1/audio/speech` with synthetic answers, configurable latency and injected errors.
+Point the app at it with ``SILICONFLOW_BASE_URL=http://127.0.0.1:9100/v1``.
+
+Modes:
+
+- ``synthetic`` (default): canned answers shaped like the real ones
+- ``record``: proxy to ``--upstream`` and append every exchange to the cassette (JSONL)
+- ``replay``: answer from the cassette, matching on (path, request body); misses fall back
+  to synthetic answers unless ``--strict`` is given
+
+Latency specs (``--latency kind=spec``, kinds: chat, stream, tool, vision, stt, tts):
+``fixed:S``, ``uniform:A:B``, ``normal:MEAN:SD``, ``lognormal:MEDIAN:SIGMA`` (seconds). For
+``stream`` the delay is applied before the first chunk, and ``--token-delay`` between chunks.
+
+    cd src && python -m perf.mock_upstream --port 9100 --latency chat=lognormal:1.2:0.4 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+DEFAULT_LATENCY = {
+    "chat": "lognormal:1.0:0.4",
+    "stream": "lognormal:0.5:0.4",
+    "tool": "lognormal:1.5:0.4",
+    "vision": "lognormal:1.2:0.3",
+    "stt": "lognormal:0.8:0.3",
+    "tts": "lognormal:0.6:0.3",
+}
+
+_ASKED_ID = re.compile(r"\[PENDING 🟣\[ASKED\]\] \(ID: ([^)]+)\)")
+_PENDING_ID = re.compile(r"\[PENDING(?: 🟣\[ASKED\])?\] \(ID: ([^)]+)\)")
+
+
+def parse_latency(spec):
+    """`kind:args` -> a callable returning one delay in seconds."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(":") if v]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+@dataclass
+class MockConfig:
+    mode: str = "synthetic"
+    cassette: str = None
+    upstream: str = "https://api.siliconflow.cn/v1"
+    strict: bool = False
+    latency: dict = field(default_factory=dict)  # kind -> spec, merged over DEFAULT_LATENCY
+    token_delay: float = 0.03
+    error_rate: float = 0.0
+    error_statuses: tuple = (500, 429, 503)
+    seed: int = None
+    speed: float = 1.0  # Divides every delay; 0 disables waiting altogether
+
+
+def _request_kind(path, body):
+    if path.endswith("/audio/speech"):
+        return "tts"
+    if body.get("tools"):
+        return "tool"
+    for message in body.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            types = {part.get("type") for part in content if isinstance(part, dict)}
+            if "image_url" in types:
+                return "vision"
+            if "audio_url" in types:
+                return "stt"
+    return "stream" if body.get("stream") else "chat"
+
+
+def cassette_key(path, body):
+    canonical = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{path}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+def _usage(body, completion_text):
+    prompt_chars = len(json.dumps(body.get("messages") or body.get("input") or "", ensure_ascii=False))
+    prompt, completion = max(1, prompt_chars // 3), max(1, len(completion_text) // 3)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def _completion(body, message):
+    return {
+        "id": f"mock-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", **message}, "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+        "usage": _usage(body, message.get("content") or json.dumps(message.get("tool_calls") or "")),
+    }
+
+
+def _system_prompt(body):
+    messages = body.get("messages") or []
+    if messages and isinstance(messages[0].get("content"), str):
+        return messages[0]["content"]
+    return ""
+
+
+def _synthetic_text(body, rng):
+    system = _system_prompt(body)
+    if '"greeting"' in system:
+        return json.dumps({"summary": "候选人具备后端开发经验，熟悉常见中间件。", "greeting": "你好，欢迎参加本次面试。"}, ensure_ascii=False)
+    return rng.choice([
+        "好的，谢谢你的介绍。能具体说说这个项目里你负责的模块，以及遇到的最大技术难点吗？",
+        "明白了。那在高并发场景下，你是如何保证数据一致性的？",
+        "这个思路不错。如果流量再翻十倍，你会优先改造哪一部分？",
+    ])
+
+
+def _synthetic_tool_calls(body, rng):
+    system = _system_prompt(body)
+    match = _ASKED_ID.search(system) or _PENDING_ID.search(system)
+    item_id = match.group(1) if match else "1"
+    args = {"item_id": item_id, "score": rng.randint(55, 92), "evaluation": "回答覆盖了关键点，细节略少。", "suggestion": "补充具体数据与取舍。"}
+    return [{"id": f"call_{rng.getrandbits(24):06x}", "type": "function", "function": {"name": "mark_item_complete", "arguments": json.dumps(args, ensure_ascii=False)}}]
+
+
+def _synthetic_vision(rng):
+    metrics = {k: rng.randint(55, 90) for k in ("confidence", "eye_contact", "attire", "clarity")}
+    return json.dumps({"metrics": metrics, "alert": {"level": "none", "message_cn": None, "message_en": None}})
+
+
+def _sse(body, text):
+    # Split into small pieces the way a tokenizer-driven stream would arrive
+    pieces = [text[i:i + 4] for i in range(0, len(text), 4)] or [""]
+    frames = [f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': p}}]}, ensure_ascii=False)}\n\n" for p in pieces]
+    if (body.get("stream_options") or {}).get("include_usage"):
+        frames.append(f"data: {json.dumps({'choices': [], 'usage': _usage(body, text)})}\n\n")
+    frames.append("data: [DONE]\n\n")
+    return frames
+
+
+class _Cassette:
+    """Append-only JSONL of exchanges; replay cycles through the recordings for a key."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._cursor = {}
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._entries.setdefault(entry["key"], []).append(entry)
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return sum(len(v) for v in self._entries.values())
+
+    def next(self, key):
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            return entries[i % len(entries)]
+
+    def append(self, entry):
+        with self._lock:
+            self._entries.setdefault(entry["key"], []).append(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def create_app(config=None):
+    config = config or MockConfig()
+    rng = random.Random(config.seed)
+    latency = {kind: parse_latency(spec) for kind, spec in {**DEFAULT_LATENCY, **config.latency}.items()}
+    cassette = _Cassette(config.cassette) if config.mode in ("record", "replay") else None
+    stats = {"requests": 0, "errors_injected": 0, "replayed": 0, "recorded": 0, "synthetic": 0}
+    upstream = {"client": None}
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        if upstream["client"] is not None:
+            await upstream["client"].aclose()
+
+    app = FastAPI(title="mock-siliconflow", lifespan=lifespan)
+    app.state.stats = stats
+
+    async def wait(seconds):
+        if config.speed > 0 and seconds > 0:
+            await asyncio.sleep(seconds / config.speed)
+
+    def injected_error():
+        if config.error_rate and rng.random() < config.error_rate:
+            stats["errors_injected"] += 1
+            status = rng.choice(config.error_statuses)
+            return JSONResponse({"code": status, "message": "mock injected error", "data": None}, status_code=status)
+        return None
+
+    def replay_response(entry, body):
+        raw = base64.b64decode(entry["body_b64"]) if "body_b64" in entry else entry["body"].encode("utf-8")
+        media_type = entry.get("content_type") or "application/json"
+        if body.get("stream") and entry["status"] == 200:
+            frames = [f + "\n\n" for f in raw.decode("utf-8").split("\n\n") if f.strip()]
+
+            async def gen():
+                for i, frame in enumerate(frames):
+                    if i:
+                        await wait(config.token_delay)
+                    yield frame
+            return StreamingResponse(gen(), status_code=200, media_type="text/event-stream")
+        return Response(content=raw, status_code=entry["status"], media_type=media_type)
+
+    async def record(path, request, raw_body, body, key):
+        if upstream["client"] is None:
+            upstream["client"] = httpx.AsyncClient(base_url=config.upstream, timeout=120.0)
+        headers = {"Authorization": request.headers.get("authorization", ""), "Content-Type": "application/json"}
+        # Streams are fetched whole and stored as their SSE text; replay re-chunks them
+        upstream_response = await upstream["client"].post(path, content=raw_body, headers=headers)
+        content_type = upstream_response.headers.get("content-type", "application/json").split(";")[0]
+        entry = {"key": key, "path": path, "request": body, "status": upstream_response.status_code, "content_type": content_type}
+        if content_type.startswith(("application/json", "text/")):
+            entry["body"] = upstream_response.text
+        else:
+            entry["body_b64"] = base64.b64encode(upstream_response.content).decode("ascii")
+        cassette.append(entry)
+        stats["recorded"] += 1
+        return replay_response(entry, body)
+
+    async def handle(path, request):
+        stats["requests"] += 1
+        raw_body = await request.body()
+        try:
+            body = json.loads(raw_body or b"{}")
+        except json.JSONDecodeError:
+            return JSONResponse({"message": "invalid JSON"}, status_code=400)
+        key = cassette_key(path, body)
+
+        if config.mode == "record":
+            return await record(path, request, raw_body, body, key)
+
+        kind = _request_kind(path, body)
+        await wait(latency[kind](rng))
+        error = injected_error()
+        if error is not None:
+            return error
+
+        if config.mode == "replay":
+            entry = cassette.next(key)
+            if entry is not None:
+                stats["replayed"] += 1
+                return replay_response(entry, body)
+            if config.strict:
+                return JSONResponse({"message": f"no cassette entry for {key[:12]}"}, status_code=404)
+
+        stats["synthetic"] += 1
+        if kind == "tts":
+            # A few KB of MP3-looking bytes, roughly proportional to the text length
+            size = 1024 + 64 * len(body.get("input") or "")
+            return Response(content=b"ID3" + bytes(size), media_type="audio/mpeg")
+        if kind == "tool":
+            return JSONResponse(_completion(body, {"content": None, "tool_calls": _synthetic_tool_calls(body, rng)}))
+        if kind == "vision":
+            return JSONResponse(_completion(body, {"content": _synthetic_vision(rng)}))
+        if kind == "stt":
+            return JSONResponse(_completion(body, {"content": rng.choice(["我主要负责订单服务的重构和缓存设计。", "这个问题我用消息队列做了削峰。"])}))
+
+        text = _synthetic_text(body, rng)
+        if kind == "stream":
+            frames = _sse(body, text)
+
+            async def gen():
+                for i, frame in enumerate(frames):
+                    if i:
+                        await wait(config.token_delay)
+                    yield frame
+            return StreamingResponse(gen(), media_type="text/event-stream")
+        return JSONResponse(_completion(body, {"content": text}))
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await handle("/chat/completions", request)
+
+    @app.post("/v1/audio/speech")
+    async def audio_speech(request: Request):
+        return await handle("/audio/speech", request)
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return {**stats, "mode": config.mode, "cassette_entries": len(cassette) if cassette else 0}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock SiliconFlow upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--mode", choices=("synthetic", "record", "replay"), default="synthetic")
+    parser.add_argument("--cassette", default="perf/cassettes/default.jsonl")
+    parser.add_argument("--upstream", default="https://api.siliconflow.cn/v1", help="Real API for record mode")
+    parser.add_argument("--strict", action="store_true", help="Replay misses return 404 instead of synthetic answers")
+    parser.add_argument("--latency", action="append", default=[], metavar="KIND=SPEC")
+    parser.add_argument("--token-delay", type=float, default=0.03)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", default="500,429,503")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--speed", type=float, default=1.0, help="Divide all delays by this (0 = no delays)")
+    args = parser.parse_args()
+
+    latency = {}
+    for item in args.latency:
+        kind, _, spec = item.partition("=")
+        parse_latency(spec)  # Fail fast on a bad spec
+        latency[kind] = spec
+    if args.mode in ("record", "replay"):
+        os.makedirs(os.path.dirname(os.path.abspath(args.cassette)), exist_ok=True)
+
+    config = MockConfig(
+        mode=args.mode,
+        cassette=args.cassette,
+        upstream=args.upstream,
+        strict=args.strict,
+        latency=latency,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        error_statuses=tuple(int(s) for s in args.error_status.split(",") if s),
+        seed=args.seed,
+        speed=args.speed,
+    )
+    import uvicorn
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""In-process Redis stand-in, for exercising RedisSessionStore without a real server.
+
+Speaks RESP2 and implements only the commands the session store sends: GET/SET PX/DEL,
+PEXPIRE/PTTL, the sorted-set calls behind the LRU index, and WATCH/MULTI/EXEC (a WATCHed
+key is invalidated by any SET, DEL or PEXPIRE from another connection).
+
+    server = RespStandIn().start()
+    store = RedisSessionStore("plans", 60, 100, 0, server.url)
+    ...
+    server.stop()
+
+or, for a manual run: ``cd src && python -m perf.resp_standin --port 6399``
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class _State:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}    # key -> bytes
+        self.expires = {}   # key -> unix time
+        self.zsets = {}     # key -> {member: score}
+        self.versions = {}  # key -> write counter, for WATCH
+
+    def _alive(self, key):
+        at = self.expires.get(key)
+        if at is not None and at <= time.time():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.values
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def run(self, args):
+        name, args = args[0].upper().decode(), args[1:]
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            raise ValueError(f"ERR unknown command '{name}'")
+        return handler(*args)
+
+    def cmd_ping(self, *args):
+        return "PONG"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_get(self, key):
+        return self.values[key] if self._alive(key) else None
+
+    def cmd_set(self, key, value, *options):
+        self.values[key] = value
+        self.expires.pop(key, None)
+        if len(options) >= 2 and options[0].upper() == b"PX":
+            self.expires[key] = time.time() + int(options[1]) / 1000
+        self._touch(key)
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                removed += 1
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+            self.zsets.pop(key, None)
+            self._touch(key)
+        return removed
+
+    def cmd_pexpire(self, key, ms):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.time() + int(ms) / 1000
+        self._touch(key)
+        return 1
+
+    def cmd_pttl(self, key):
+        if not self._alive(key):
+            return -2
+        at = self.expires.get(key)
+        return -1 if at is None else max(0, int((at - time.time()) * 1000))
+
+    def cmd_zadd(self, key, *args):
+        xx = args[0].upper() == b"XX"
+        pairs = args[1:] if xx else args
+        zset = self.zsets.setdefault(key, {})
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            if xx and member not in zset:
+                continue
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        zset = self.zsets.get(key, {})
+        return sum(zset.pop(m, None) is not None for m in members)
+
+    def cmd_zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def cmd_zcount(self, key, low, high):
+        low, high = float(low), float(high)
+        return sum(low <= score <= high for score in self.zsets.get(key, {}).values())
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        low, high = float(low), float(high)
+        zset = self.zsets.get(key, {})
+        doomed = [m for m, score in zset.items() if low <= score <= high]
+        for member in doomed:
+            del zset[member]
+        return len(doomed)
+
+    def cmd_zrange(self, key, start, stop):
+        ordered = sorted(self.zsets.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+        start, stop = int(start), int(stop)
+        stop = len(ordered) + stop if stop < 0 else stop
+        return [member for member, _ in ordered[start:stop + 1]]
+
+
+def _encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(v) for v in value)
+    return b"$%d\r\n" % len(value) + value + b"\r\n"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            size = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self):
+        state = self.server.state
+        watched = None  # key -> version seen at WATCH
+        queued = None   # commands between MULTI and EXEC
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            name = args[0].upper()
+            try:
+                with state.lock:
+                    if name == b"WATCH":
+                        watched = dict(watched or {})
+                        watched.update({k: state.versions.get(k, 0) for k in args[1:]})
+                        reply = "OK"
+                    elif name == b"UNWATCH":
+                        watched, reply = None, "OK"
+                    elif name == b"MULTI":
+                        queued, reply = [], "OK"
+                    elif name == b"EXEC":
+                        if queued is None:
+                            raise ValueError("ERR EXEC without MULTI")
+                        if watched and any(state.versions.get(k, 0) != v for k, v in watched.items()):
+                            reply = None
+                        else:
+                            reply = [state.run(cmd) for cmd in queued]
+                        watched, queued = None, None
+                    elif queued is not None:
+                        queued.append(args)
+                        reply = "QUEUED"
+                    else:
+                        reply = state.run(args)
+                data = _encode(reply)
+            except (ValueError, TypeError, IndexError) as e:
+                message = str(e) if str(e).startswith("ERR") else f"ERR {e}"
+                data = b"-" + message.encode() + b"\r\n"
+            self.wfile.write(data)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RespStandIn:
+    """A RESP server on a background thread; port 0 picks a free port."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._server = _Server((host, port), _Handler)
+        self._server.state = _State()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+    server = RespStandIn(args.host, args.port)
+    print(f"RESP stand-in on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
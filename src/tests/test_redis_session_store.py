@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from app.services.session_store import (
+    RedisConflictError, RedisError, RedisSessionStore, _RespConnection,
+)
+from perf.resp_standin import RespStandIn
+
+
+@pytest.fixture
+def server():
+    server = RespStandIn().start()
+    yield server
+    server.stop()
+
+
+def make_store(server, max_entries=100):
+    return RedisSessionStore("test", 60, max_entries, 0, server.url)
+
+
+def raw_connection(server):
+    host, port = server.url[len("redis://"):].split("/")[0].split(":")
+    return _RespConnection(host, int(port), 0, None, timeout=2.0)
+
+
+def test_get_set_delete(server):
+    store = make_store(server)
+    assert store.get("a", "missing") == "missing"
+    store.set("a", {"n": 1, "text": "你好"})
+    assert store.get("a") == {"n": 1, "text": "你好"}
+    assert "a" in store
+    store.delete("a")
+    assert store.get("a") is None
+    assert store.hits == 2 and store.misses == 2
+
+
+def test_update_none_writes_nothing(server):
+    store = make_store(server)
+    store.set("a", {"n": 1})
+    assert store.update("a", lambda value: None) is None
+    assert store.get("a") == {"n": 1}
+
+
+def test_concurrent_updates_all_land(server):
+    store = make_store(server)
+    store.set("counter", {"n": 0})
+
+    def bump():
+        for _ in range(20):
+            store.update("counter", lambda value: {"n": value["n"] + 1})
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get("counter") == {"n": 80}
+
+
+def test_update_conflict_raises_without_reconnect(server):
+    store = make_store(server)
+    other = make_store(server)
+    store.set("a", {"n": 0})
+    calls = []
+
+    def change(value):
+        # Someone else writes the key between our WATCH and EXEC, every time
+        calls.append(value)
+        other.set("a", {"n": len(calls)})
+        return {"n": -1}
+
+    conn = store._conn()
+    with pytest.raises(RedisConflictError):
+        store.update("a", change)
+    assert len(calls) == store._UPDATE_ATTEMPTS
+    assert store._conn() is conn
+    assert store.get("a") == {"n": store._UPDATE_ATTEMPTS}
+
+
+def test_update_unwatches_when_change_raises(server):
+    store = make_store(server)
+    other = make_store(server)
+    store.set("a", {"n": 0})
+
+    def change(value):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        store.update("a", change)
+    # A leftover WATCH would make this transaction abort after the other writer's SET
+    other.set("a", {"n": 1})
+    conn = store._conn()
+    replies = conn.pipeline(("MULTI",), ("SET", "probe", "1"), ("EXEC",))
+    assert replies[-1] == ["OK"]
+
+
+def test_sweep_drops_least_recently_used(server):
+    store = make_store(server, max_entries=3)
+    for i in range(5):
+        store.set(f"k{i}", i)
+    store._sweep(time.time())
+    assert len(store) == 3
+    assert store.get("k0") is None and store.get("k1") is None
+    assert store.get("k4") == 4
+
+
+def test_stats(server):
+    store = make_store(server)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.get("a")
+    store.get("zzz")
+    stats = store.stats()
+    assert stats["backend"] == "redis"
+    assert stats["entries"] == 2
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["server"].endswith("/0")
+
+
+def test_server_errors_surface(server):
+    conn = raw_connection(server)
+    with pytest.raises(RedisError, match="unknown command"):
+        conn.command("FLUSHALL")
+    assert conn.command("PING") == "PONG"
+    conn.close()